@@ -1,22 +1,91 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.orm import DeclarativeBase
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, JSON
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.orm import DeclarativeBase, Session as SyncSession
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, JSON, Index, event, func, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import Delete, Insert, Update
+from contextlib import asynccontextmanager
 from datetime import datetime
+from functools import lru_cache
+from itertools import cycle
+from typing import Any, Awaitable, Callable, Dict
+import inspect
+import logging
 from config import settings
 
-# Create async engine
-engine = create_async_engine(
-    settings.DATABASE_URL,
-    echo=settings.DEBUG,
-    future=True
-)
+logger = logging.getLogger(__name__)
+
+def make_engine(url: str, name: str) -> AsyncEngine:
+    """Create an engine with the pool and driver settings from config"""
+    return create_async_engine(
+        url,
+        echo=settings.DB_ECHO,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args={
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            "command_timeout": settings.DB_COMMAND_TIMEOUT,
+            "server_settings": {"application_name": f"wine-emulator-api:{name}"},
+        },
+    )
+
+# Create async engines: the primary takes all writes, replicas serve reads
+engine = make_engine(settings.DATABASE_URL, "primary")
+replica_engines = [
+    make_engine(url, f"replica{index}") for index, url in enumerate(settings.get_replica_urls())
+]
+_replica_cycle = cycle(replica_engines) if replica_engines else None
+
+@lru_cache(maxsize=None)
+def _autocommit(sync_engine):
+    return sync_engine.execution_options(isolation_level="AUTOCOMMIT")
+
+class RoutingSession(SyncSession):
+    """Reads go to one replica (picked per session), writes and flushes to the primary
+    
+    Reads run in autocommit mode unless the session's ``info["autocommit"]``
+    is False (server-side cursors need a transaction), so a read-only
+    request sends no BEGIN/COMMIT at all.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replica = next(_replica_cycle).sync_engine if _replica_cycle else None
+    
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or isinstance(clause, (Insert, Update, Delete)):
+            return engine.sync_engine
+        target = self.replica or engine.sync_engine
+        if self.info.get("autocommit", True):
+            return _autocommit(target)
+        return target
 
-# Create async session factory
+# Create async session factories
 async_session = async_sessionmaker(
     engine,
     class_=AsyncSession,
     expire_on_commit=False
 )
+read_session = async_sessionmaker(
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
+    expire_on_commit=False
+)
+
+def pool_stats() -> Dict[str, Any]:
+    """Connection pool occupancy per engine"""
+    stats = {}
+    for name, async_engine in [("primary", engine)] + [(f"replica{i}", e) for i, e in enumerate(replica_engines)]:
+        pool = async_engine.pool
+        stats[name] = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+        }
+    return stats
 
 # Base class for models
 class Base(DeclarativeBase):
@@ -31,10 +100,34 @@ class Application(Base):
     executable_path = Column(String(500), nullable=False)
     description = Column(Text, nullable=True)
     icon_url = Column(String(500), nullable=True)
-    wine_config = Column(JSON, nullable=True)
+    wine_config = Column(JSONB, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = Column(Boolean, default=True)
+    
+    __table_args__ = (
+        # Keyset pagination over the active catalog
+        Index("ix_applications_is_active_id", "is_active", "id"),
+        # Catalog upserts are keyed on the name
+        Index("ux_applications_name", "name", unique=True),
+        # Facet filters use containment (wine_config @> '{...}')
+        Index("ix_applications_wine_config", "wine_config", postgresql_using="gin", postgresql_ops={"wine_config": "jsonb_path_ops"}),
+    )
+
+def application_search_vector():
+    """Weighted full-text vector over name and description
+    
+    Queries must use this exact expression to hit the GIN index, so its
+    constants are literals rather than bind parameters.
+    """
+    config = text("'english'::regconfig")
+    return func.setweight(
+        func.to_tsvector(config, func.coalesce(Application.name, text("''"))), text("'A'")
+    ).op("||")(func.setweight(
+        func.to_tsvector(config, func.coalesce(Application.description, text("''"))), text("'B'")
+    ))
+
+Index("ix_applications_search", application_search_vector(), postgresql_using="gin")
 
 class Session(Base):
     __tablename__ = "sessions"
@@ -42,12 +135,20 @@ class Session(Base):
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String(100), unique=True, index=True)
     application_id = Column(Integer, nullable=True)
-    user_id = Column(String(100), nullable=True)
+    user_id = Column(String(100), nullable=True, index=True)
     vnc_port = Column(Integer, nullable=True)
     status = Column(String(50), default="pending")
     session_metadata = Column(JSON, nullable=True)  # Renamed from 'metadata' to avoid SQLAlchemy reserved word
     created_at = Column(DateTime, default=datetime.utcnow)
     expires_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        # Keyset pagination on (created_at, id), optionally filtered by status
+        Index("ix_sessions_status_created_at", "status", "created_at", "id"),
+        Index("ix_sessions_created_at_id", "created_at", "id"),
+        # Expiry sweeps over active sessions
+        Index("ix_sessions_status_expires_at", "status", "expires_at"),
+    )
 
 class LowCodeComponent(Base):
     __tablename__ = "lowcode_components"
@@ -57,18 +158,69 @@ class LowCodeComponent(Base):
     component_type = Column(String(100), nullable=False)
     config = Column(JSON, nullable=False)
     position = Column(JSON, nullable=True)
-    parent_id = Column(Integer, nullable=True)
+    parent_id = Column(Integer, nullable=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+# Unit of work: handlers flush (INSERT/UPDATE ... RETURNING) but don't commit;
+# get_db commits once at the end, and only if the request wrote anything.
+
+@event.listens_for(SyncSession, "do_orm_execute")
+def _track_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["writes"] = True
+
+@event.listens_for(SyncSession, "after_flush")
+def _track_flush(session, flush_context):
+    session.info["writes"] = True
+
+def has_writes(session: AsyncSession) -> bool:
+    return bool(session.info.get("writes") or session.new or session.dirty or session.deleted)
+
+def on_commit(session: AsyncSession, callback: Callable[[], Awaitable[Any] | Any]):
+    """Run ``callback`` once the session's current unit of work has committed"""
+    session.info.setdefault("on_commit", []).append(callback)
+
+async def commit(session: AsyncSession):
+    """Commit, then run the registered on_commit callbacks"""
+    await session.commit()
+    session.info.pop("writes", None)
+    for callback in session.info.pop("on_commit", []):
+        try:
+            result = callback()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.error(f"on_commit callback failed: {e}")
+
+async def rollback(session: AsyncSession):
+    """Roll back and drop the callbacks of the discarded unit of work"""
+    session.info.pop("writes", None)
+    session.info.pop("on_commit", None)
+    await session.rollback()
+
+@asynccontextmanager
+async def transaction(session: AsyncSession):
+    """Explicit transaction scope: commits on exit, rolls back on error"""
+    try:
+        yield session
+        await commit(session)
+    except BaseException:
+        await rollback(session)
+        raise
+
+async def get_read_db():
+    """Session for read-only routes; served by a replica when any are configured"""
+    async with read_session() as session:
+        yield session
+
 # Dependency to get database session
 async def get_db():
     async with async_session() as session:
         try:
             yield session
-            await session.commit()
+            if has_writes(session):
+                await commit(session)
         except Exception:
-            await session.rollback()
+            await rollback(session)
             raise
-        finally:
-            await session.close()
@@ -1,32 +1,68 @@
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
 from contextlib import asynccontextmanager
 import httpx
 import os
 from typing import List, Dict, Any
 import asyncio
+import json
 import logging
+import time
 
-from routes import emulator, applications, sessions, lowcode
-from database import engine, Base, async_session
+from routes import emulator, applications, sessions, lowcode, nodes
+from database import engine, replica_engines, pool_stats
 from config import settings
+from services.wine_client import wine_client
+from services.redis_pool import close_redis
+from services.session_reaper import session_reaper
+from services.warm_pool import warm_pool
+from services.jobs import job_manager
+from services.launch_specs import launch_specs
+from services.events import event_bus
+from services.executors import get_executor
+from services.health import health_checker
+from services.schema import prepare_schema
+from services.screenshots import screenshot_service
+from services.cache import catalog_cache
+from services.scheduler import node_scheduler
+from services.slot_sweeper import slot_sweeper
+from services.slots import slot_allocator
+from services.workflows import workflow_plans
+from services.metrics import SLOTS, PrometheusMiddleware, StatsCollector, instrument_engine
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Create database tables
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting Wine Emulator API...")
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    logger.info("Database initialized")
+    await prepare_schema()
+    await wine_client.start()
+    event_bus.start()
+    if settings.SESSION_REAPER_ENABLED:
+        session_reaper.start()
+    warm_pool.start()
+    slot_sweeper.start()
+    launch_specs.start()
     yield
     # Shutdown
     logger.info("Shutting down Wine Emulator API...")
+    await session_reaper.stop()
+    await slot_sweeper.stop()
+    await warm_pool.stop()
+    await launch_specs.stop()
+    await job_manager.shutdown()
+    await get_executor().close()
+    await event_bus.stop()
+    await wine_client.close()
+    await close_redis()
+    for replica in replica_engines:
+        await replica.dispose()
+    await engine.dispose()
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -43,13 +79,36 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "X-Workflow-Run-Id", "X-Frame-Hash"],
 )
+app.add_middleware(PrometheusMiddleware)
+
+# Metrics
+instrument_engine(engine, "primary")
+for index, replica in enumerate(replica_engines):
+    instrument_engine(replica, f"replica{index}")
+REGISTRY.register(StatsCollector({
+    "wine_client": wine_client.pool_stats,
+    "catalog_cache": lambda: catalog_cache.stats,
+    "event_bus": lambda: event_bus.stats,
+    "warm_pool": warm_pool.snapshot,
+    "jobs": job_manager.stats,
+    "session_reaper": lambda: session_reaper.stats,
+    "workflow_plans": workflow_plans.snapshot,
+    "db_pool": pool_stats,
+    "screenshots": screenshot_service.snapshot,
+    "executor": lambda: get_executor().snapshot(),
+    "launch_specs": launch_specs.snapshot,
+    "scheduler": node_scheduler.snapshot,
+    "slot_sweeper": slot_sweeper.snapshot,
+}))
 
 # Include routers
 app.include_router(emulator.router, prefix="/api/emulator", tags=["Emulator"])
 app.include_router(applications.router, prefix="/api/applications", tags=["Applications"])
 app.include_router(sessions.router, prefix="/api/sessions", tags=["Sessions"])
 app.include_router(lowcode.router, prefix="/api/lowcode", tags=["Low-Code Builder"])
+app.include_router(nodes.router, prefix="/api/nodes", tags=["Nodes"])
 
 # Health check endpoint
 @app.get("/health")
@@ -59,12 +118,40 @@ async def health_check():
 @app.get("/ready")
 async def ready_check():
     try:
-        # For now, just return ready status
-        # Database connection is checked during startup
-        return {"status": "ready", "service": "wine-emulator-api", "features": ["wine-gaming", "vnc-accessible"]}
+        report = await health_checker.check()
     except Exception as e:
         logger.error(f"Ready check failed: {e}")
         raise HTTPException(status_code=503, detail=f"Service not ready: {str(e)}")
+    
+    features = ["wine-gaming"]
+    if any(name.startswith("vnc:") and check["status"] == "up" for name, check in report["checks"].items()):
+        features.append("vnc-accessible")
+    body = {
+        "status": "ready" if report["ready"] else "not_ready",
+        "health": report["status"],
+        "service": "wine-emulator-api",
+        "features": features,
+        "checks": report["checks"]
+    }
+    return JSONResponse(status_code=200 if report["ready"] else 503, content=body)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    # The reaper keeps sessions_active current; only recount when it has not run lately
+    counted_at = session_reaper.counted_at
+    try:
+        if counted_at is None or time.monotonic() - counted_at > 2 * session_reaper.interval:
+            await session_reaper.count_active()
+    except Exception as e:
+        logger.warning(f"Could not count active sessions for metrics: {e}")
+    try:
+        slots = await slot_allocator.stats()
+        SLOTS.labels("leased").set(slots["leased"])
+        SLOTS.labels("free").set(sum(slots["free"].values()))
+    except Exception as e:
+        logger.warning(f"Could not read slot stats for metrics: {e}")
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 # Root endpoint
 @app.get("/")
@@ -79,13 +166,47 @@ async def root():
 # WebSocket for real-time updates
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
+    """Stream bus events for the topics the client subscribes to
+    
+    Clients send {"action": "subscribe" | "unsubscribe", "topics": [...]},
+    e.g. ["session", "launch", "health"] or "session.<session_id>".
+    """
     await websocket.accept()
+    subscription = event_bus.subscribe(websocket.query_params.getlist("topic"))
+    
+    async def send_events():
+        while True:
+            event = await subscription.queue.get()
+            await websocket.send_json(event)
+            if event["type"] == "dropped":
+                await websocket.close(code=1013)
+                return
+    
+    sender = asyncio.create_task(send_events())
     try:
         while True:
-            data = await websocket.receive_text()
-            await websocket.send_text(f"Message received: {data}")
-    except WebSocketDisconnect:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError:
+                await websocket.send_json({"topic": "system", "type": "error", "data": {"detail": "Invalid JSON"}})
+                continue
+            topics = (message.get("topics") or []) if isinstance(message, dict) else None
+            if not isinstance(topics, list) or not all(isinstance(topic, str) for topic in topics):
+                await websocket.send_json({"topic": "system", "type": "error", "data": {
+                    "detail": 'Expected {"action": "subscribe" | "unsubscribe", "topics": [str, ...]}'
+                }})
+                continue
+            topics = set(topics)
+            if message.get("action") == "subscribe":
+                subscription.topics |= topics
+            elif message.get("action") == "unsubscribe":
+                subscription.topics -= topics
+            await websocket.send_json({"topic": "system", "type": "subscriptions", "data": {"topics": sorted(subscription.topics)}})
+    except (WebSocketDisconnect, RuntimeError):
         logger.info("WebSocket disconnected")
+    finally:
+        sender.cancel()
+        event_bus.unsubscribe(subscription)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,84 @@
+"""Initial schema
+
+Creates the applications, sessions and lowcode_components tables with the
+columns and column indexes the models had before migrations were
+introduced. Databases that were set up by ``create_all`` already have these
+tables; they are adopted as-is, apart from applications.wine_config which is
+converted from json to jsonb.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Offline (--sql) scripts always target an empty database
+    existing = set() if op.get_context().as_sql else set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "applications" not in existing:
+        op.create_table(
+            "applications",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("name", sa.String(255), nullable=False),
+            sa.Column("executable_path", sa.String(500), nullable=False),
+            sa.Column("description", sa.Text(), nullable=True),
+            sa.Column("icon_url", sa.String(500), nullable=True),
+            sa.Column("wine_config", postgresql.JSONB(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.Column("updated_at", sa.DateTime(), nullable=True),
+            sa.Column("is_active", sa.Boolean(), nullable=True),
+        )
+        op.create_index("ix_applications_id", "applications", ["id"])
+    else:
+        op.execute(
+            "DO $$ BEGIN "
+            "IF (SELECT data_type FROM information_schema.columns "
+            "WHERE table_name = 'applications' AND column_name = 'wine_config') = 'json' THEN "
+            "ALTER TABLE applications ALTER COLUMN wine_config TYPE jsonb USING wine_config::jsonb; "
+            "END IF; END $$"
+        )
+
+    if "sessions" not in existing:
+        op.create_table(
+            "sessions",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("session_id", sa.String(100), nullable=True),
+            sa.Column("application_id", sa.Integer(), nullable=True),
+            sa.Column("user_id", sa.String(100), nullable=True),
+            sa.Column("vnc_port", sa.Integer(), nullable=True),
+            sa.Column("status", sa.String(50), nullable=True),
+            sa.Column("session_metadata", sa.JSON(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.Column("expires_at", sa.DateTime(), nullable=True),
+        )
+        op.create_index("ix_sessions_id", "sessions", ["id"])
+        op.create_index("ix_sessions_session_id", "sessions", ["session_id"], unique=True)
+
+    if "lowcode_components" not in existing:
+        op.create_table(
+            "lowcode_components",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("name", sa.String(255), nullable=False),
+            sa.Column("component_type", sa.String(100), nullable=False),
+            sa.Column("config", sa.JSON(), nullable=False),
+            sa.Column("position", sa.JSON(), nullable=True),
+            sa.Column("parent_id", sa.Integer(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.Column("updated_at", sa.DateTime(), nullable=True),
+        )
+        op.create_index("ix_lowcode_components_id", "lowcode_components", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_table("lowcode_components")
+    op.drop_table("sessions")
+    op.drop_table("applications")
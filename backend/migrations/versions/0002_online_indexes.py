@@ -0,0 +1,62 @@
+"""Catalog, session and component indexes, built online
+
+Every index is created with ``CREATE INDEX CONCURRENTLY`` outside a
+transaction, so writes keep flowing while it builds. A build that failed
+part-way leaves an INVALID index behind; it is dropped and rebuilt here.
+
+``ux_applications_name`` fails if the catalog holds duplicate names;
+deduplicate them (e.g. by re-loading with ``python -m services.catalog``)
+and run the migration again.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('english'::regconfig, coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'B')"
+)
+
+# name -> (table, index definition)
+INDEXES = {
+    "ix_applications_is_active_id": ("applications", "(is_active, id)"),
+    "ux_applications_name": ("applications", "(name)"),
+    "ix_applications_wine_config": ("applications", "USING gin (wine_config jsonb_path_ops)"),
+    "ix_applications_search": ("applications", f"USING gin (({SEARCH_VECTOR}))"),
+    "ix_sessions_user_id": ("sessions", "(user_id)"),
+    "ix_sessions_status_created_at": ("sessions", "(status, created_at, id)"),
+    "ix_sessions_created_at_id": ("sessions", "(created_at, id)"),
+    "ix_sessions_status_expires_at": ("sessions", "(status, expires_at)"),
+    "ix_lowcode_components_parent_id": ("lowcode_components", "(parent_id)"),
+}
+UNIQUE = {"ux_applications_name"}
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, (table, definition) in INDEXES.items():
+            invalid = not op.get_context().as_sql and op.get_bind().execute(
+                sa.text(
+                    "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                    "WHERE c.relname = :name AND NOT i.indisvalid"
+                ),
+                {"name": name},
+            ).scalar()
+            if invalid:
+                op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            unique = "UNIQUE " if name in UNIQUE else ""
+            op.execute(f"CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} {definition}")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name in reversed(list(INDEXES)):
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
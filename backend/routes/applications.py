@@ -1,14 +1,25 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from typing import List
-from pydantic import BaseModel
+from sqlalchemy import func, null, select, text, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from typing import Any, Dict, List
+from pydantic import BaseModel, TypeAdapter
+import re
 from datetime import datetime
 
-from database import get_db, Application
+from database import get_db, get_read_db, on_commit, Application, application_search_vector
+from services.cache import catalog_cache, etag_response
+from services.catalog import CatalogError, parse_manifest, upsert_applications
+from services.launch_specs import application_changed
+from services.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
 
 router = APIRouter()
 
+async def invalidate_applications(*app_ids: int):
+    """Forget cached responses and compiled launch specs after a catalog write"""
+    application_changed(*app_ids)
+    await catalog_cache.invalidate(*app_ids)
+
 # Pydantic models
 class ApplicationBase(BaseModel):
     name: str
@@ -29,21 +40,150 @@ class ApplicationResponse(ApplicationBase):
     class Config:
         from_attributes = True
 
+class ApplicationSearchHit(ApplicationResponse):
+    rank: float | None = None
+
+class ApplicationSearchResponse(BaseModel):
+    total: int
+    results: List[ApplicationSearchHit]
+    facets: Dict[str, Dict[str, int]]
+
+application_list_adapter = TypeAdapter(List[ApplicationResponse])
+
+# Search facets and their path inside wine_config
+SEARCH_FACETS = {
+    "arch": ("WINEARCH",),
+    "renderer": ("graphics", "renderer"),
+    "audio": ("audio", "driver"),
+}
+
+def build_tsquery(q: str) -> str | None:
+    """Turn free text into a prefix-matching tsquery: 'counter str' -> 'counter:* & str:*'"""
+    terms = re.findall(r"\w+", q.lower())
+    return " & ".join(f"{term}:*" for term in terms) or None
+
+def facet_filter(path: tuple, value: str) -> Dict[str, Any]:
+    """Nested containment document, e.g. ('audio', 'driver') -> {"audio": {"driver": value}}"""
+    document: Any = value
+    for key in reversed(path):
+        document = {key: document}
+    return document
+
 @router.get("/", response_model=List[ApplicationResponse])
 async def list_applications(
-    skip: int = 0,
-    limit: int = 100,
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    cursor: str | None = None,
+    limit: int = Query(100, ge=1, le=500),
+    skip: int = Query(0, ge=0, deprecated=True),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """List all applications"""
-    result = await db.execute(
+    """List all applications
+    
+    Pages are keyed on id; pass the X-Next-Cursor header of one page as
+    ``cursor`` to fetch the next.
+    """
+    cache_key = catalog_cache.list_key(cursor, limit, skip)
+    cached = await catalog_cache.get(cache_key)
+    if cached:
+        return etag_response(request, *cached)
+    
+    query = (
         select(Application)
         .where(Application.is_active == True)
-        .offset(skip)
+        .order_by(Application.id)
         .limit(limit)
     )
+    if cursor:
+        (last_id,) = decode_cursor(cursor, int)
+        query = query.where(Application.id > last_id)
+    elif skip:
+        query = query.offset(skip)
+    
+    result = await db.execute(query)
     applications = result.scalars().all()
-    return applications
+    headers = {}
+    if len(applications) == limit:
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(applications[-1].id)
+    body = application_list_adapter.dump_json(
+        application_list_adapter.validate_python(applications, from_attributes=True)
+    )
+    etag = await catalog_cache.set(cache_key, body, headers)
+    return etag_response(request, etag, body, headers)
+
+@router.get("/search", response_model=ApplicationSearchResponse)
+async def search_applications(
+    request: Request,
+    q: str = "",
+    arch: str | None = None,
+    renderer: str | None = None,
+    audio: str | None = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=10000),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Ranked full-text search with facet filters and counts
+    
+    Words in ``q`` are prefix-matched against name (weighted higher) and
+    description. ``facets`` counts matching applications per value of each
+    facet.
+    """
+    cache_key = catalog_cache.list_key("search", q, arch, renderer, audio, limit, offset)
+    cached = await catalog_cache.get(cache_key)
+    if cached:
+        return etag_response(request, *cached)
+    
+    conditions = [Application.is_active == True]
+    rank = None
+    tsquery = build_tsquery(q)
+    if tsquery:
+        query_vector = func.to_tsquery(text("'english'::regconfig"), tsquery)
+        vector = application_search_vector()
+        conditions.append(vector.op("@@")(query_vector))
+        rank = func.ts_rank_cd(vector, query_vector)
+    for name, value in (("arch", arch), ("renderer", renderer), ("audio", audio)):
+        if value:
+            conditions.append(Application.wine_config.contains(facet_filter(SEARCH_FACETS[name], value)))
+    
+    query = select(Application, rank if rank is not None else null()).where(*conditions)
+    if rank is not None:
+        query = query.order_by(rank.desc(), Application.id)
+    else:
+        query = query.order_by(Application.name, Application.id)
+    rows = (await db.execute(query.limit(limit).offset(offset))).all()
+    
+    # All facet counts and the total in one pass with GROUPING SETS
+    # Literal paths so the GROUP BY expressions are identical to the selected ones
+    facet_columns = {
+        name: Application.wine_config.op("#>>")(text("'{%s}'" % ",".join(path)))
+        for name, path in SEARCH_FACETS.items()
+    }
+    columns = list(facet_columns.values())
+    counts = await db.execute(
+        select(*columns, func.grouping(*columns), func.count())
+        .where(*conditions)
+        .group_by(func.grouping_sets(*(tuple_(column) for column in columns), tuple_()))
+    )
+    total = 0
+    facets: Dict[str, Dict[str, int]] = {name: {} for name in facet_columns}
+    for *values, grouping, count in counts:
+        if grouping == (1 << len(columns)) - 1:
+            total = count
+            continue
+        # A facet's bit in GROUPING() is clear when the row is grouped by it
+        for position, name in enumerate(facet_columns):
+            if not grouping & (1 << (len(columns) - 1 - position)) and values[position] is not None:
+                facets[name][values[position]] = count
+    
+    body = ApplicationSearchResponse(
+        total=total,
+        results=[
+            {**ApplicationResponse.model_validate(app).model_dump(), "rank": score}
+            for app, score in rows
+        ],
+        facets=facets
+    ).model_dump_json().encode()
+    etag = await catalog_cache.set(cache_key, body)
+    return etag_response(request, etag, body)
 
 @router.post("/", response_model=ApplicationResponse, status_code=201)
 async def create_application(
@@ -53,16 +193,48 @@ async def create_application(
     """Create a new application"""
     db_app = Application(**app.model_dump())
     db.add(db_app)
-    await db.commit()
-    await db.refresh(db_app)
+    try:
+        await db.flush()
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail=f"Application '{app.name}' already exists")
+    on_commit(db, lambda: invalidate_applications(db_app.id))
     return db_app
 
+@router.post("/bulk")
+async def bulk_upsert_applications(
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    """Upsert many applications by name from a JSON or YAML manifest
+    
+    The body is a list of applications or ``{"applications": [...]}``; send
+    ``Content-Type: application/yaml`` for YAML. Everything is applied in one
+    transaction and the response counts inserted, updated and unchanged rows.
+    """
+    content_type = request.headers.get("content-type", "")
+    fmt = "yaml" if "yaml" in content_type else "json"
+    try:
+        entries = parse_manifest(await request.body(), fmt)
+    except CatalogError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    report = await upsert_applications(db, entries)
+    if report["changed_ids"]:
+        on_commit(db, lambda: invalidate_applications(*report["changed_ids"]))
+    return report
+
 @router.get("/{app_id}", response_model=ApplicationResponse)
 async def get_application(
+    request: Request,
     app_id: int,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get application by ID"""
+    cache_key = catalog_cache.item_key(app_id)
+    cached = await catalog_cache.get(cache_key)
+    if cached:
+        return etag_response(request, *cached)
+    
     result = await db.execute(
         select(Application).where(Application.id == app_id)
     )
@@ -71,7 +243,9 @@ async def get_application(
     if not app:
         raise HTTPException(status_code=404, detail="Application not found")
     
-    return app
+    body = ApplicationResponse.model_validate(app).model_dump_json().encode()
+    etag = await catalog_cache.set(cache_key, body)
+    return etag_response(request, etag, body)
 
 @router.put("/{app_id}", response_model=ApplicationResponse)
 async def update_application(
@@ -80,20 +254,20 @@ async def update_application(
     db: AsyncSession = Depends(get_db)
 ):
     """Update an application"""
-    result = await db.execute(
-        select(Application).where(Application.id == app_id)
-    )
-    db_app = result.scalar_one_or_none()
+    try:
+        db_app = await db.scalar(
+            update(Application)
+            .where(Application.id == app_id)
+            .values(**app_update.model_dump(exclude_unset=True), updated_at=datetime.utcnow())
+            .returning(Application)
+        )
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail=f"Application '{app_update.name}' already exists")
     
     if not db_app:
         raise HTTPException(status_code=404, detail="Application not found")
     
-    for key, value in app_update.model_dump(exclude_unset=True).items():
-        setattr(db_app, key, value)
-    
-    db_app.updated_at = datetime.utcnow()
-    await db.commit()
-    await db.refresh(db_app)
+    on_commit(db, lambda: invalidate_applications(app_id))
     return db_app
 
 @router.delete("/{app_id}")
@@ -102,14 +276,15 @@ async def delete_application(
     db: AsyncSession = Depends(get_db)
 ):
     """Delete (deactivate) an application"""
-    result = await db.execute(
-        select(Application).where(Application.id == app_id)
+    deactivated = await db.scalar(
+        update(Application)
+        .where(Application.id == app_id)
+        .values(is_active=False, updated_at=datetime.utcnow())
+        .returning(Application.id)
     )
-    db_app = result.scalar_one_or_none()
     
-    if not db_app:
+    if deactivated is None:
         raise HTTPException(status_code=404, detail="Application not found")
     
-    db_app.is_active = False
-    await db.commit()
+    on_commit(db, lambda: invalidate_applications(app_id))
     return {"message": "Application deleted successfully"}
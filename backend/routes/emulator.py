@@ -1,14 +1,29 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List, Optional
-import httpx
-import subprocess
-import asyncio
-from pydantic import BaseModel
+from sqlalchemy import select
+from typing import Any, Dict, List, Literal, Optional
+from urllib.parse import urlencode
+from pydantic import BaseModel, Field
+from dataclasses import dataclass
 from datetime import datetime
+import logging
 
-from database import get_db
+from database import get_db, Session
 from config import settings
+from services.cache import etag_matches, etag_response
+from services.command_stream import CommandStream
+from services.health import health_checker
+from services.executors import get_executor
+from services.launch_specs import LaunchSpecError, launch_specs
+from services.jobs import Job, JobQueueFullError, JobRunner, flush_output, job_manager, job_output
+from services.screenshots import THUMBNAIL_FORMATS, ScreenshotError, screenshot_service
+from services.slots import SlotUnavailableError, slot_allocator
+from services.wine_client import wine_client
+from services.warm_pool import warm_pool
+from services.wine_processes import DEFAULT_RESOLUTION, game_pid_file, launch_detached, running_games
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -18,6 +33,7 @@ class EmulatorStatus(BaseModel):
     wine_version: str
     display: str
     vnc_available: bool
+    probes: Dict[str, Dict[str, Any]] | None = None
 
 class ExecuteCommand(BaseModel):
     command: str
@@ -29,138 +45,335 @@ class CommandResponse(BaseModel):
     output: str
     error: Optional[str] = None
 
+# game type -> (working directory, argv); run as the Wine user on the target display
+GAME_COMMANDS = {
+    "cs16": ("/app/cs16-game", ["wine", "hl.exe", "-game", "cstrike", "+map", "de_dust2"]),
+    "cs16-demo": ("/app/games", ["wine", "cs16-crossover.exe"]),
+    "launcher": ("/app/games", ["wine", "wine-game-launcher.exe"]),
+    "winecfg": (None, ["winecfg"]),
+}
+
+@dataclass
+class LaunchTarget:
+    container: str
+    display: str
+    vnc_port: int
+    prefix: str | None = None
+
+def default_target() -> LaunchTarget:
+    """The shared default display: the first slot display and VNC port of WINE_CONTAINER"""
+    return LaunchTarget(settings.WINE_CONTAINER, f":{settings.SLOT_DISPLAY_BASE}", settings.SLOT_VNC_PORT_BASE)
+
+async def launch_target(db: AsyncSession, session_id: str | None) -> LaunchTarget:
+    """Where to launch: the session's container and display, or the shared default display"""
+    target = default_target()
+    if session_id:
+        result = await db.execute(select(Session).where(Session.session_id == session_id))
+        session = result.scalar_one_or_none()
+        if not session or session.status != "active":
+            raise HTTPException(status_code=404, detail="Active session not found")
+        metadata = session.session_metadata or {}
+        target.container = metadata.get("container", target.container)
+        target.display = metadata.get("display", target.display)
+        target.vnc_port = session.vnc_port or target.vnc_port
+        target.prefix = metadata.get("wine_prefix")
+    return target
+
+def launch_runner(
+    target: LaunchTarget,
+    label: str,
+    argv: List[str],
+    env: Dict[str, str],
+    workdir: str | None = None
+) -> JobRunner:
+    """Start a game detached; the job ends once it is running, the game does not end with it
+    
+    The game records its pid, so ``running_games`` can tell which launches
+    are still up.
+    """
+    
+    async def run(job: Job) -> int:
+        pid_file = game_pid_file(target.display, label, job.id.replace("-", ""))
+        return await launch_detached(target.container, argv, pid_file, env=env, workdir=workdir)
+    
+    return run
+
+def launch_job_response(job: Job, target: LaunchTarget) -> Dict[str, Any]:
+    return {
+        "job_id": job.id,
+        "status_url": f"/api/emulator/jobs/{job.id}",
+        "display": target.display,
+        "vnc_url": f"vnc://localhost:{target.vnc_port}",
+        "vnc_password": settings.VNC_PASSWORD
+    }
+
+@router.post("/launch/app/{app_id}")
+async def launch_registered_application(
+    app_id: int,
+    session_id: str | None = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Launch a registered application from its wine_config
+    
+    The application's argv, environment and working directory come from its
+    compiled launch spec, cached until the application is updated.
+    """
+    try:
+        spec = await launch_specs.get(app_id)
+    except LaunchSpecError as e:
+        raise HTTPException(status_code=422, detail=f"Application cannot be launched: {str(e)}")
+    if spec is None:
+        raise HTTPException(status_code=404, detail="Application not found")
+    
+    target = await launch_target(db, session_id)
+    runner = launch_runner(target, f"app{app_id}", list(spec.argv), spec.env_for(target.display, target.prefix), spec.cwd)
+    try:
+        job = job_manager.submit("launch", target.container, runner, description=spec.name, keep_on_shutdown=True)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=f"Too many pending jobs: {str(e)}")
+    
+    return JSONResponse(status_code=202, content={
+        "success": True,
+        "message": f"{spec.name} launch queued",
+        "application_id": app_id,
+        **launch_job_response(job, target)
+    })
+
 @router.post("/launch/{game_type}")
-async def launch_game(game_type: str):
-    """Launch a specific game in the Wine environment"""
+async def launch_game(
+    game_type: str,
+    session_id: str | None = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Launch a specific game in the Wine environment
+    
+    With ``session_id`` the game runs on that session's display and container,
+    otherwise on the shared default display.
+    """
     try:
-        import subprocess
-        import asyncio
-        
-        game_commands = {
-            "cs16": 'docker exec wine-dev-gaming bash -c "su - wineuser -c \\"cd /app/cs16-game && DISPLAY=:99 wine hl.exe -game cstrike +map de_dust2\\""',
-            "cs16-demo": 'docker exec wine-dev-gaming bash -c "su - wineuser -c \\"cd /app/games && DISPLAY=:99 wine cs16-crossover.exe\\""',
-            "launcher": 'docker exec wine-dev-gaming bash -c "su - wineuser -c \\"cd /app/games && DISPLAY=:99 wine wine-game-launcher.exe\\""',
-            "winecfg": 'docker exec wine-dev-gaming bash -c "su - wineuser -c \\"DISPLAY=:99 winecfg\\""'
-        }
-        
-        if game_type not in game_commands:
+        if game_type not in GAME_COMMANDS:
             raise HTTPException(status_code=400, detail=f"Unknown game type: {game_type}")
         
-        # Launch game in background
-        command = game_commands[game_type]
-        process = await asyncio.create_subprocess_shell(
-            command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
+        target = await launch_target(db, session_id)
+        
+        # Launch game as a background job
+        workdir, argv = GAME_COMMANDS[game_type]
+        env = {"DISPLAY": target.display}
+        if target.prefix:
+            # The session's own prefix, which /restart?session_id= stops
+            env["WINEPREFIX"] = target.prefix
+        runner = launch_runner(target, game_type, argv, env, workdir)
+        job = job_manager.submit("launch", target.container, runner, description=game_type, keep_on_shutdown=True)
         
-        return {
+        return JSONResponse(status_code=202, content={
             "success": True,
-            "message": f"{game_type} launched successfully",
+            "message": f"{game_type} launch queued",
             "game_type": game_type,
-            "vnc_url": "vnc://localhost:5900",
-            "vnc_password": "haos"
-        }
+            **launch_job_response(job, target)
+        })
         
+    except HTTPException:
+        raise
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=f"Too many pending jobs: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to launch {game_type}: {str(e)}")
 
+def restart_runner(target: LaunchTarget) -> JobRunner:
+    """Stop the Wine processes of one prefix: a session's, or the shared display's default
+    
+    ``wineserver -k`` only reaches processes attached to that prefix, so other
+    sessions and warm environments (each on their own prefix) keep running.
+    """
+    
+    async def run(job: Job) -> int:
+        env = {"WINEPREFIX": target.prefix} if target.prefix else {}
+        try:
+            # Exits non-zero when no wineserver was running, which is fine here
+            await get_executor().run(target.container, ["wineserver", "-k"], env=env, on_output=job_output(job))
+            return 0
+        finally:
+            flush_output(job)
+    
+    return run
+
 @router.post("/restart")
-async def restart_wine_environment():
-    """Restart the Wine gaming environment"""
+async def restart_wine_environment(
+    session_id: str | None = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Restart Wine for one session, or for the shared default display"""
+    target = await launch_target(db, session_id)
+    if session_id and not target.prefix:
+        raise HTTPException(status_code=409, detail="Session has no Wine prefix of its own to restart")
     try:
-        import subprocess
-        import asyncio
+        # Restart Wine processes as a background job
+        job = job_manager.submit("restart", target.container, restart_runner(target), description="restart")
         
-        # Restart Wine processes
-        restart_command = 'docker exec wine-dev-gaming bash -c "pkill -f wine; pkill -f hl.exe; sleep 2; su - wineuser -c \\"DISPLAY=:99 fluxbox &\\""'
-        
-        process = await asyncio.create_subprocess_shell(
-            restart_command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        stdout, stderr = await process.communicate()
-        
-        return {
+        return JSONResponse(status_code=202, content={
             "success": True,
-            "message": "Wine environment restarted",
-            "stdout": stdout.decode() if stdout else "",
-            "stderr": stderr.decode() if stderr else ""
-        }
+            "message": "Wine environment restart queued",
+            "job_id": job.id,
+            "status_url": f"/api/emulator/jobs/{job.id}"
+        })
         
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=f"Too many pending jobs: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to restart Wine environment: {str(e)}")
 
+@router.get("/jobs")
+async def list_jobs():
+    """List recent launch/restart jobs"""
+    return {
+        "jobs": [job.to_dict(include_output=False) for job in reversed(job_manager.jobs.values())],
+        **job_manager.stats()
+    }
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get job status and the tail of its output"""
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job"""
+    if not job_manager.cancel(job_id):
+        raise HTTPException(status_code=404, detail="No unfinished job with that id")
+    return {"message": "Job cancellation requested"}
+
+@router.websocket("/jobs/{job_id}/ws")
+async def watch_job(websocket: WebSocket, job_id: str):
+    """Stream job status and output events"""
+    await websocket.accept()
+    job = job_manager.get(job_id)
+    if not job:
+        await websocket.close(code=4404)
+        return
+    
+    queue = job.subscribe()
+    try:
+        await websocket.send_json({"type": "snapshot", "job": job.to_dict()})
+        finished = job.finished
+        while not finished:
+            event = await queue.get()
+            await websocket.send_json(event)
+            finished = event["type"] == "dropped" or event.get("status") in ("succeeded", "failed", "cancelled")
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        job.subscribers.discard(queue)
+
 @router.get("/vnc-info")
 async def get_vnc_info():
-    """Get VNC connection information for Wine emulator"""
+    """VNC connection information from the latest health probes and slot leases"""
+    report = await health_checker.check()
+    endpoints = [
+        {"endpoint": name.removeprefix("vnc:"), **check}
+        for name, check in report["checks"].items()
+        if name.startswith("vnc:")
+    ]
+    games_running = []
+    for container in dict.fromkeys([settings.WINE_CONTAINER, *slot_allocator.containers]):
+        try:
+            games_running += await running_games(container)
+        except OSError as e:
+            logger.warning(f"Could not list running games in {container}: {e}")
+    try:
+        sessions = [slot.to_metadata() for slot in await slot_allocator.leased()]
+    except SlotUnavailableError as e:
+        logger.warning(f"Could not list leased slots: {e}")
+        sessions = None
+    
+    target = default_target()
+    up = [endpoint for endpoint in endpoints if endpoint["status"] == "up"]
+    vnc_port = up[0]["port"] if up else target.vnc_port
+    vnc_url = f"vnc://localhost:{vnc_port}"
     return {
-        "vnc_url": "vnc://localhost:5900",
-        "password": "haos", 
-        "display": ":99",
-        "resolution": "1280x960x24",
-        "games_running": ["Counter-Strike 1.6", "CrossOver Simulation"],
-        "container_status": "running",
-        "instructions": "Use any VNC client to connect to vnc://localhost:5900 with password 'haos'"
+        "status": report["status"],
+        "vnc_url": vnc_url,
+        "password": settings.VNC_PASSWORD,
+        "display": target.display,
+        "resolution": DEFAULT_RESOLUTION,
+        "games_running": games_running,
+        "container_status": "running" if up else "unreachable",
+        "endpoints": endpoints,
+        "sessions": sessions,
+        "instructions": f"Use any VNC client to connect to {vnc_url} with password '{settings.VNC_PASSWORD}'"
     }
 
 @router.get("/", response_model=dict)
 async def get_emulator_info():
-    """Get Wine emulator information"""
+    """Get Wine emulator information and its current health"""
+    report = await health_checker.check()
+    target = default_target()
     return {
-        "message": "Wine Emulator Platform Ready",
-        "vnc_url": "vnc://localhost:5900",
-        "vnc_password": "haos",
-        "display": ":99",
-        "games": ["Counter-Strike 1.6"],
-        "status": "running"
+        "message": "Wine Emulator Platform Ready" if report["ready"] else "Wine Emulator Platform Not Ready",
+        "vnc_url": f"vnc://localhost:{target.vnc_port}",
+        "vnc_password": settings.VNC_PASSWORD,
+        "display": target.display,
+        "games": sorted(GAME_COMMANDS),
+        "status": report["status"]
     }
 
 @router.get("/status", response_model=EmulatorStatus)
 async def get_emulator_status():
     """Get Wine emulator status"""
     try:
-        # Check wine-gaming container directly instead of HTTP API
-        # For now, assume it's running since VNC is accessible  
+        report = await health_checker.check()
+        wine_service = report["checks"]["wine_service"]
         return EmulatorStatus(
-            status="running",
-            wine_version="8.0.2",
-            display=":99",
-            vnc_available=True
+            status="running" if wine_service["status"] == "up" else "unavailable",
+            wine_version=wine_service.get("wine_version") or "unknown",
+            display=default_target().display,
+            vnc_available=any(
+                check["status"] == "up" for name, check in report["checks"].items() if name.startswith("vnc:")
+            ),
+            probes={name: {"status": check["status"], "latency_ms": check["latency_ms"]} for name, check in report["checks"].items()}
         )
     except Exception as e:
         raise HTTPException(status_code=503, detail=f"Connection error: {str(e)}")
 
 @router.post("/execute", response_model=CommandResponse)
-async def execute_wine_command(command: ExecuteCommand):
-    """Execute a Wine command"""
+async def execute_wine_command(command: ExecuteCommand, stream: bool = False):
+    """Execute a Wine command
+    
+    With ``stream=true`` the response is a Server-Sent Events stream of
+    ``stdout``/``stderr`` output as it is produced, ending with an ``exit``
+    event; disconnecting cancels the command.
+    """
+    payload = {
+        "command": command.command,
+        "args": command.args,
+        "wine_prefix": command.wine_prefix
+    }
+    if stream:
+        return StreamingResponse(
+            CommandStream(payload).events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{settings.WINE_SERVICE_URL}/api/execute",
-                json={
-                    "command": command.command,
-                    "args": command.args,
-                    "wine_prefix": command.wine_prefix
-                },
-                timeout=30.0
+        response = await wine_client.post("/api/execute", json=payload)
+        
+        if response.status_code == 200:
+            data = response.json()
+            return CommandResponse(
+                success=True,
+                output=data.get("output", ""),
+                error=data.get("error")
+            )
+        else:
+            return CommandResponse(
+                success=False,
+                output="",
+                error=f"Command failed with status {response.status_code}"
             )
-            
-            if response.status_code == 200:
-                data = response.json()
-                return CommandResponse(
-                    success=True,
-                    output=data.get("output", ""),
-                    error=data.get("error")
-                )
-            else:
-                return CommandResponse(
-                    success=False,
-                    output="",
-                    error=f"Command failed with status {response.status_code}"
-                )
     except Exception as e:
         return CommandResponse(
             success=False,
@@ -173,8 +386,8 @@ async def get_wine_info():
     """Get Wine configuration information"""
     return {
         "arch": "win64",
-        "display": ":0",
-        "vnc_port": 5900,
+        "display": default_target().display,
+        "vnc_port": default_target().vnc_port,
         "web_port": 8080,
         "supported_formats": [".exe", ".msi"],
         "features": [
@@ -186,19 +399,112 @@ async def get_wine_info():
         ]
     }
 
+@router.get("/client-stats")
+async def get_wine_client_stats():
+    """Get connection pool statistics for the Wine service client"""
+    return wine_client.pool_stats()
+
+@router.get("/warm-pool")
+async def get_warm_pool_stats():
+    """Get warm pool occupancy and warm/cold launch latencies"""
+    return warm_pool.snapshot()
+
+DEFAULT_SCREEN = "default"
+
+def screenshot_params(session: Session) -> Dict[str, Any]:
+    """Wine service query parameters selecting a session's display"""
+    metadata = session.session_metadata or {}
+    return {key: metadata[key] for key in ("container", "display") if metadata.get(key)}
+
+async def screenshot_targets(db: AsyncSession, session_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Capture parameters per key; unknown or inactive sessions are left out"""
+    targets = {DEFAULT_SCREEN: {}} if DEFAULT_SCREEN in session_ids else {}
+    ids = [session_id for session_id in session_ids if session_id != DEFAULT_SCREEN]
+    if ids:
+        result = await db.execute(
+            select(Session).where(Session.session_id.in_(ids), Session.status == "active")
+        )
+        targets.update({session.session_id: screenshot_params(session) for session in result.scalars()})
+    return targets
+
+class ScreenshotChangesRequest(BaseModel):
+    # session id (or "default") -> frame hash the client already has
+    sessions: Dict[str, str | None] = Field(..., max_length=200)
+    width: int | None = Field(None, ge=16, le=settings.SCREENSHOT_THUMBNAIL_MAX_SIZE)
+    height: int | None = Field(None, ge=16, le=settings.SCREENSHOT_THUMBNAIL_MAX_SIZE)
+    format: Literal["webp", "jpeg"] = "webp"
+
 @router.get("/screenshot")
-async def get_screenshot():
-    """Get current screen screenshot"""
+async def get_screenshot(
+    request: Request,
+    session_id: str = DEFAULT_SCREEN,
+    width: int | None = Query(None, ge=16, le=settings.SCREENSHOT_THUMBNAIL_MAX_SIZE),
+    height: int | None = Query(None, ge=16, le=settings.SCREENSHOT_THUMBNAIL_MAX_SIZE),
+    format: Literal["webp", "jpeg"] = "webp",
+    db: AsyncSession = Depends(get_db)
+):
+    """Current screen as an image, or a thumbnail when ``width``/``height`` is given
+    
+    Without a ``session_id`` the shared default display is captured. The
+    ETag is derived from the frame hash, so an unchanged screen answers 304.
+    """
+    targets = await screenshot_targets(db, [session_id])
+    if session_id not in targets:
+        raise HTTPException(status_code=404, detail="Active session not found")
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{settings.WINE_SERVICE_URL}/api/screenshot",
-                timeout=10.0
-            )
-            
-            if response.status_code == 200:
-                return {"screenshot": response.content.decode("base64")}
-            else:
-                raise HTTPException(status_code=500, detail="Screenshot failed")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Screenshot error: {str(e)}")
+        frame = await screenshot_service.capture(session_id, targets[session_id])
+        headers = {"X-Frame-Hash": frame.hash}
+        if width is None and height is None:
+            return etag_response(request, frame.etag, frame.data, headers, media_type=frame.content_type)
+        
+        width = width or settings.SCREENSHOT_THUMBNAIL_MAX_SIZE
+        height = height or settings.SCREENSHOT_THUMBNAIL_MAX_SIZE
+        etag = f'"{frame.hash}-{width}x{height}.{format}"'
+        if etag_matches(request, etag):
+            # Skip rendering when the client already has this thumbnail
+            return etag_response(request, etag, b"", headers)
+        body = await screenshot_service.thumbnail(session_id, frame, width, height, format)
+        return etag_response(request, etag, body, headers, media_type=THUMBNAIL_FORMATS[format][1])
+    except ScreenshotError as e:
+        raise HTTPException(status_code=502, detail=f"Screenshot error: {str(e)}")
+
+@router.post("/screenshots/changes")
+async def get_screenshot_changes(
+    changes: ScreenshotChangesRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """Which of many sessions have a new frame since the hashes the client holds
+    
+    Unchanged sessions are omitted from ``frames``, so polling a wall of idle
+    previews returns an empty delta. Each changed entry carries the URL of its
+    image (a thumbnail when a size is given).
+    """
+    targets = await screenshot_targets(db, list(changes.sessions))
+    missing = [session_id for session_id in changes.sessions if session_id not in targets]
+    changed, errors = await screenshot_service.changes(
+        {key: changes.sessions[key] for key in targets}, targets
+    )
+    
+    size = {key: value for key, value in (("width", changes.width), ("height", changes.height)) if value}
+    if size:
+        size["format"] = changes.format
+    frames = []
+    for session_id, frame in changed.items():
+        query = urlencode({"session_id": session_id, **size, "v": frame.hash})
+        frames.append({
+            "session_id": session_id,
+            "frame": frame.hash,
+            "changed_at": datetime.utcfromtimestamp(frame.changed_at).isoformat(),
+            "url": f"/api/emulator/screenshot?{query}",
+        })
+    return {
+        "frames": frames,
+        "unchanged": len(targets) - len(changed) - len(errors),
+        "errors": errors,
+        "missing": missing,
+    }
+
+@router.get("/screenshots/stats")
+async def get_screenshot_stats():
+    """Get capture counters and thumbnail cache occupancy"""
+    return screenshot_service.snapshot()
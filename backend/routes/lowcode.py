@@ -1,11 +1,15 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from typing import List, Dict, Any
-from pydantic import BaseModel
-from datetime import datetime
+from sqlalchemy import JSON, DateTime, Integer, Select, String, cast, column, delete, insert, literal, or_, select, update, values
+from typing import List, Dict, Any, Iterable, Tuple
+from pydantic import BaseModel, Field
+from datetime import datetime, timezone
+import json
 
-from database import get_db, LowCodeComponent
+from config import settings
+from database import get_db, get_read_db, LowCodeComponent
+from services.workflows import WorkflowRun, WorkflowValidationError, workflow_plans, workflow_runs
 
 router = APIRouter()
 
@@ -28,14 +32,42 @@ class ComponentResponse(ComponentBase):
     class Config:
         from_attributes = True
 
+class ComponentUpsert(ComponentBase):
+    id: int | None = None
+    client_id: str | None = None
+    parent_client_id: str | None = None
+    updated_at: datetime | None = None
+
+class ComponentDelete(BaseModel):
+    id: int
+    updated_at: datetime | None = None
+
+class ComponentBatch(BaseModel):
+    upserts: List[ComponentUpsert] = []
+    deletes: List[ComponentDelete] = []
+
+class CreatedComponent(ComponentResponse):
+    client_id: str | None = None
+
+class ComponentBatchResponse(BaseModel):
+    created: List[CreatedComponent]
+    updated: List[ComponentResponse]
+    deleted: List[int]
+
+class ComponentTreeNode(ComponentResponse):
+    depth: int
+    children: List["ComponentTreeNode"] = []
+
 class WorkflowConfig(BaseModel):
     components: List[Dict[str, Any]]
     connections: List[Dict[str, Any]]
+    inputs: Dict[str, Any] = Field(default_factory=dict)
+    max_concurrency: int | None = Field(None, ge=1)
 
 @router.get("/components", response_model=List[ComponentResponse])
 async def list_components(
     component_type: str | None = None,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """List all low-code components"""
     query = select(LowCodeComponent)
@@ -47,6 +79,77 @@ async def list_components(
     components = result.scalars().all()
     return components
 
+def component_tree_query(
+    root_id: int | None,
+    max_depth: int,
+    updated_since: datetime | None = None
+) -> Select:
+    """Recursive CTE selecting a subtree (or every root's tree) with each node's depth"""
+    anchor = select(LowCodeComponent.id, literal(0).label("depth"))
+    if root_id is None:
+        anchor = anchor.where(LowCodeComponent.parent_id.is_(None))
+    else:
+        anchor = anchor.where(LowCodeComponent.id == root_id)
+    tree = anchor.cte("component_tree", recursive=True)
+    # parent_id is not a foreign key, so the depth bound also stops runaway cycles
+    tree = tree.union_all(
+        select(LowCodeComponent.id, tree.c.depth + 1)
+        .join(tree, LowCodeComponent.parent_id == tree.c.id)
+        .where(tree.c.depth < max_depth)
+    )
+    query = (
+        select(LowCodeComponent, tree.c.depth)
+        .join(tree, LowCodeComponent.id == tree.c.id)
+        .order_by(tree.c.depth, LowCodeComponent.id)
+    )
+    if updated_since is not None:
+        query = query.where(LowCodeComponent.updated_at > updated_since)
+    return query
+
+def build_component_tree(rows: Iterable[Tuple[LowCodeComponent, int]]) -> List[Dict[str, Any]]:
+    """Nest (component, depth) rows, ordered by depth, under their parents
+    
+    Nodes whose parent is not among the rows (e.g. when filtering by
+    ``updated_since``) are returned at the top level.
+    """
+    nodes: Dict[int, Dict[str, Any]] = {}
+    roots: List[Dict[str, Any]] = []
+    for component, depth in rows:
+        if component.id in nodes:
+            continue
+        node = {
+            **ComponentResponse.model_validate(component).model_dump(),
+            "depth": depth,
+            "children": []
+        }
+        nodes[component.id] = node
+        parent = nodes.get(component.parent_id)
+        if parent is not None and depth > 0:
+            parent["children"].append(node)
+        else:
+            roots.append(node)
+    return roots
+
+@router.get("/components/tree", response_model=List[ComponentTreeNode])
+async def get_component_tree(
+    root_id: int | None = None,
+    max_depth: int | None = Query(None, ge=0),
+    updated_since: datetime | None = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Load a component subtree (or the whole canvas) in a single query
+    
+    ``max_depth`` limits how many levels below the root are returned.
+    ``updated_since`` returns only nodes changed after that time; deletions
+    are not reported, so clients should reload fully after removing nodes.
+    """
+    depth = min(max_depth if max_depth is not None else settings.LOWCODE_TREE_MAX_DEPTH, settings.LOWCODE_TREE_MAX_DEPTH)
+    result = await db.execute(component_tree_query(root_id, depth, updated_since))
+    rows = result.all()
+    if root_id is not None and not rows and updated_since is None:
+        raise HTTPException(status_code=404, detail="Component not found")
+    return build_component_tree(rows)
+
 @router.post("/components", response_model=ComponentResponse, status_code=201)
 async def create_component(
     component: ComponentCreate,
@@ -55,14 +158,149 @@ async def create_component(
     """Create a new low-code component"""
     db_component = LowCodeComponent(**component.model_dump())
     db.add(db_component)
-    await db.commit()
-    await db.refresh(db_component)
+    await db.flush()
     return db_component
 
+def _naive_utc(value: datetime | None) -> datetime | None:
+    """Timestamps are stored as naive UTC"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def validate_component_batch(batch: ComponentBatch):
+    if len(batch.upserts) + len(batch.deletes) > settings.LOWCODE_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=422, detail=f"Batch exceeds {settings.LOWCODE_BATCH_MAX_ITEMS} items")
+    ids = [item.id for item in batch.upserts if item.id is not None] + [item.id for item in batch.deletes]
+    if len(ids) != len(set(ids)):
+        raise HTTPException(status_code=422, detail="Each component id may appear only once per batch")
+    client_ids = [item.client_id for item in batch.upserts if item.id is None and item.client_id]
+    if len(client_ids) != len(set(client_ids)):
+        raise HTTPException(status_code=422, detail="Duplicate client_id in batch")
+    unknown = {item.parent_client_id for item in batch.upserts if item.parent_client_id} - set(client_ids)
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown parent_client_id: {', '.join(sorted(unknown))}")
+
+@router.post("/components/batch", response_model=ComponentBatchResponse)
+async def batch_components(
+    batch: ComponentBatch,
+    db: AsyncSession = Depends(get_db)
+):
+    """Create, update and delete many components in one transaction
+    
+    Upserts without an ``id`` are created; a ``client_id`` lets other items
+    in the batch refer to the new node as their ``parent_client_id``.
+    Upserts with an ``id`` replace that component. Updates and deletes that
+    carry ``updated_at`` only apply if the row is unchanged since then;
+    otherwise the whole batch is rolled back with 409.
+    """
+    validate_component_batch(batch)
+    now = datetime.utcnow()
+    fields = ("name", "component_type", "config", "position", "parent_id")
+    creates = [item for item in batch.upserts if item.id is None]
+    updates = [item for item in batch.upserts if item.id is not None]
+    
+    # Creates: one multi-row INSERT ... RETURNING, rows in parameter order
+    created: List[LowCodeComponent] = []
+    if creates:
+        result = await db.scalars(
+            insert(LowCodeComponent).returning(LowCodeComponent, sort_by_parameter_order=True),
+            [{**item.model_dump(include=set(fields)), "created_at": now, "updated_at": now} for item in creates]
+        )
+        created = list(result)
+    client_ids = {item.client_id: row.id for item, row in zip(creates, created) if item.client_id}
+    
+    # New nodes parented to other new nodes only learn their parent's id now
+    reparent = [(row.id, client_ids[item.parent_client_id]) for item, row in zip(creates, created) if item.parent_client_id]
+    if reparent:
+        parents = values(column("id", Integer), column("parent_id", Integer), name="parents").data(reparent)
+        result = await db.scalars(
+            update(LowCodeComponent)
+            .where(LowCodeComponent.id == parents.c.id)
+            .values(parent_id=parents.c.parent_id)
+            .returning(LowCodeComponent)
+            .execution_options(synchronize_session=False, populate_existing=True)
+        )
+        # Loading the returned rows refreshes the objects created above
+        result.all()
+    
+    # Updates: one UPDATE ... FROM (VALUES ...) ... RETURNING, version-checked per row
+    updated: List[LowCodeComponent] = []
+    if updates:
+        rows = values(
+            column("id", Integer),
+            column("name", String),
+            column("component_type", String),
+            column("config", JSON),
+            column("position", JSON),
+            column("parent_id", Integer),
+            column("expected", DateTime),
+            name="changes"
+        ).data([
+            (
+                item.id, item.name, item.component_type, item.config, item.position,
+                client_ids[item.parent_client_id] if item.parent_client_id else item.parent_id,
+                _naive_utc(item.updated_at)
+            )
+            for item in updates
+        ])
+        # Casts keep all-NULL columns in VALUES from being typed as text
+        result = await db.scalars(
+            update(LowCodeComponent)
+            .where(LowCodeComponent.id == rows.c.id)
+            .where(or_(rows.c.expected.is_(None), LowCodeComponent.updated_at == cast(rows.c.expected, DateTime)))
+            .values(
+                name=rows.c.name,
+                component_type=rows.c.component_type,
+                config=cast(rows.c.config, JSON),
+                position=cast(rows.c.position, JSON),
+                parent_id=cast(rows.c.parent_id, Integer),
+                updated_at=now
+            )
+            .returning(LowCodeComponent)
+            .execution_options(synchronize_session=False, populate_existing=True)
+        )
+        updated = list(result)
+    
+    # Deletes: one DELETE ... USING (VALUES ...) ... RETURNING
+    deleted: List[int] = []
+    if batch.deletes:
+        rows = values(column("id", Integer), column("expected", DateTime), name="removals").data(
+            [(item.id, _naive_utc(item.updated_at)) for item in batch.deletes]
+        )
+        result = await db.scalars(
+            delete(LowCodeComponent)
+            .where(LowCodeComponent.id == rows.c.id)
+            .where(or_(rows.c.expected.is_(None), LowCodeComponent.updated_at == cast(rows.c.expected, DateTime)))
+            .returning(LowCodeComponent.id)
+            .execution_options(synchronize_session=False)
+        )
+        deleted = list(result)
+    
+    conflicts = ({item.id for item in updates} - {row.id for row in updated}) | \
+        ({item.id for item in batch.deletes} - set(deleted))
+    if conflicts:
+        # Raising rolls back the whole batch
+        raise HTTPException(
+            status_code=409,
+            detail={
+                "message": "Components were modified or deleted concurrently",
+                "conflicts": sorted(conflicts)
+            }
+        )
+    
+    return {
+        "created": [
+            {**ComponentResponse.model_validate(row).model_dump(), "client_id": item.client_id}
+            for item, row in zip(creates, created)
+        ],
+        "updated": updated,
+        "deleted": sorted(deleted)
+    }
+
 @router.get("/components/{component_id}", response_model=ComponentResponse)
 async def get_component(
     component_id: int,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get component by ID"""
     result = await db.execute(
@@ -82,20 +320,16 @@ async def update_component(
     db: AsyncSession = Depends(get_db)
 ):
     """Update a component"""
-    result = await db.execute(
-        select(LowCodeComponent).where(LowCodeComponent.id == component_id)
+    db_component = await db.scalar(
+        update(LowCodeComponent)
+        .where(LowCodeComponent.id == component_id)
+        .values(**component_update.model_dump(exclude_unset=True), updated_at=datetime.utcnow())
+        .returning(LowCodeComponent)
     )
-    db_component = result.scalar_one_or_none()
     
     if not db_component:
         raise HTTPException(status_code=404, detail="Component not found")
     
-    for key, value in component_update.model_dump(exclude_unset=True).items():
-        setattr(db_component, key, value)
-    
-    db_component.updated_at = datetime.utcnow()
-    await db.commit()
-    await db.refresh(db_component)
     return db_component
 
 @router.delete("/components/{component_id}")
@@ -104,16 +338,15 @@ async def delete_component(
     db: AsyncSession = Depends(get_db)
 ):
     """Delete a component"""
-    result = await db.execute(
-        select(LowCodeComponent).where(LowCodeComponent.id == component_id)
+    deleted = await db.scalar(
+        delete(LowCodeComponent)
+        .where(LowCodeComponent.id == component_id)
+        .returning(LowCodeComponent.id)
     )
-    db_component = result.scalar_one_or_none()
     
-    if not db_component:
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Component not found")
     
-    await db.delete(db_component)
-    await db.commit()
     return {"message": "Component deleted successfully"}
 
 @router.get("/templates")
@@ -139,11 +372,50 @@ async def get_component_templates():
     }
 
 @router.post("/workflow/execute")
-async def execute_workflow(workflow: WorkflowConfig):
-    """Execute a low-code workflow"""
-    # This would execute the workflow logic
+async def execute_workflow(workflow: WorkflowConfig, stream: bool = False):
+    """Execute a low-code workflow
+    
+    Independent branches run concurrently. With ``stream=true`` the response is
+    NDJSON with one event per component as it starts and finishes; otherwise
+    the full run summary is returned once every component has finished.
+    """
+    try:
+        plan = workflow_plans.get_or_compile(workflow.components, workflow.connections)
+    except WorkflowValidationError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    run = workflow_runs.track(WorkflowRun(plan, inputs=workflow.inputs, max_concurrency=workflow.max_concurrency))
+    if stream:
+        async def events():
+            async for event in run.stream():
+                yield json.dumps(event, default=str) + "\n"
+        
+        return StreamingResponse(events(), media_type="application/x-ndjson", headers={"X-Workflow-Run-Id": run.id})
+    
+    result = await run.start()
+    executed = sum(1 for node in result["nodes"].values() if node["status"] == "succeeded")
     return {
-        "status": "success",
-        "message": "Workflow executed successfully",
-        "components_executed": len(workflow.components)
+        **result,
+        "message": f"Workflow {result['status']}",
+        "components_executed": executed
     }
+
+@router.get("/workflow/plans/stats")
+async def get_workflow_plan_stats():
+    """Get compiled workflow plan cache statistics"""
+    return workflow_plans.snapshot()
+
+@router.get("/workflow/runs/{run_id}")
+async def get_workflow_run(run_id: str):
+    """Get the progress of an in-flight workflow run"""
+    run = workflow_runs.get(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Workflow run not found")
+    return run.to_dict()
+
+@router.delete("/workflow/runs/{run_id}")
+async def cancel_workflow_run(run_id: str):
+    """Cancel an in-flight workflow run"""
+    if not workflow_runs.cancel(run_id):
+        raise HTTPException(status_code=404, detail="Workflow run not found or already finished")
+    return {"message": "Workflow run cancelled", "run_id": run_id}
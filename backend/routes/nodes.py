@@ -0,0 +1,99 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import Any, Dict, List
+from pydantic import BaseModel, Field
+import time
+
+from services.scheduler import NodeStatus, UnknownNodeError, node_scheduler
+from services.slots import SlotUnavailableError
+from services.warm_pool import warm_pool
+
+router = APIRouter()
+
+# Pydantic models
+class NodeHeartbeat(BaseModel):
+    slots: int | None = Field(None, ge=0)
+    cpu_percent: float | None = Field(None, ge=0, le=100)
+    memory_percent: float | None = Field(None, ge=0, le=100)
+    warm_apps: List[int] = []
+
+def describe(node: NodeStatus, now: float) -> Dict[str, Any]:
+    return {
+        **node.to_dict(),
+        "state": node_scheduler.policy.state(node, now),
+        "leased": node.slots - node.free_slots,
+    }
+
+async def find_node(name: str) -> NodeStatus:
+    for node in await node_scheduler.nodes():
+        if node.name == name:
+            return node
+    raise HTTPException(status_code=404, detail=f"Unknown node: {name}")
+
+@router.get("/")
+async def list_nodes():
+    """Registered Wine nodes with their capacity, load and state"""
+    try:
+        nodes = await node_scheduler.nodes()
+    except SlotUnavailableError as e:
+        raise HTTPException(status_code=503, detail=f"Node registry unavailable: {str(e)}")
+    now = time.time()
+    return [describe(node, now) for node in nodes]
+
+@router.get("/stats")
+async def get_scheduler_stats():
+    """Placement counters of this replica"""
+    return node_scheduler.snapshot()
+
+@router.get("/decisions")
+async def list_decisions(limit: int = Query(100, ge=1, le=10000)):
+    """Recent placement decisions of this replica, oldest first
+    
+    The list can be replayed with ``python -m services.scheduler_sim``.
+    """
+    return list(node_scheduler.decisions)[-limit:]
+
+@router.post("/{name}/heartbeat", status_code=204)
+async def node_heartbeat(name: str, heartbeat: NodeHeartbeat):
+    """Report a node's slot count, CPU and memory use, and warm application prefixes"""
+    report = {
+        "slots": heartbeat.slots,
+        "cpu": heartbeat.cpu_percent / 100 if heartbeat.cpu_percent is not None else None,
+        "memory": heartbeat.memory_percent / 100 if heartbeat.memory_percent is not None else None,
+        "warm_apps": heartbeat.warm_apps,
+    }
+    try:
+        await node_scheduler.heartbeat(name, report)
+    except UnknownNodeError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except SlotUnavailableError as e:
+        raise HTTPException(status_code=503, detail=f"Node registry unavailable: {str(e)}")
+
+@router.post("/{name}/drain")
+async def drain_node(name: str):
+    """Stop placing sessions on a node and release its idle warm environments
+    
+    Running sessions are left to finish; the node is drained once ``leased`` is 0.
+    Every replica evicts the warm environments it holds on the node; the count
+    returned is this replica's.
+    """
+    try:
+        await node_scheduler.drain(name)
+        evicted = await warm_pool.node_drained(name)
+        node = await find_node(name)
+    except UnknownNodeError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except SlotUnavailableError as e:
+        raise HTTPException(status_code=503, detail=f"Node registry unavailable: {str(e)}")
+    return {**describe(node, time.time()), "evicted_warm_environments": evicted}
+
+@router.delete("/{name}/drain")
+async def undrain_node(name: str):
+    """Accept new sessions on a drained node again"""
+    try:
+        await node_scheduler.drain(name, draining=False)
+        node = await find_node(name)
+    except UnknownNodeError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except SlotUnavailableError as e:
+        raise HTTPException(status_code=503, detail=f"Node registry unavailable: {str(e)}")
+    return describe(node, time.time())
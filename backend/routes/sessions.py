@@ -1,12 +1,27 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from typing import List
-from pydantic import BaseModel
+from sqlalchemy import select, tuple_
+from typing import AsyncIterator, List, Literal
+from pydantic import BaseModel, Field
 from datetime import datetime, timedelta
+import csv
+import io
+import json
 import uuid
 
-from database import get_db, Session
+from config import settings
+from database import get_db, get_read_db, on_commit, read_session, transaction, Session
+from services.events import event_bus
+from services.launch_specs import LaunchSpecError, launch_specs
+from services.launcher import launch_application
+from services.metrics import ACTIVE_SESSIONS
+from services.scheduler import node_scheduler
+from services.session_reaper import session_reaper
+from services.slots import SlotUnavailableError, slot_allocator
+from services.warm_pool import warm_pool
+from services.wine_processes import session_prefix, teardown_session
+from services.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
 
 router = APIRouter()
 
@@ -23,7 +38,7 @@ class SessionResponse(BaseModel):
     user_id: str | None
     vnc_port: int | None
     status: str
-    metadata: dict | None
+    metadata: dict | None = Field(None, validation_alias="session_metadata")
     created_at: datetime
     expires_at: datetime | None
     
@@ -39,40 +54,171 @@ async def create_session(
     session_id = str(uuid.uuid4())
     expires_at = datetime.utcnow() + timedelta(minutes=session_data.duration_minutes)
     
+    metadata = {"duration_minutes": session_data.duration_minutes}
+    environment = None
+    try:
+        if session_data.application_id is not None:
+            # Only warm environments on nodes that still take sessions (not drained or down)
+            environment = warm_pool.claim(session_data.application_id, await node_scheduler.schedulable())
+        if environment:
+            reassigned = False
+            try:
+                reassigned = await slot_allocator.reassign(environment.slot.index, environment.holder, session_id)
+            finally:
+                if not reassigned:
+                    # Lease reclaimed in the meantime (or unknown): the claimed environment's
+                    # daemons are ours to stop, an unreleased lease is left to the slot sweeper
+                    await teardown_session(f"warm:{environment.app_id}", environment.to_metadata())
+                    environment = None
+        slot = environment.slot if environment else await node_scheduler.allocate(session_id, session_data.application_id)
+    except SlotUnavailableError as e:
+        raise HTTPException(status_code=503, detail=f"Slot store unavailable: {str(e)}")
+    if slot is None:
+        raise HTTPException(status_code=503, detail="No schedulable Wine node has a free display slot, try again later")
+    
+    if environment:
+        metadata.update(environment.to_metadata(), prepared=True)
+    else:
+        metadata.update(slot.to_metadata(), prepared=False)
+        if session_data.application_id is not None:
+            metadata["wine_prefix"] = session_prefix(session_data.application_id, slot.index)
+    
     db_session = Session(
         session_id=session_id,
         application_id=session_data.application_id,
         user_id=session_data.user_id,
         status="active",
-        vnc_port=5900,
+        vnc_port=slot.vnc_port,
         expires_at=expires_at,
-        metadata={"duration_minutes": session_data.duration_minutes}
+        session_metadata=metadata
     )
     
-    db.add(db_session)
-    await db.commit()
-    await db.refresh(db_session)
+    try:
+        async with transaction(db):
+            db.add(db_session)
+            await db.flush()
+    except Exception:
+        await slot_allocator.release(slot.index, session_id)
+        raise
+    ACTIVE_SESSIONS.inc()
+    event_bus.publish(f"session.{session_id}", "created", {
+        "session_id": session_id,
+        "application_id": db_session.application_id,
+        "vnc_port": db_session.vnc_port,
+        "display": metadata["display"],
+    })
     return db_session
 
 @router.get("/", response_model=List[SessionResponse])
 async def list_sessions(
+    response: Response,
     status: str | None = None,
-    db: AsyncSession = Depends(get_db)
+    user_id: str | None = None,
+    cursor: str | None = None,
+    limit: int = Query(100, ge=1, le=500),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """List all sessions"""
-    query = select(Session)
+    """List sessions, newest first
+    
+    Pages are keyed on (created_at, id); pass the X-Next-Cursor header of one
+    page as ``cursor`` to fetch the next.
+    """
+    query = (
+        select(Session)
+        .order_by(Session.created_at.desc(), Session.id.desc())
+        .limit(limit)
+    )
     
     if status:
         query = query.where(Session.status == status)
+    if user_id:
+        query = query.where(Session.user_id == user_id)
+    if cursor:
+        created_at, last_id = decode_cursor(cursor, datetime, int)
+        query = query.where(tuple_(Session.created_at, Session.id) < (created_at, last_id))
     
     result = await db.execute(query)
     sessions = result.scalars().all()
+    if len(sessions) == limit:
+        last = sessions[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last.created_at, last.id)
     return sessions
 
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+async def stream_session_export(query, export_format: str) -> AsyncIterator[str]:
+    """Yield the export one server-side cursor batch at a time
+    
+    Each batch is only fetched once the previous chunk has been sent, so a
+    slow client pauses the cursor instead of growing memory.
+    """
+    fields = list(SessionResponse.model_fields)
+    if export_format == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(fields)
+        yield buffer.getvalue()
+    
+    # Server-side cursors need a transaction, so opt out of autocommit reads
+    async with read_session(info={"autocommit": False}) as db:
+        result = await db.stream_scalars(
+            query.execution_options(yield_per=settings.SESSION_EXPORT_BATCH_SIZE)
+        )
+        async for batch in result.partitions():
+            rows = [SessionResponse.model_validate(row) for row in batch]
+            if export_format == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                for row in rows:
+                    data = row.model_dump(mode="json")
+                    data["metadata"] = json.dumps(data["metadata"]) if data["metadata"] is not None else ""
+                    writer.writerow([data[field] for field in fields])
+                yield buffer.getvalue()
+            else:
+                yield "".join(row.model_dump_json() + "\n" for row in rows)
+
+@router.get("/export")
+async def export_sessions(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    status: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None
+):
+    """Stream session history as NDJSON (default) or CSV"""
+    query = select(Session).order_by(Session.created_at, Session.id)
+    
+    if status:
+        query = query.where(Session.status == status)
+    if start:
+        query = query.where(Session.created_at >= start)
+    if end:
+        query = query.where(Session.created_at < end)
+    
+    return StreamingResponse(
+        stream_session_export(query, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="sessions.{format}"'}
+    )
+
+@router.get("/reaper/stats")
+async def get_reaper_stats():
+    """Get statistics for the background session expiry task"""
+    return session_reaper.stats
+
+@router.get("/slots/stats")
+async def get_slot_stats():
+    """Get free and leased display/VNC slot counts"""
+    try:
+        return await slot_allocator.stats()
+    except SlotUnavailableError as e:
+        raise HTTPException(status_code=503, detail=f"Slot store unavailable: {str(e)}")
+
 @router.get("/{session_id}", response_model=SessionResponse)
 async def get_session(
     session_id: str,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get session by ID"""
     result = await db.execute(
@@ -85,6 +231,51 @@ async def get_session(
     
     return session
 
+@router.post("/{session_id}/launch")
+async def launch_session_application(
+    session_id: str,
+    db: AsyncSession = Depends(get_db)
+):
+    """Launch the session's application on its display"""
+    result = await db.execute(
+        select(Session).where(Session.session_id == session_id)
+    )
+    session = result.scalar_one_or_none()
+    
+    if not session or session.status != "active":
+        raise HTTPException(status_code=404, detail="Active session not found")
+    if session.application_id is None:
+        raise HTTPException(status_code=400, detail="Session has no application")
+    display = (session.session_metadata or {}).get("display")
+    if not display:
+        raise HTTPException(status_code=409, detail="Session has no display slot to launch on")
+    
+    try:
+        spec = await launch_specs.get(session.application_id)
+    except LaunchSpecError as e:
+        raise HTTPException(status_code=422, detail=f"Application cannot be launched: {str(e)}")
+    if spec is None:
+        raise HTTPException(status_code=404, detail="Application not found")
+    
+    try:
+        launch = await launch_application(session, spec)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to launch {spec.name}: {str(e)}")
+    on_commit(db, lambda: event_bus.publish(f"session.{session_id}", "launched", {
+        "session_id": session_id,
+        "application_id": spec.app_id,
+        **launch
+    }))
+    
+    return {
+        "success": True,
+        "session_id": session_id,
+        "application": spec.name,
+        "display": display,
+        "vnc_url": f"vnc://localhost:{session.vnc_port}",
+        **launch
+    }
+
 @router.delete("/{session_id}")
 async def terminate_session(
     session_id: str,
@@ -99,6 +290,12 @@ async def terminate_session(
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    session.status = "terminated"
-    await db.commit()
+    was_active = session.status == "active"
+    async with transaction(db):
+        session.status = "terminated"
+    await teardown_session(session.session_id, session.session_metadata)
+    if was_active:
+        ACTIVE_SESSIONS.dec()
+        await slot_allocator.release_for(session.session_id, session.session_metadata)
+    event_bus.publish(f"session.{session_id}", "terminated", {"session_id": session_id})
     return {"message": "Session terminated successfully"}
@@ -0,0 +1,197 @@
+"""
+Read-through response cache for the applications catalog.
+
+Entries are stored in Redis with a TTL so every replica shares them. Writes
+to the catalog call ``invalidate()`` which drops the item key plus every
+cached list page. When Redis is unreachable an in-process LRU takes over;
+its entries expire after the same TTL, since other replicas' writes cannot
+invalidate them.
+"""
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+from fastapi import Request, Response
+from redis.exceptions import RedisError
+
+from config import settings
+from services.redis_pool import get_redis, mark_redis_down, redis_available
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """Small in-process LRU (the catalog's fallback when Redis is unavailable)
+
+    With ``ttl`` entries older than that many seconds are treated as misses.
+    """
+
+    def __init__(self, max_size: int, ttl: float | None = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        # key -> (value, monotonic expiry or None)
+        self._data: OrderedDict[str, Tuple[Any, float | None]] = OrderedDict()
+
+    def get(self, key: str) -> Any | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def delete(self, *keys: str):
+        for key in keys:
+            self._data.pop(key, None)
+
+    def delete_prefix(self, prefix: str):
+        for key in [k for k in self._data if k.startswith(prefix)]:
+            del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ByteLRUCache(LRUCache):
+    """LRU over bytes values, bounded by their total size rather than count"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(max_size=0)
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+
+    def set(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        self.delete(key)
+        self._data[key] = (value, None)
+        self.size_bytes += len(value)
+        while self.size_bytes > self.max_bytes:
+            _, (evicted, _) = self._data.popitem(last=False)
+            self.size_bytes -= len(evicted)
+
+    def delete(self, *keys: str):
+        for key in keys:
+            entry = self._data.pop(key, None)
+            if entry is not None:
+                self.size_bytes -= len(entry[0])
+
+    def delete_prefix(self, prefix: str):
+        self.delete(*[k for k in self._data if k.startswith(prefix)])
+
+
+class CatalogCache:
+    """TTL cache for serialized catalog responses with ETags"""
+
+    def __init__(self, namespace: str = "catalog", ttl: int | None = None, lru_size: int | None = None):
+        self.namespace = namespace
+        self.ttl = ttl or settings.CATALOG_CACHE_TTL
+        self.local = LRUCache(lru_size or settings.CATALOG_CACHE_LRU_SIZE, ttl=self.ttl)
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "redis_errors": 0}
+
+    def item_key(self, app_id: int) -> str:
+        return f"{self.namespace}:app:{app_id}"
+
+    def list_key(self, *params) -> str:
+        return f"{self.namespace}:list:" + ":".join(str(p) for p in params)
+
+    @property
+    def list_index_key(self) -> str:
+        return f"{self.namespace}:lists"
+
+    @staticmethod
+    def make_etag(body: bytes) -> str:
+        return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+    def _on_redis_error(self, error: RedisError):
+        self.stats["redis_errors"] += 1
+        mark_redis_down(error)
+
+    async def get(self, key: str) -> Tuple[str, bytes, Dict[str, str]] | None:
+        """Return (etag, body, headers) for a cached entry"""
+        value = None
+        if redis_available():
+            try:
+                value = await get_redis().get(key)
+            except RedisError as e:
+                self._on_redis_error(e)
+                value = self.local.get(key)
+        else:
+            value = self.local.get(key)
+
+        if value is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        meta, _, body = value.partition(b"\n")
+        meta = json.loads(meta)
+        return meta["etag"], body, meta["headers"]
+
+    async def set(self, key: str, body: bytes, headers: Dict[str, str] | None = None) -> str:
+        """Store a response body (plus extra response headers) and return its ETag"""
+        etag = self.make_etag(body)
+        value = json.dumps({"etag": etag, "headers": headers or {}}).encode() + b"\n" + body
+        if redis_available():
+            try:
+                async with get_redis().pipeline(transaction=False) as pipe:
+                    pipe.set(key, value, ex=self.ttl)
+                    if key.startswith(self.list_key()):
+                        pipe.sadd(self.list_index_key, key)
+                        pipe.expire(self.list_index_key, self.ttl)
+                    await pipe.execute()
+                return etag
+            except RedisError as e:
+                self._on_redis_error(e)
+        self.local.set(key, value)
+        return etag
+
+    async def invalidate(self, *app_ids: int):
+        """Drop the given cached items and every cached list page"""
+        self.stats["invalidations"] += 1
+        item_keys = [self.item_key(app_id) for app_id in app_ids]
+        self.local.delete(*item_keys)
+        self.local.delete_prefix(self.list_key())
+        if not redis_available():
+            return
+        try:
+            client = get_redis()
+            list_keys = await client.smembers(self.list_index_key)
+            await client.delete(self.list_index_key, *list_keys, *item_keys)
+        except RedisError as e:
+            self._on_redis_error(e)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match already covers ``etag``"""
+    if_none_match = request.headers.get("if-none-match", "")
+    return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+
+
+def etag_response(
+    request: Request,
+    etag: str,
+    body: bytes,
+    headers: Dict[str, str] | None = None,
+    media_type: str = "application/json"
+) -> Response:
+    """Build a response (JSON by default), answering 304 when the client already has this ETag"""
+    headers = {**(headers or {}), "ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+catalog_cache = CatalogCache()
@@ -0,0 +1,174 @@
+"""
+Bulk catalog loader.
+
+Reads a JSON or YAML manifest of applications and upserts them keyed on the
+unique application name with ``INSERT ... ON CONFLICT (name) DO UPDATE``, a
+few hundred rows per statement, all in one transaction. Rows whose content
+did not change are left untouched (the conflict update has a ``WHERE ... IS
+DISTINCT FROM`` guard), so re-loading a manifest only rewrites what changed.
+
+Also usable from the command line::
+
+    python -m services.catalog games.yaml [--dry-run]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+
+import yaml
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from redis.exceptions import RedisError
+from sqlalchemy import literal_column, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from database import Application, async_session, engine
+from services.cache import catalog_cache
+from services.launch_specs import publish_application_changed
+from services.redis_pool import close_redis
+
+logger = logging.getLogger(__name__)
+
+# Columns a manifest entry may set; anything else on the row is server-managed
+CATALOG_COLUMNS = ("executable_path", "description", "icon_url", "wine_config", "is_active")
+
+
+class CatalogError(ValueError):
+    """Raised for manifests that cannot be parsed or validated"""
+
+
+class CatalogEntry(BaseModel):
+    name: str
+    executable_path: str
+    description: str | None = None
+    icon_url: str | None = None
+    wine_config: Dict[str, Any] | None = None
+    is_active: bool = True
+
+
+catalog_entries_adapter = TypeAdapter(List[CatalogEntry])
+
+
+def parse_manifest(text: str | bytes, fmt: str = "json") -> List[CatalogEntry]:
+    """Parse a manifest: a list of entries or ``{"applications": [...]}``"""
+    try:
+        data = yaml.safe_load(text) if fmt == "yaml" else json.loads(text)
+    except (ValueError, yaml.YAMLError) as e:
+        raise CatalogError(f"Invalid {fmt} manifest: {e}") from e
+    if isinstance(data, dict):
+        data = data.get("applications")
+    if not isinstance(data, list):
+        raise CatalogError("Manifest must be a list of applications or contain an 'applications' list")
+    try:
+        return catalog_entries_adapter.validate_python(data)
+    except ValidationError as e:
+        raise CatalogError(str(e)) from e
+
+
+def load_manifest_file(path: str | Path) -> List[CatalogEntry]:
+    path = Path(path)
+    fmt = "yaml" if path.suffix.lower() in (".yaml", ".yml") else "json"
+    return parse_manifest(path.read_text(), fmt)
+
+
+def upsert_statement(rows: List[Dict[str, Any]]):
+    """One multi-row upsert that only rewrites rows whose content changed"""
+    stmt = insert(Application).values(rows)
+    excluded = stmt.excluded
+    changed = or_(*(
+        getattr(Application, column).is_distinct_from(getattr(excluded, column)) for column in CATALOG_COLUMNS
+    ))
+    return stmt.on_conflict_do_update(
+        index_elements=[Application.name],
+        set_={**{column: getattr(excluded, column) for column in CATALOG_COLUMNS}, "updated_at": excluded.updated_at},
+        where=changed,
+    ).returning(Application.id, literal_column("(xmax = 0)").label("inserted"))
+
+
+async def upsert_applications(
+    db: AsyncSession,
+    entries: List[CatalogEntry],
+    batch_size: int | None = None
+) -> Dict[str, Any]:
+    """Upsert entries by name; the caller commits. Returns counts and changed ids"""
+    # A single statement may not touch the same row twice, so the last entry per name wins
+    by_name = {entry.name: entry for entry in entries}
+    now = datetime.utcnow()
+    rows = [{**entry.model_dump(), "created_at": now, "updated_at": now} for entry in by_name.values()]
+    batch_size = batch_size or settings.CATALOG_BULK_BATCH_SIZE
+
+    inserted: List[int] = []
+    updated: List[int] = []
+    for start in range(0, len(rows), batch_size):
+        result = await db.execute(upsert_statement(rows[start:start + batch_size]))
+        for app_id, was_inserted in result:
+            (inserted if was_inserted else updated).append(app_id)
+
+    return {
+        "total": len(entries),
+        "duplicates": len(entries) - len(rows),
+        "inserted": len(inserted),
+        "updated": len(updated),
+        "unchanged": len(rows) - len(inserted) - len(updated),
+        "changed_ids": inserted + updated,
+    }
+
+
+async def load_catalog(entries: List[CatalogEntry], dry_run: bool = False) -> Dict[str, Any]:
+    """Upsert entries in one transaction and invalidate the catalog cache and launch specs
+
+    Meant for command-line loads: the launch spec invalidation is published to
+    Redis directly, as the event bus is not running there.
+    """
+    async with async_session() as db:
+        report = await upsert_applications(db, entries)
+        if dry_run:
+            await db.rollback()
+        else:
+            await db.commit()
+    if not dry_run and report["changed_ids"]:
+        await catalog_cache.invalidate(*report["changed_ids"])
+        try:
+            await publish_application_changed(*report["changed_ids"])
+        except RedisError as e:
+            logger.warning(f"Could not broadcast launch spec invalidation, replicas refresh within LAUNCH_SPEC_TTL: {e}")
+    return report
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Load a JSON/YAML application manifest into the catalog")
+    parser.add_argument("manifest", nargs="+", help="manifest file(s) (.json, .yaml or .yml)")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change, then roll back")
+    args = parser.parse_args(argv)
+
+    try:
+        entries = [entry for path in args.manifest for entry in load_manifest_file(path)]
+    except (OSError, CatalogError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+
+    async def run():
+        try:
+            return await load_catalog(entries, dry_run=args.dry_run)
+        finally:
+            await close_redis()
+            await engine.dispose()
+
+    report = asyncio.run(run())
+    prefix = "🧪 Dry run: " if args.dry_run else "✅ "
+    print(
+        f"{prefix}{report['total']} entries: {report['inserted']} inserted, "
+        f"{report['updated']} updated, {report['unchanged']} unchanged"
+        + (f", {report['duplicates']} duplicate names skipped" if report["duplicates"] else "")
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+Streaming relay for Wine commands.
+
+``POST /api/emulator/execute?stream=true`` forwards the command to the Wine
+service's ``/api/execute/stream``, which answers with NDJSON messages::
+
+    {"type": "started", "id": "<execution id>"}
+    {"stream": "stdout", "data": "..."}
+    {"stream": "stderr", "data": "..."}
+    {"type": "exit", "exit_code": 0}
+
+(a plain-text body is relayed as stdout), and relays them to the client as
+Server-Sent Events: ``stdout`` / ``stderr`` events with the new output,
+``dropped`` when output was discarded, and a final ``exit`` (preceded by
+``error`` when the command could not run to completion).
+
+Upstream output is read continuously into one buffer per stream capped at
+``WINE_EXECUTE_STREAM_BUFFER_BYTES``; if the client reads slower than the
+process writes, the oldest pending output is dropped (and reported) rather
+than stalling the process or growing memory. When the client disconnects the
+upstream request is aborted and the execution is cancelled on the Wine
+service.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Set, Tuple
+
+import httpx
+
+from config import settings
+from services.wine_client import WineServiceClient, wine_client
+
+logger = logging.getLogger(__name__)
+
+STREAMS = ("stdout", "stderr")
+
+# Cancellation requests outlive the response that triggered them
+_background: Set[asyncio.Task] = set()
+
+
+class OutputBuffer:
+    """Output not yet sent to the client, capped at max_bytes characters (oldest dropped first)"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.chunks: Deque[str] = deque()
+        self.size = 0
+        self.pending_dropped = 0
+        self.total_dropped = 0
+
+    def append(self, text: str):
+        if not text:
+            return
+        if len(text) > self.max_bytes:
+            self._drop(len(text) - self.max_bytes)
+            text = text[-self.max_bytes:]
+        while self.chunks and self.size + len(text) > self.max_bytes:
+            chunk = self.chunks.popleft()
+            self.size -= len(chunk)
+            self._drop(len(chunk))
+        self.chunks.append(text)
+        self.size += len(text)
+
+    def _drop(self, count: int):
+        self.pending_dropped += count
+        self.total_dropped += count
+
+    def take(self) -> Tuple[str, int]:
+        """Pending output and how much was dropped since the last take"""
+        text, dropped = "".join(self.chunks), self.pending_dropped
+        self.chunks.clear()
+        self.size = 0
+        self.pending_dropped = 0
+        return text, dropped
+
+
+def sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class CommandStream:
+    """One streamed command execution"""
+
+    def __init__(
+        self,
+        payload: Dict[str, Any],
+        client: WineServiceClient | None = None,
+        buffer_bytes: int | None = None,
+        heartbeat: float | None = None
+    ):
+        self.payload = payload
+        self.client = client or wine_client
+        self.max_line = (buffer_bytes or settings.WINE_EXECUTE_STREAM_BUFFER_BYTES) * 2
+        self.heartbeat = heartbeat or settings.WINE_EXECUTE_STREAM_HEARTBEAT
+        self.buffers = {name: OutputBuffer(buffer_bytes or settings.WINE_EXECUTE_STREAM_BUFFER_BYTES) for name in STREAMS}
+        self.execution_id: str | None = None
+        self.exit_code: int | None = None
+        self.error: str | None = None
+        self.done = False
+        self._changed = asyncio.Event()
+
+    def _write(self, name: str, text: str):
+        self.buffers[name if name in self.buffers else "stdout"].append(text)
+        self._changed.set()
+
+    def _handle(self, line: bytes):
+        text = line.decode(errors="replace")
+        if not text.strip():
+            return
+        try:
+            message = json.loads(text)
+        except ValueError:
+            message = None
+        if not isinstance(message, dict):
+            self._write("stdout", text + "\n")
+            return
+        if message.get("type") == "started":
+            self.execution_id = message.get("id") or self.execution_id
+        if "exit_code" in message:
+            self.exit_code = message["exit_code"]
+        if "data" in message:
+            self._write(message.get("stream", "stdout"), message["data"])
+        if message.get("type") == "error":
+            self.error = message.get("error") or message.get("detail") or "Command failed"
+
+    async def _read_lines(self, response: httpx.Response):
+        """Split NDJSON without letting a runaway line grow unbounded"""
+        partial = b""
+        async for chunk in response.aiter_bytes():
+            *lines, partial = (partial + chunk).split(b"\n")
+            for line in lines:
+                self._handle(line)
+            if len(partial) > self.max_line:
+                raise ValueError(f"Wine service sent a line longer than {self.max_line} bytes")
+        if partial:
+            self._handle(partial)
+
+    async def _pump(self):
+        try:
+            async with self.client.stream("POST", "/api/execute/stream", json=self.payload) as response:
+                self.execution_id = response.headers.get("x-execution-id")
+                if response.status_code != 200:
+                    await response.aread()
+                    self.error = f"Wine service answered {response.status_code}"
+                    return
+                if "json" in response.headers.get("content-type", ""):
+                    await self._read_lines(response)
+                else:
+                    async for text in response.aiter_text():
+                        self._write("stdout", text)
+        except (httpx.HTTPError, ValueError) as e:
+            self.error = str(e) or type(e).__name__
+        finally:
+            self.done = True
+            self._changed.set()
+
+    async def _cancel_remote(self):
+        try:
+            await self.client.request(
+                "DELETE", f"/api/execute/{self.execution_id}", retry=False, route="/api/execute/{id}"
+            )
+        except httpx.HTTPError as e:
+            logger.warning(f"Could not cancel execution {self.execution_id}: {e}")
+
+    async def events(self) -> AsyncIterator[str]:
+        """SSE events until the command exits; closing the iterator cancels it"""
+        pump = asyncio.create_task(self._pump())
+        started = time.perf_counter()
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                self._changed.clear()
+                # Read before draining: output can arrive while we yield below
+                done = self.done
+                for name, buffer in self.buffers.items():
+                    text, dropped = buffer.take()
+                    if dropped:
+                        yield sse("dropped", {"stream": name, "bytes": dropped})
+                    if text:
+                        yield sse(name, {"data": text})
+                if done:
+                    break
+            if self.error:
+                yield sse("error", {"detail": self.error})
+            yield sse("exit", {
+                "exit_code": self.exit_code,
+                "success": self.error is None and self.exit_code in (0, None),
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                "dropped": {name: buffer.total_dropped for name, buffer in self.buffers.items()},
+            })
+        finally:
+            if not pump.done():
+                # Aborting the upstream request closes its connection
+                pump.cancel()
+                if self.execution_id:
+                    task = asyncio.create_task(self._cancel_remote())
+                    _background.add(task)
+                    task.add_done_callback(_background.discard)
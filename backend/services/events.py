@@ -0,0 +1,185 @@
+"""
+Real-time event bus.
+
+Publishers call ``event_bus.publish(topic, type, data)``, which never blocks:
+events go to an outbox that a background task flushes to Redis pub/sub in
+pipelined batches. Every replica listens on ``events:*`` and fans events out
+to its local subscribers, so a WebSocket client sees events raised on any
+replica. While Redis is unreachable events are delivered locally only.
+
+Topics are dotted (``session.<id>``, ``launch.<job id>``, ``health``); a
+subscription to ``session`` also receives ``session.<id>``. Each subscriber
+has a bounded queue and is dropped as soon as it falls behind, so one slow
+client never holds up the others.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Set
+
+from redis.exceptions import ConnectionError as RedisConnectionError, RedisError, TimeoutError as RedisTimeoutError
+
+from config import settings
+from services.redis_pool import get_pubsub_redis, get_redis, mark_redis_down, redis_available
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "events:"
+PUBLISH_BATCH_SIZE = 100
+# How long one read on the subscription waits for a message
+LISTEN_POLL_INTERVAL = 1.0
+
+
+class Subscription:
+    """A subscriber's topic filter and bounded event queue"""
+
+    def __init__(self, topics: Iterable[str] = (), max_queue: int | None = None):
+        self.topics: Set[str] = set(topics)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue or settings.EVENT_QUEUE_SIZE)
+        self.dropped = False
+
+    def matches(self, topic: str) -> bool:
+        return any(topic == t or topic.startswith(t + ".") for t in self.topics)
+
+    def offer(self, event: Dict[str, Any]) -> bool:
+        """Queue an event; returns False (and marks the subscriber dropped) when full"""
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            self.dropped = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"topic": "system", "type": "dropped", "data": {"reason": "slow consumer"}})
+            return False
+
+
+class EventBus:
+    """Pub/sub fan-out across replicas via Redis, with local fallback"""
+
+    def __init__(self):
+        self.subscriptions: Set[Subscription] = set()
+        self._outbox: asyncio.Queue | None = None
+        self._tasks: List[asyncio.Task] = []
+        self._listening = False
+        self.stats = {"published": 0, "delivered": 0, "dropped_events": 0, "dropped_subscribers": 0, "malformed": 0}
+
+    def subscribe(self, topics: Iterable[str] = ()) -> Subscription:
+        subscription = Subscription(topics)
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self.subscriptions.discard(subscription)
+
+    def publish(self, topic: str, event_type: str, data: Dict[str, Any] | None = None):
+        """Queue an event for delivery without waiting on Redis"""
+        event = self._event(topic, event_type, data)
+        if self._outbox is None:
+            self._deliver(event)
+            return
+        try:
+            self._outbox.put_nowait(event)
+        except asyncio.QueueFull:
+            self.stats["dropped_events"] += 1
+
+    async def publish_direct(self, topic: str, event_type: str, data: Dict[str, Any] | None = None):
+        """Publish straight to Redis and wait for it
+
+        For processes that never start the bus, such as command-line tools, so
+        the event still reaches every replica. Raises ``RedisError``.
+        """
+        event = self._event(topic, event_type, data)
+        await get_redis().publish(CHANNEL_PREFIX + topic, json.dumps(event, default=str))
+        self.stats["published"] += 1
+
+    @staticmethod
+    def _event(topic: str, event_type: str, data: Dict[str, Any] | None) -> Dict[str, Any]:
+        return {"topic": topic, "type": event_type, "data": data or {}, "ts": time.time()}
+
+    def _deliver(self, event: Dict[str, Any]):
+        for subscription in list(self.subscriptions):
+            if not subscription.matches(event["topic"]):
+                continue
+            if subscription.offer(event):
+                self.stats["delivered"] += 1
+            else:
+                self.stats["dropped_subscribers"] += 1
+                self.subscriptions.discard(subscription)
+
+    async def _publisher(self):
+        while True:
+            batch = [await self._outbox.get()]
+            while len(batch) < PUBLISH_BATCH_SIZE and not self._outbox.empty():
+                batch.append(self._outbox.get_nowait())
+            self.stats["published"] += len(batch)
+            if self._listening and redis_available():
+                try:
+                    async with get_redis().pipeline(transaction=False) as pipe:
+                        for event in batch:
+                            pipe.publish(CHANNEL_PREFIX + event["topic"], json.dumps(event, default=str))
+                        await pipe.execute()
+                    continue
+                except RedisError as e:
+                    mark_redis_down(e)
+            for event in batch:
+                self._deliver(event)
+
+    def _receive(self, data: bytes | str):
+        """Deliver one event from Redis; a malformed one is logged and skipped"""
+        try:
+            event = json.loads(data)
+        except ValueError as e:
+            event, error = None, e
+        else:
+            error = "not an object with a string topic"
+        if not isinstance(event, dict) or not isinstance(event.get("topic"), str):
+            self.stats["malformed"] += 1
+            logger.warning(f"Ignoring malformed event from Redis: {error}")
+            return
+        self._deliver(event)
+
+    async def _listener(self):
+        while True:
+            if not redis_available():
+                await asyncio.sleep(settings.REDIS_RETRY_INTERVAL)
+                continue
+            pubsub = get_pubsub_redis().pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(CHANNEL_PREFIX + "*")
+                self._listening = True
+                while True:
+                    try:
+                        message = await pubsub.get_message(
+                            ignore_subscribe_messages=True, timeout=LISTEN_POLL_INTERVAL
+                        )
+                    except RedisTimeoutError:
+                        # Nothing published lately
+                        continue
+                    if message and message["type"] == "pmessage":
+                        self._receive(message["data"])
+            except (RedisConnectionError, OSError) as e:
+                mark_redis_down(e)
+            except RedisError as e:
+                # The server is reachable; resubscribe without failing over every other user of Redis
+                logger.warning(f"Event subscription failed, resubscribing: {e}")
+                await asyncio.sleep(1)
+            finally:
+                self._listening = False
+                await pubsub.aclose()
+
+    def start(self):
+        if not self._tasks:
+            self._outbox = asyncio.Queue(maxsize=settings.EVENT_OUTBOX_SIZE)
+            self._tasks = [asyncio.create_task(self._publisher()), asyncio.create_task(self._listener())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._outbox = None
+
+
+event_bus = EventBus()
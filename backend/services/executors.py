@@ -0,0 +1,328 @@
+"""
+Pluggable command execution inside the Wine containers.
+
+Every command is an argv list, never a shell string. ``EXECUTOR_BACKEND``
+selects how it runs:
+
+- ``docker``: the Docker Engine API over the daemon's unix socket (exec
+  create + start), through one pooled keep-alive client. Output is read from
+  the attached, multiplexed stdout/stderr stream. No process is forked.
+- ``cli``: ``docker exec`` as a subprocess with an argv list.
+- ``local``: the argv directly on this host (the backend shares the Wine
+  container); the container name is ignored.
+- ``fake``: records calls and replays canned results, for tests.
+
+Output is handed to an optional ``on_output(stream, chunk)`` callback as it
+arrives. Cancelling a run stops exactly the process it started: attached
+container commands run under a small ``sh`` wrapper that records the
+command's pid (in the container's namespace, unlike the host pid Docker
+reports for an exec) in a pid file, and cancellation signals that pid.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Tuple
+
+import httpx
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+OutputCallback = Callable[[str, bytes], None]
+
+READ_CHUNK_SIZE = 4096
+# Attached exec streams prefix each frame with stream type (1 stdout, 2 stderr) and length
+FRAME_HEADER_SIZE = 8
+
+# argv is passed as positional arguments, never interpolated; $0 is the pid file
+PID_WRAPPER = '"$@" & echo $! > "$0"; wait $!; status=$?; rm -f "$0"; exit $status'
+KILL_SCRIPT = 'kill -TERM "$(cat "$0")" 2>/dev/null'
+
+
+class ExecutorError(OSError):
+    """Raised when a command cannot be started (container or daemon unavailable)"""
+
+
+def tracked(argv: List[str]) -> Tuple[List[str], str]:
+    """Wrap a container command so its pid can be signalled later; returns (argv, pid file)"""
+    pid_file = f"/tmp/exec-{uuid.uuid4().hex}.pid"
+    return ["sh", "-c", PID_WRAPPER, pid_file, *argv], pid_file
+
+
+def kill_command(pid_file: str) -> List[str]:
+    return ["sh", "-c", KILL_SCRIPT, pid_file]
+
+
+class Executor:
+    """Runs an argv in a container as the Wine user and returns its exit code
+
+    With ``detach=True`` the call returns 0 as soon as the process started.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self.stats = {"runs": 0, "detached": 0, "failures": 0, "cancelled": 0}
+
+    async def run(
+        self,
+        container: str,
+        argv: List[str],
+        env: Dict[str, str] | None = None,
+        workdir: str | None = None,
+        user: str | None = None,
+        detach: bool = False,
+        on_output: OutputCallback | None = None,
+    ) -> int:
+        self.stats["runs"] += 1
+        if detach:
+            self.stats["detached"] += 1
+        try:
+            return await self._run(container, list(argv), env or {}, workdir, user or settings.WINE_USER, detach, on_output)
+        except asyncio.CancelledError:
+            self.stats["cancelled"] += 1
+            raise
+        except OSError:
+            self.stats["failures"] += 1
+            raise
+
+    async def _run(self, container, argv, env, workdir, user, detach, on_output) -> int:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"backend": self.name, **self.stats}
+
+
+class DockerEngineExecutor(Executor):
+    """Docker Engine API over a persistent unix-socket connection pool"""
+
+    name = "docker"
+
+    def __init__(self, socket_path: str | None = None, transport: httpx.AsyncBaseTransport | None = None):
+        super().__init__()
+        self.socket_path = socket_path or settings.DOCKER_SOCKET
+        self._transport = transport
+        self._client: httpx.AsyncClient | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=f"http://docker/{settings.DOCKER_API_VERSION}",
+                transport=self._transport or httpx.AsyncHTTPTransport(uds=self.socket_path),
+                timeout=httpx.Timeout(settings.DOCKER_API_TIMEOUT),
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _call(self, method: str, path: str, **kwargs) -> httpx.Response:
+        try:
+            response = await self.client.request(method, path, **kwargs)
+        except httpx.TransportError as e:
+            raise ExecutorError(f"Docker daemon unreachable at {self.socket_path}: {e}") from e
+        if response.status_code >= 400:
+            raise ExecutorError(f"Docker API {method} {path} answered {response.status_code}: {response.text.strip()}")
+        return response
+
+    async def _exec(self, container: str, argv: List[str], user: str, detach: bool, **options) -> str:
+        created = await self._call("POST", f"/containers/{container}/exec", json={
+            "Cmd": argv,
+            "User": user,
+            "AttachStdout": not detach,
+            "AttachStderr": not detach,
+            "Tty": False,
+            **options,
+        })
+        return created.json()["Id"]
+
+    async def _run(self, container, argv, env, workdir, user, detach, on_output) -> int:
+        pid_file = None
+        if not detach:
+            argv, pid_file = tracked(argv)
+        exec_id = await self._exec(
+            container, argv, user, detach,
+            Env=[f"{key}={value}" for key, value in env.items()], WorkingDir=workdir or "",
+        )
+        if detach:
+            await self._call("POST", f"/exec/{exec_id}/start", json={"Detach": True, "Tty": False})
+            return 0
+
+        try:
+            # The attached stream stays open for as long as the process runs
+            async with self.client.stream(
+                "POST", f"/exec/{exec_id}/start", json={"Detach": False, "Tty": False},
+                timeout=httpx.Timeout(settings.DOCKER_API_TIMEOUT, read=None),
+            ) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    raise ExecutorError(f"Docker exec start answered {response.status_code}: {response.text.strip()}")
+                await self._demux(response, on_output)
+        except httpx.TransportError as e:
+            raise ExecutorError(f"Docker exec stream failed: {e}") from e
+        except asyncio.CancelledError:
+            await asyncio.shield(self._kill(exec_id, container, user, pid_file))
+            raise
+
+        inspect = await self._call("GET", f"/exec/{exec_id}/json")
+        exit_code = inspect.json().get("ExitCode")
+        return exit_code if exit_code is not None else -1
+
+    @staticmethod
+    async def _demux(response: httpx.Response, on_output: OutputCallback | None):
+        buffer = b""
+        async for chunk in response.aiter_bytes():
+            buffer += chunk
+            while len(buffer) >= FRAME_HEADER_SIZE:
+                size = int.from_bytes(buffer[4:FRAME_HEADER_SIZE], "big")
+                if len(buffer) < FRAME_HEADER_SIZE + size:
+                    break
+                stream = "stderr" if buffer[0] == 2 else "stdout"
+                payload = buffer[FRAME_HEADER_SIZE:FRAME_HEADER_SIZE + size]
+                buffer = buffer[FRAME_HEADER_SIZE + size:]
+                if on_output and payload:
+                    on_output(stream, payload)
+
+    async def _kill(self, exec_id: str, container: str, user: str, pid_file: str):
+        """Exec processes can't be signalled through the API, so signal the pid the
+        command recorded, as the same user; other sessions' processes are untouched"""
+        try:
+            inspect = (await self._call("GET", f"/exec/{exec_id}/json")).json()
+            if not inspect.get("Running"):
+                return
+            kill_id = await self._exec(container, kill_command(pid_file), user, detach=True)
+            await self._call("POST", f"/exec/{kill_id}/start", json={"Detach": True})
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning(f"Could not stop exec {exec_id}: {e}")
+
+
+class SubprocessExecutor(Executor):
+    """Runs ``docker exec`` (or, with ``local=True``, the argv itself) without a shell
+
+    Cancelling a ``docker exec`` run signals the command inside the container
+    as well, since killing the local docker client leaves it running.
+    """
+
+    def __init__(self, local: bool = False):
+        super().__init__()
+        self.local = local
+        self.name = "local" if local else "cli"
+
+    def _command(self, container, argv, env, workdir, user, detach) -> Tuple[List[str], Dict[str, Any]]:
+        if self.local:
+            return argv, {"env": {**os.environ, **env}, "cwd": workdir}
+        args = ["docker", "exec", "-u", user]
+        if detach:
+            args.append("-d")
+        if workdir:
+            args += ["-w", workdir]
+        for key, value in env.items():
+            args += ["-e", f"{key}={value}"]
+        return [*args, container, *argv], {}
+
+    async def _run(self, container, argv, env, workdir, user, detach, on_output) -> int:
+        pid_file = None
+        if not self.local and not detach:
+            argv, pid_file = tracked(argv)
+        command, options = self._command(container, argv, env, workdir, user, detach)
+        output = asyncio.subprocess.PIPE if on_output and not detach else asyncio.subprocess.DEVNULL
+        process = await asyncio.create_subprocess_exec(
+            *command, stdin=asyncio.subprocess.DEVNULL, stdout=output, stderr=output,
+            start_new_session=self.local and detach, **options
+        )
+        if self.local and detach:
+            return 0
+        try:
+            if output == asyncio.subprocess.PIPE:
+                await asyncio.gather(
+                    self._drain(process.stdout, "stdout", on_output),
+                    self._drain(process.stderr, "stderr", on_output),
+                )
+            return await process.wait()
+        except asyncio.CancelledError:
+            if pid_file is not None and process.returncode is None:
+                await asyncio.shield(self._kill(container, user, pid_file))
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
+
+    async def _kill(self, container: str, user: str, pid_file: str):
+        try:
+            killer = await asyncio.create_subprocess_exec(
+                "docker", "exec", "-u", user, container, *kill_command(pid_file),
+                stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+            )
+            await killer.wait()
+        except OSError as e:
+            logger.warning(f"Could not stop command in {container}: {e}")
+
+    @staticmethod
+    async def _drain(stream: asyncio.StreamReader, name: str, on_output: OutputCallback):
+        while chunk := await stream.read(READ_CHUNK_SIZE):
+            on_output(name, chunk)
+
+
+@dataclass
+class FakeResult:
+    exit_code: int = 0
+    stdout: bytes = b""
+    stderr: bytes = b""
+
+
+@dataclass
+class FakeExecutor(Executor):
+    """Records every call; results are looked up by argv[0] (default: exit 0, no output)"""
+
+    results: Dict[str, FakeResult] = field(default_factory=dict)
+    calls: List[Dict[str, Any]] = field(default_factory=list)
+    name = "fake"
+
+    def __post_init__(self):
+        Executor.__init__(self)
+
+    async def _run(self, container, argv, env, workdir, user, detach, on_output) -> int:
+        self.calls.append({
+            "container": container, "argv": argv, "env": env, "workdir": workdir, "user": user, "detach": detach,
+        })
+        await asyncio.sleep(0)
+        result = self.results.get(argv[0], FakeResult())
+        if on_output and not detach:
+            for name, data in (("stdout", result.stdout), ("stderr", result.stderr)):
+                if data:
+                    on_output(name, data)
+        return 0 if detach else result.exit_code
+
+
+def make_executor(backend: str | None = None) -> Executor:
+    backend = backend or settings.EXECUTOR_BACKEND
+    if backend == "docker":
+        return DockerEngineExecutor()
+    if backend in ("cli", "local"):
+        return SubprocessExecutor(local=backend == "local")
+    if backend == "fake":
+        return FakeExecutor()
+    raise ValueError(f"Unknown EXECUTOR_BACKEND {backend!r} (expected docker, cli, local or fake)")
+
+
+executor: Executor = make_executor()
+
+
+def get_executor() -> Executor:
+    return executor
+
+
+def use_executor(new: Executor) -> Executor:
+    """Swap the process-wide executor (tests, or switching backends at startup)"""
+    global executor
+    previous, executor = executor, new
+    return previous
@@ -0,0 +1,153 @@
+"""
+Dependency health probes with a short-lived cache.
+
+``health_checker.check()`` probes Postgres, Redis, the Wine service and every
+VNC endpoint in parallel, each under ``HEALTH_PROBE_TIMEOUT``. Results are
+cached for ``HEALTH_CACHE_TTL`` seconds and concurrent callers share one
+in-flight round of probes, so frequent k8s probes and UI polling cost at most
+one probe per dependency per TTL. Status changes are published on the
+``health`` event topic.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from sqlalchemy import text
+
+from config import settings
+from database import engine, replica_engines
+from services.events import event_bus
+from services.redis_pool import get_redis
+from services.slots import slot_allocator
+from services.wine_client import wine_client
+
+logger = logging.getLogger(__name__)
+
+# Dependencies the API cannot serve requests without
+CRITICAL_PROBES = {"postgres"}
+
+
+async def probe_postgres() -> Dict[str, Any]:
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+    return {}
+
+
+def probe_replica(replica) -> Callable[[], Awaitable[Dict[str, Any]]]:
+    async def probe() -> Dict[str, Any]:
+        async with replica.connect() as conn:
+            lag = await conn.scalar(text(
+                "SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())"
+            ))
+        return {"replication_lag_s": round(float(lag), 3) if lag is not None else None}
+
+    return probe
+
+
+async def probe_redis() -> Dict[str, Any]:
+    await get_redis().ping()
+    return {}
+
+
+async def probe_wine_service() -> Dict[str, Any]:
+    response = await wine_client.get(settings.WINE_SERVICE_HEALTH_PATH, retry=False)
+    if response.status_code >= 500:
+        raise RuntimeError(f"HTTP {response.status_code}")
+    details = {"http_status": response.status_code}
+    if response.headers.get("content-type", "").startswith("application/json"):
+        details["wine_version"] = response.json().get("wine_version")
+    return details
+
+
+def probe_vnc(host: str, port: int) -> Callable[[], Awaitable[Dict[str, Any]]]:
+    async def probe() -> Dict[str, Any]:
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            # A VNC server greets with its protocol version, e.g. "RFB 003.008"
+            banner = await reader.read(12)
+        finally:
+            writer.close()
+        if not banner.startswith(b"RFB"):
+            raise RuntimeError("not a VNC server")
+        return {"host": host, "port": port, "protocol": banner.decode(errors="replace").strip()}
+
+    return probe
+
+
+class HealthChecker:
+    """Runs dependency probes in parallel and caches the aggregate"""
+
+    def __init__(self, ttl: float | None = None, timeout: float | None = None):
+        self.ttl = settings.HEALTH_CACHE_TTL if ttl is None else ttl
+        self.timeout = timeout or settings.HEALTH_PROBE_TIMEOUT
+        self._result: Dict[str, Any] | None = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def vnc_endpoints(self) -> List[Tuple[str, int]]:
+        endpoints = list(settings.get_vnc_endpoints())
+        try:
+            endpoints += [(slot.container, slot.vnc_port) for slot in await slot_allocator.leased()]
+        except Exception as e:
+            logger.warning(f"Could not list leased slots for VNC probes: {e}")
+        return list(dict.fromkeys(endpoints))
+
+    async def _run_probe(self, probe: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            details = await asyncio.wait_for(probe(), timeout=self.timeout)
+            result = {"status": "up", **details}
+        except asyncio.TimeoutError:
+            result = {"status": "down", "error": f"timed out after {self.timeout}s"}
+        except Exception as e:
+            result = {"status": "down", "error": str(e) or e.__class__.__name__}
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return result
+
+    async def _probe_all(self) -> Dict[str, Any]:
+        probes: Dict[str, Callable[[], Awaitable[Dict[str, Any]]]] = {
+            "postgres": probe_postgres,
+            "redis": probe_redis,
+            "wine_service": probe_wine_service,
+        }
+        for index, replica in enumerate(replica_engines):
+            probes[f"postgres_replica{index}"] = probe_replica(replica)
+        for host, port in await self.vnc_endpoints():
+            probes[f"vnc:{host}:{port}"] = probe_vnc(host, port)
+
+        results = await asyncio.gather(*(self._run_probe(probe) for probe in probes.values()))
+        checks = dict(zip(probes, results))
+        down = {name for name, check in checks.items() if check["status"] != "up"}
+        return {
+            "status": "down" if down & CRITICAL_PROBES else ("degraded" if down else "ok"),
+            "ready": not (down & CRITICAL_PROBES),
+            "checked_at": time.time(),
+            "checks": checks,
+        }
+
+    def _publish_changes(self, previous: Dict[str, Any] | None, current: Dict[str, Any]):
+        before = (previous or {}).get("checks", {})
+        changed = {
+            name: check["status"]
+            for name, check in current["checks"].items()
+            if before.get(name, {}).get("status") != check["status"]
+        }
+        if previous is not None and changed:
+            event_bus.publish("health", "changed", {"status": current["status"], "changed": changed})
+
+    async def check(self, force: bool = False) -> Dict[str, Any]:
+        """Return the cached health report, refreshing it when stale"""
+        if not force and self._result and time.monotonic() - self._checked_at < self.ttl:
+            return self._result
+        async with self._lock:
+            # Another caller may have refreshed while we waited
+            if not force and self._result and time.monotonic() - self._checked_at < self.ttl:
+                return self._result
+            result = await self._probe_all()
+            self._publish_changes(self._result, result)
+            self._result, self._checked_at = result, time.monotonic()
+            return result
+
+
+health_checker = HealthChecker()
@@ -0,0 +1,284 @@
+"""
+Background job subsystem for launches and restarts.
+
+Request handlers submit a job and return its id straight away. Each job runs
+in its own task behind a per-host semaphore, so at most
+``JOB_HOST_CONCURRENCY`` jobs touch one Wine container at a time and the
+rest wait in FIFO order. Process output is drained continuously into
+fixed-size ring buffers, so a chatty process can neither fill its pipe and
+stall nor grow memory, and progress events fan out to WebSocket watchers
+through bounded queues.
+
+Launch jobs only start their program (detached) and finish once it is
+running, so a game never holds a host slot for its lifetime. Jobs submitted
+with ``keep_on_shutdown`` are left to complete when the backend stops
+instead of being cancelled.
+"""
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Set
+
+from config import settings
+from services.events import event_bus
+from services.executors import OutputCallback, get_executor
+from services.metrics import JOB_DURATION
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 256
+# How long shutdown waits for jobs that are not cancelled
+SHUTDOWN_GRACE = 10.0
+
+
+class JobQueueFullError(Exception):
+    """Raised when too many jobs are pending"""
+
+
+class RingBuffer:
+    """Keeps the last N lines of a byte stream
+
+    Lines longer than ``max_line_bytes`` are split, so output that never ends
+    a line (progress bars redrawn with ``\\r``, binary data) stays bounded too.
+    """
+
+    def __init__(self, max_lines: int, max_line_bytes: int | None = None):
+        self.lines: Deque[str] = deque(maxlen=max_lines)
+        self.max_line_bytes = max_line_bytes or settings.JOB_OUTPUT_LINE_BYTES
+        self.total_lines = 0
+        self._partial = b""
+
+    def _split(self, line: bytes) -> List[bytes]:
+        size = self.max_line_bytes
+        return [line[i:i + size] for i in range(0, len(line), size)] or [line]
+
+    def feed(self, chunk: bytes) -> List[str]:
+        """Add a chunk and return the complete lines it finished"""
+        data = self._partial + chunk
+        *complete, self._partial = data.split(b"\n")
+        pieces = [piece for line in complete for piece in self._split(line)]
+        if len(self._partial) > self.max_line_bytes:
+            *overflow, self._partial = self._split(self._partial)
+            pieces += overflow
+        lines = [piece.decode(errors="replace") for piece in pieces]
+        self.lines.extend(lines)
+        self.total_lines += len(lines)
+        return lines
+
+    def flush(self) -> List[str]:
+        if not self._partial:
+            return []
+        return self.feed(b"\n")
+
+    @property
+    def dropped(self) -> int:
+        return self.total_lines - len(self.lines)
+
+    def tail(self) -> List[str]:
+        return list(self.lines)
+
+
+@dataclass
+class Job:
+    kind: str
+    host: str
+    description: str = ""
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    status: str = "queued"
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    exit_code: int | None = None
+    error: str | None = None
+    result: Dict[str, Any] = field(default_factory=dict)
+    keep_on_shutdown: bool = False
+    stdout: RingBuffer = field(default_factory=lambda: RingBuffer(settings.JOB_OUTPUT_LINES))
+    stderr: RingBuffer = field(default_factory=lambda: RingBuffer(settings.JOB_OUTPUT_LINES))
+    subscribers: Set[asyncio.Queue] = field(default_factory=set)
+    task: asyncio.Task | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    def publish(self, event: Dict[str, Any]):
+        """Push an event to every watcher, dropping watchers that fall behind"""
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow consumer: discard its backlog and tell it it was dropped
+                self.subscribers.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "dropped", "job_id": self.id})
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.subscribers.add(queue)
+        return queue
+
+    def set_status(self, status: str):
+        self.status = status
+        self.publish({"type": "status", "job_id": self.id, "status": status, "exit_code": self.exit_code})
+        event_bus.publish(f"{self.kind}.{self.id}", status, {
+            "job_id": self.id,
+            "host": self.host,
+            "description": self.description,
+            "exit_code": self.exit_code,
+            "error": self.error,
+        })
+
+    def to_dict(self, include_output: bool = True) -> Dict[str, Any]:
+        data = {
+            "id": self.id,
+            "kind": self.kind,
+            "host": self.host,
+            "description": self.description,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "exit_code": self.exit_code,
+            "error": self.error,
+            "result": self.result,
+        }
+        if include_output:
+            data["stdout"] = self.stdout.tail()
+            data["stderr"] = self.stderr.tail()
+            data["dropped_lines"] = self.stdout.dropped + self.stderr.dropped
+        return data
+
+
+JobRunner = Callable[[Job], Awaitable[int | None]]
+
+
+class JobManager:
+    """Runs jobs with bounded per-host concurrency and keeps recent history"""
+
+    def __init__(self, host_concurrency: int | None = None, max_pending: int | None = None, history_size: int | None = None):
+        self.host_concurrency = host_concurrency or settings.JOB_HOST_CONCURRENCY
+        self.max_pending = max_pending or settings.JOB_MAX_PENDING
+        self.history_size = history_size or settings.JOB_HISTORY_SIZE
+        self.jobs: OrderedDict[str, Job] = OrderedDict()
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self._running: Dict[str, int] = {}
+
+    @property
+    def pending(self) -> int:
+        return sum(1 for job in self.jobs.values() if not job.finished)
+
+    def get(self, job_id: str) -> Job | None:
+        return self.jobs.get(job_id)
+
+    def submit(
+        self,
+        kind: str,
+        host: str,
+        runner: JobRunner,
+        description: str = "",
+        keep_on_shutdown: bool = False
+    ) -> Job:
+        """Queue a job and return it immediately"""
+        if self.pending >= self.max_pending:
+            raise JobQueueFullError(f"{self.pending} jobs already pending")
+        job = Job(kind=kind, host=host, description=description, keep_on_shutdown=keep_on_shutdown)
+        self.jobs[job.id] = job
+        self._trim_history()
+        job.task = asyncio.create_task(self._run(job, runner))
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.jobs.get(job_id)
+        if not job or job.finished or job.task is None:
+            return False
+        job.task.cancel()
+        return True
+
+    def _trim_history(self):
+        while len(self.jobs) > self.history_size:
+            oldest = next((job_id for job_id, job in self.jobs.items() if job.finished), None)
+            if oldest is None:
+                break
+            del self.jobs[oldest]
+
+    async def _run(self, job: Job, runner: JobRunner):
+        limit = self._host_limits.setdefault(job.host, asyncio.Semaphore(self.host_concurrency))
+        try:
+            async with limit:
+                self._running[job.host] = self._running.get(job.host, 0) + 1
+                try:
+                    job.started_at = datetime.utcnow()
+                    job.set_status("running")
+                    job.exit_code = await runner(job)
+                finally:
+                    self._running[job.host] -= 1
+            job.finished_at = datetime.utcnow()
+            job.set_status("succeeded" if not job.exit_code else "failed")
+        except asyncio.CancelledError:
+            job.finished_at = datetime.utcnow()
+            job.set_status("cancelled")
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.kind}) failed: {e}")
+            job.error = str(e)
+            job.finished_at = datetime.utcnow()
+            job.set_status("failed")
+        finally:
+            if job.started_at and job.finished_at:
+                JOB_DURATION.labels(job.kind, job.status).observe(
+                    (job.finished_at - job.started_at).total_seconds()
+                )
+
+    async def shutdown(self):
+        """Cancel unfinished jobs, giving ``keep_on_shutdown`` jobs a grace period to finish instead"""
+        unfinished = [job for job in self.jobs.values() if job.task and not job.finished]
+        for job in unfinished:
+            if not job.keep_on_shutdown:
+                job.task.cancel()
+        if unfinished:
+            await asyncio.wait([job.task for job in unfinished], timeout=SHUTDOWN_GRACE)
+
+    def stats(self) -> Dict[str, Any]:
+        by_status: Dict[str, int] = {}
+        for job in self.jobs.values():
+            by_status[job.status] = by_status.get(job.status, 0) + 1
+        return {
+            "pending": self.pending,
+            "by_status": by_status,
+            "running_per_host": dict(self._running),
+            "host_concurrency": self.host_concurrency,
+        }
+
+
+def job_output(job: Job) -> OutputCallback:
+    """Executor output callback that feeds the job's ring buffers and watchers"""
+
+    def on_output(name: str, chunk: bytes):
+        for line in getattr(job, name).feed(chunk):
+            job.publish({"type": "output", "job_id": job.id, "stream": name, "line": line})
+
+    return on_output
+
+
+def flush_output(job: Job):
+    for name in ("stdout", "stderr"):
+        for line in getattr(job, name).flush():
+            job.publish({"type": "output", "job_id": job.id, "stream": name, "line": line})
+
+
+def exec_runner(container: str, argv: List[str], **options) -> JobRunner:
+    """Runner that executes an argv in a container and drains its output"""
+
+    async def run(job: Job) -> int:
+        try:
+            return await get_executor().run(container, argv, on_output=job_output(job), **options)
+        finally:
+            flush_output(job)
+
+    return run
+
+
+job_manager = JobManager()
@@ -0,0 +1,190 @@
+"""
+Compiled launch specs for registered applications.
+
+An ``Application``'s ``wine_config`` (``arguments``, ``environment``,
+``working_directory``, ``WINEARCH``, ``WINEDEBUG``, ``WINEPREFIX``,
+``graphics.resolution``) is validated and compiled once into an immutable
+``LaunchSpec``: the argv, the base environment and the working directory.
+Launches then only add the display and prefix of the target session.
+
+Specs are cached per replica for ``LAUNCH_SPEC_TTL`` seconds. Writes to an
+application call ``application_changed`` (through the catalog routes), which
+drops the spec locally and broadcasts an ``application`` event so every other
+replica drops it too. Command-line tools, which do not run the event bus,
+call ``publish_application_changed`` to send the event to Redis directly.
+"""
+import asyncio
+import logging
+import posixpath
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Tuple
+
+from sqlalchemy import select
+
+from config import settings
+from database import Application, read_session
+from services.cache import LRUCache
+from services.events import event_bus
+from services.warm_pool import resolution_for
+
+logger = logging.getLogger(__name__)
+
+ENV_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+WINE_ARCHES = ("win32", "win64")
+SCALARS = (str, int, float, bool)
+APPLICATION_TOPIC = "application"
+
+
+class LaunchSpecError(ValueError):
+    """Raised when an application's wine_config cannot be launched"""
+
+
+@dataclass(frozen=True)
+class LaunchSpec:
+    app_id: int
+    name: str
+    argv: Tuple[str, ...]
+    env: Mapping[str, str]
+    cwd: str | None
+    prefix: str | None
+    resolution: str | None
+    updated_at: datetime | None = None
+
+    def env_for(self, display: str, prefix: str | None = None) -> Dict[str, str]:
+        """Environment on one display; ``prefix`` overrides the configured WINEPREFIX"""
+        prefix = prefix or self.prefix
+        return {**({"WINEPREFIX": prefix} if prefix else {}), **self.env, "DISPLAY": display}
+
+
+def _scalar(value: Any, what: str) -> str:
+    if not isinstance(value, SCALARS):
+        raise LaunchSpecError(f"{what} must be a string or number, got {type(value).__name__}")
+    text = str(value)
+    if "\0" in text:
+        raise LaunchSpecError(f"{what} contains a NUL byte")
+    return text
+
+
+def compile_launch_spec(app: Application) -> LaunchSpec:
+    """Validate an application's wine_config and build its launch spec"""
+    wine_config = app.wine_config or {}
+    if not isinstance(wine_config, dict):
+        raise LaunchSpecError("wine_config must be an object")
+    executable = _scalar(app.executable_path or "", "executable_path")
+    if not executable:
+        raise LaunchSpecError("executable_path is empty")
+
+    arguments = wine_config.get("arguments") or []
+    if not isinstance(arguments, list):
+        # A string would need shell-style splitting, which is exactly what specs avoid
+        raise LaunchSpecError("arguments must be a list")
+    argv = ("wine", executable, *(_scalar(arg, f"arguments[{i}]") for i, arg in enumerate(arguments)))
+
+    environment = wine_config.get("environment") or {}
+    if not isinstance(environment, dict):
+        raise LaunchSpecError("environment must be an object")
+    arch = wine_config.get("WINEARCH", "win64")
+    if arch not in WINE_ARCHES:
+        raise LaunchSpecError(f"WINEARCH must be one of {', '.join(WINE_ARCHES)}")
+    env = {"WINEARCH": arch, "WINEDEBUG": _scalar(wine_config.get("WINEDEBUG", "-all"), "WINEDEBUG")}
+    for key, value in environment.items():
+        if not ENV_NAME.match(str(key)):
+            raise LaunchSpecError(f"Invalid environment variable name {key!r}")
+        env[key] = _scalar(value, f"environment.{key}")
+
+    cwd = wine_config.get("working_directory") or posixpath.dirname(executable) or None
+    if cwd is not None and not posixpath.isabs(_scalar(cwd, "working_directory")):
+        raise LaunchSpecError("working_directory must be an absolute path")
+    prefix = wine_config.get("WINEPREFIX")
+
+    return LaunchSpec(
+        app_id=app.id,
+        name=app.name,
+        argv=argv,
+        env=MappingProxyType(env),
+        cwd=cwd,
+        prefix=_scalar(prefix, "WINEPREFIX") if prefix else None,
+        resolution=resolution_for(wine_config),
+        updated_at=app.updated_at,
+    )
+
+
+class LaunchSpecCache:
+    """Per-replica LRU of compiled specs, invalidated across replicas via the event bus"""
+
+    def __init__(self, max_size: int | None = None, ttl: float | None = None):
+        self.ttl = settings.LAUNCH_SPEC_TTL if ttl is None else ttl
+        self._specs = LRUCache(max_size or settings.LAUNCH_SPEC_CACHE_SIZE)
+        self._task: asyncio.Task | None = None
+        self.stats = {"hits": 0, "misses": 0, "compile_errors": 0, "invalidations": 0}
+
+    async def get(self, app_id: int) -> LaunchSpec | None:
+        """Spec of an active application, or None if there is no such application"""
+        cached = self._specs.get(str(app_id))
+        if cached is not None and time.monotonic() - cached[1] < self.ttl:
+            self.stats["hits"] += 1
+            return cached[0]
+        self.stats["misses"] += 1
+        async with read_session() as db:
+            app = await db.scalar(
+                select(Application).where(Application.id == app_id, Application.is_active == True)
+            )
+        if app is None:
+            return None
+        try:
+            spec = compile_launch_spec(app)
+        except LaunchSpecError:
+            self.stats["compile_errors"] += 1
+            raise
+        self._specs.set(str(app_id), (spec, time.monotonic()))
+        return spec
+
+    def invalidate(self, *app_ids: int):
+        self.stats["invalidations"] += 1
+        self._specs.delete(*(str(app_id) for app_id in app_ids))
+
+    async def _listen(self):
+        while True:
+            subscription = event_bus.subscribe([APPLICATION_TOPIC])
+            try:
+                while True:
+                    event = await subscription.queue.get()
+                    if event["type"] == "dropped":
+                        # Fell behind and missed invalidations: start over
+                        self._specs = LRUCache(self._specs.max_size)
+                        break
+                    self.invalidate(*event["data"].get("ids", []))
+            finally:
+                event_bus.unsubscribe(subscription)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "size": len(self._specs)}
+
+
+launch_specs = LaunchSpecCache()
+
+
+def application_changed(*app_ids: int):
+    """Drop the applications' launch specs here and on every other replica"""
+    launch_specs.invalidate(*app_ids)
+    event_bus.publish(APPLICATION_TOPIC, "changed", {"ids": list(app_ids)})
+
+
+async def publish_application_changed(*app_ids: int):
+    """``application_changed`` for processes without a running event bus; raises ``RedisError``"""
+    launch_specs.invalidate(*app_ids)
+    await event_bus.publish_direct(APPLICATION_TOPIC, "changed", {"ids": list(app_ids)})
@@ -0,0 +1,157 @@
+"""
+Prometheus metrics.
+
+Metric objects live here so any module can record into them without import
+cycles. Request latency is recorded by a plain ASGI middleware labelled with
+the matched route template (not the raw path) to keep cardinality bounded;
+database timings come from SQLAlchemy engine events. Counters that services
+already keep in their ``stats`` dicts are exported at scrape time by
+``StatsCollector`` rather than being double-counted on the hot path.
+"""
+import time
+from typing import Any, Callable, Dict
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests", ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"]
+)
+HTTP_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests currently being served", ["method"]
+)
+DB_POOL_CHECKOUTS = Counter(
+    "db_pool_checkouts_total", "Connections checked out of the DB pool", ["engine"]
+)
+DB_POOL_CONNECT = Histogram(
+    "db_pool_connect_seconds", "Time to open a new pooled DB connection", ["engine"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds", "DB statement execution time", ["engine", "operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+WINE_SERVICE_LATENCY = Histogram(
+    "wine_service_request_duration_seconds", "Outbound Wine service request latency", ["method", "path", "status"]
+)
+LAUNCH_LATENCY = Histogram(
+    "wine_launch_duration_seconds", "Application launch latency", ["start"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+JOB_DURATION = Histogram(
+    "wine_job_duration_seconds", "Launch/restart job run time", ["kind", "status"],
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600),
+)
+ACTIVE_SESSIONS = Gauge("sessions_active", "Sessions with status 'active'")
+SLOTS = Gauge("slots", "Display/VNC slots", ["state"])
+
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "BEGIN", "COMMIT", "ROLLBACK"}
+
+
+class PrometheusMiddleware:
+    """Records per-route latency, status and in-flight counts"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        in_progress = HTTP_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            in_progress.dec()
+            # The router stores the matched route in the (shared) scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_LATENCY.labels(method, route).observe(elapsed)
+            HTTP_REQUESTS.labels(method, route, str(status["code"])).inc()
+
+
+def instrument_engine(async_engine: AsyncEngine, name: str):
+    """Record connection setup, checkouts and statement timings for an engine
+
+    Pool events registered on the engine carry over to the pool it creates on
+    ``dispose()``. Pool occupancy itself is exported by ``pool_stats``.
+    """
+    sync_engine = async_engine.sync_engine
+    connect_latency = DB_POOL_CONNECT.labels(name)
+    checkouts = DB_POOL_CHECKOUTS.labels(name)
+
+    @event.listens_for(sync_engine, "do_connect")
+    def do_connect(dialect, connection_record, cargs, cparams):
+        connection_record.info["connect_started"] = time.perf_counter()
+
+    @event.listens_for(sync_engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        started = connection_record.info.pop("connect_started", None)
+        if started is not None:
+            connect_latency.observe(time.perf_counter() - started)
+
+    @event.listens_for(sync_engine, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        checkouts.inc()
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        if operation not in SQL_OPERATIONS:
+            operation = "OTHER"
+        DB_QUERY_LATENCY.labels(name, operation).observe(time.perf_counter() - started)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+class StatsCollector(Collector):
+    """Exports numeric values from services' ``stats`` dicts as gauges at scrape time"""
+
+    def __init__(self, sources: Dict[str, Callable[[], Dict[str, Any]]]):
+        self.sources = sources
+
+    def collect(self):
+        for source, get_stats in self.sources.items():
+            family = GaugeMetricFamily(f"{source}_stats", f"Internal {source} counters", labels=["key"])
+            for key, value in _flatten(get_stats()).items():
+                family.add_metric([key], value)
+            yield family
+
+
+def _flatten(data: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, bool):
+            flat[name] = float(value)
+        elif isinstance(value, (int, float)):
+            flat[name] = float(value)
+        elif isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+    return flat
@@ -0,0 +1,39 @@
+"""
+Opaque cursor tokens for keyset pagination.
+
+A cursor is the sort key of the last row on a page, JSON-encoded and base64url
+wrapped so clients treat it as an opaque string. The next page is then fetched
+with a ``WHERE (sort key) < (cursor)`` predicate that an index can seek to
+directly, instead of an OFFSET that has to scan every skipped row.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, Tuple
+
+from fastapi import HTTPException
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values: Any) -> str:
+    """Encode a sort key into an opaque cursor token"""
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(token: str, *types: type) -> Tuple[Any, ...]:
+    """Decode a cursor token, checking it matches the expected key types"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(payload, list) or len(payload) != len(types):
+            raise ValueError("cursor has the wrong shape")
+        return tuple(
+            datetime.fromisoformat(value) if kind is datetime else kind(value)
+            for kind, value in zip(types, payload)
+        )
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
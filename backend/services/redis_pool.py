@@ -0,0 +1,70 @@
+"""
+Shared Redis connection pool.
+
+Every Redis-backed service goes through ``get_redis()`` so the backend keeps a
+single connection pool. When a command fails the caller reports it with
+``mark_redis_down()``; ``redis_available()`` then returns False for
+``REDIS_RETRY_INTERVAL`` seconds so callers fall back to their in-process
+paths instead of waiting on socket timeouts for every request.
+
+Pub/sub listeners use ``get_pubsub_redis()``, a separate client without a
+socket timeout: a subscription sitting idle is normal, not an outage.
+"""
+import logging
+import time
+
+import redis.asyncio as redis
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_client: redis.Redis | None = None
+_pubsub_client: redis.Redis | None = None
+_down_until = 0.0
+
+
+def get_redis() -> redis.Redis:
+    """Return the shared Redis client, creating it on first use"""
+    global _client
+    if _client is None:
+        _client = redis.from_url(
+            settings.REDIS_URL,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        )
+    return _client
+
+
+def get_pubsub_redis() -> redis.Redis:
+    """Return the client for long-lived subscriptions, which may idle indefinitely"""
+    global _pubsub_client
+    if _pubsub_client is None:
+        _pubsub_client = redis.from_url(
+            settings.REDIS_URL,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_timeout=None,
+        )
+    return _pubsub_client
+
+
+def redis_available() -> bool:
+    return time.monotonic() >= _down_until
+
+
+def mark_redis_down(error: Exception):
+    """Stop using Redis until the retry interval has passed"""
+    global _down_until
+    if redis_available():
+        logger.warning(f"Redis unavailable, using in-process fallback: {error}")
+    _down_until = time.monotonic() + settings.REDIS_RETRY_INTERVAL
+
+
+async def close_redis():
+    global _client, _pubsub_client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    if _pubsub_client is not None:
+        await _pubsub_client.aclose()
+        _pubsub_client = None
@@ -0,0 +1,259 @@
+"""
+Session placement across Wine nodes.
+
+A node is one Wine container from ``SLOT_CONTAINERS``. Nodes report their
+capacity and load with heartbeats (``POST /api/nodes/{name}/heartbeat``):
+their slot count, CPU and memory use, and the applications whose Wine
+prefixes are already initialized there. With the ``redis`` backend the
+registry and drain flags are shared by every backend replica.
+
+``PlacementPolicy.rank`` orders the nodes a new session may go to:
+
+- draining nodes, nodes whose last heartbeat is older than
+  ``NODE_HEARTBEAT_TIMEOUT``, full nodes and nodes over ``NODE_MAX_CPU`` or
+  ``NODE_MAX_MEMORY`` are not eligible;
+- the rest are ordered by load, the highest of their slot, CPU and memory
+  utilisation: least loaded first (``spread``) or most loaded that still
+  fits first (``pack``);
+- a node that already has the application's prefix warm gets
+  ``NODE_AFFINITY_BONUS`` of load in its favour, so a launch skips prefix
+  creation unless that node is clearly busier.
+
+Nodes that never sent a heartbeat are placed on by slot load alone, so a
+single container without a node agent keeps working; set
+``NODE_REQUIRE_HEARTBEAT`` to refuse them instead.
+
+Every decision is kept in a bounded log that ``services.scheduler_sim`` can
+replay offline.
+"""
+import json
+import logging
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field, replace
+from typing import Any, Deque, Dict, FrozenSet, Iterable, List, Set, Tuple
+
+from redis.exceptions import RedisError
+
+from config import settings
+from services.redis_pool import get_redis
+from services.slots import Slot, SlotAllocator, SlotUnavailableError, slot_allocator
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("spread", "pack")
+HEARTBEATS_KEY = "nodes:heartbeats"
+DRAINING_KEY = "nodes:draining"
+
+
+class UnknownNodeError(LookupError):
+    """Raised for a node name that is not one of the slot containers"""
+
+
+class NodeStoreUnavailableError(SlotUnavailableError):
+    """Raised when the node registry cannot be reached"""
+
+
+@dataclass(frozen=True)
+class NodeStatus:
+    name: str
+    slots: int
+    free_slots: int
+    # Fractions of the node's CPU and memory in use, None until reported
+    cpu: float | None = None
+    memory: float | None = None
+    warm_apps: FrozenSet[int] = frozenset()
+    heartbeat_at: float | None = None
+    draining: bool = False
+
+    @property
+    def load(self) -> float:
+        used = (self.slots - self.free_slots) / self.slots if self.slots else 1.0
+        return max(used, self.cpu or 0.0, self.memory or 0.0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), "warm_apps": sorted(self.warm_apps), "load": round(self.load, 3)}
+
+
+@dataclass(frozen=True)
+class PlacementPolicy:
+    policy: str = field(default_factory=lambda: settings.NODE_PLACEMENT_POLICY)
+    affinity_bonus: float = field(default_factory=lambda: settings.NODE_AFFINITY_BONUS)
+    max_cpu: float = field(default_factory=lambda: settings.NODE_MAX_CPU)
+    max_memory: float = field(default_factory=lambda: settings.NODE_MAX_MEMORY)
+    heartbeat_timeout: float = field(default_factory=lambda: settings.NODE_HEARTBEAT_TIMEOUT)
+    require_heartbeat: bool = field(default_factory=lambda: settings.NODE_REQUIRE_HEARTBEAT)
+
+    def __post_init__(self):
+        if self.policy not in POLICIES:
+            raise ValueError(f"Unknown placement policy {self.policy!r} (expected {' or '.join(POLICIES)})")
+
+    def state(self, node: NodeStatus, now: float) -> str:
+        """ready, draining, down (heartbeat timed out) or unreported"""
+        if node.draining:
+            return "draining"
+        if node.heartbeat_at is None:
+            return "down" if self.require_heartbeat else "unreported"
+        if now - node.heartbeat_at > self.heartbeat_timeout:
+            return "down"
+        return "ready"
+
+    def eligible(self, node: NodeStatus, now: float) -> bool:
+        return (
+            self.state(node, now) in ("ready", "unreported")
+            and node.free_slots > 0
+            and (node.cpu or 0.0) < self.max_cpu
+            and (node.memory or 0.0) < self.max_memory
+        )
+
+    def score(self, node: NodeStatus, app_id: int | None) -> float:
+        """Lower is better"""
+        score = node.load if self.policy == "spread" else -node.load
+        if app_id is not None and app_id in node.warm_apps:
+            score -= self.affinity_bonus
+        return score
+
+    def rank(self, nodes: Iterable[NodeStatus], app_id: int | None, now: float) -> List[NodeStatus]:
+        """Eligible nodes, best placement first"""
+        eligible = [node for node in nodes if self.eligible(node, now)]
+        return sorted(eligible, key=lambda node: (self.score(node, app_id), node.name))
+
+
+class NodeScheduler:
+    """Node registry (heartbeats, drain) and session placement on top of the slot allocator"""
+
+    def __init__(
+        self,
+        backend: str | None = None,
+        allocator: SlotAllocator | None = None,
+        policy: PlacementPolicy | None = None
+    ):
+        self.backend = backend or settings.NODE_BACKEND
+        self.allocator = allocator or slot_allocator
+        self.policy = policy or PlacementPolicy()
+        self.decisions: Deque[Dict[str, Any]] = deque(maxlen=settings.NODE_DECISION_LOG_SIZE)
+        # Applications this replica placed per node; their prefixes now exist there
+        self._placed: Dict[str, Set[int]] = {}
+        # memory backend state
+        self._heartbeats: Dict[str, Dict[str, Any]] = {}
+        self._draining: Set[str] = set()
+        self.stats = {"placements": 0, "affinity_hits": 0, "refused": 0, "conflicts": 0, "heartbeats": 0}
+
+    def _check(self, name: str):
+        if name not in self.allocator.containers:
+            raise UnknownNodeError(f"Unknown node: {name}")
+
+    async def heartbeat(self, name: str, report: Dict[str, Any], now: float | None = None):
+        """Record a node's capacity report (slots, cpu, memory, warm_apps)"""
+        self._check(name)
+        self.stats["heartbeats"] += 1
+        report = {**report, "at": time.time() if now is None else now}
+        if self.backend == "memory":
+            self._heartbeats[name] = report
+            return
+        try:
+            await get_redis().hset(HEARTBEATS_KEY, name, json.dumps(report))
+        except RedisError as e:
+            raise NodeStoreUnavailableError(str(e)) from e
+
+    async def drain(self, name: str, draining: bool = True):
+        """Stop (or resume) placing new sessions on a node; running sessions are left alone"""
+        self._check(name)
+        if self.backend == "memory":
+            if draining:
+                self._draining.add(name)
+            else:
+                self._draining.discard(name)
+            return
+        try:
+            if draining:
+                await get_redis().sadd(DRAINING_KEY, name)
+            else:
+                await get_redis().srem(DRAINING_KEY, name)
+        except RedisError as e:
+            raise NodeStoreUnavailableError(str(e)) from e
+
+    async def _registry(self) -> Tuple[Dict[str, Dict[str, Any]], Set[str]]:
+        if self.backend == "memory":
+            return dict(self._heartbeats), set(self._draining)
+        try:
+            async with get_redis().pipeline(transaction=False) as pipe:
+                pipe.hgetall(HEARTBEATS_KEY)
+                pipe.smembers(DRAINING_KEY)
+                raw, draining = await pipe.execute()
+        except RedisError as e:
+            raise NodeStoreUnavailableError(str(e)) from e
+        heartbeats = {}
+        for name, value in raw.items():
+            name = name.decode() if isinstance(name, bytes) else name
+            try:
+                heartbeats[name] = json.loads(value)
+            except ValueError:
+                logger.warning(f"Ignoring malformed heartbeat of node {name}")
+        return heartbeats, {name.decode() if isinstance(name, bytes) else name for name in draining}
+
+    async def nodes(self) -> List[NodeStatus]:
+        """Current view of every node: registry entries combined with slot leases"""
+        heartbeats, draining = await self._registry()
+        free = (await self.allocator.stats())["free"]
+        per_container = self.allocator.per_container
+        nodes = []
+        for name in self.allocator.containers:
+            report = heartbeats.get(name, {})
+            # A node can offer fewer slots than the allocator reserves for it, never more
+            reported = report.get("slots")
+            slots = per_container if reported is None else min(int(reported), per_container)
+            nodes.append(NodeStatus(
+                name=name,
+                slots=slots,
+                free_slots=max(0, free.get(name, 0) - (per_container - slots)),
+                cpu=report.get("cpu"),
+                memory=report.get("memory"),
+                warm_apps=frozenset(report.get("warm_apps") or ()) | frozenset(self._placed.get(name, ())),
+                heartbeat_at=report.get("at"),
+                draining=name in draining,
+            ))
+        return nodes
+
+    async def schedulable(self) -> Set[str]:
+        """Names of the nodes that accept new sessions right now"""
+        now = time.time()
+        # Warm environments already hold their slot, so only the node's health counts
+        return {node.name for node in await self.nodes() if self.policy.eligible(replace(node, free_slots=1), now)}
+
+    async def allocate(self, lease_id: str, app_id: int | None = None) -> Slot | None:
+        """Lease a slot on the best node for the application, or None if no node can take it"""
+        now = time.time()
+        nodes = await self.nodes()
+        ranked = self.policy.rank(nodes, app_id, now)
+        slot = chosen = None
+        for node in ranked:
+            slot = await self.allocator.allocate(lease_id, container=node.name)
+            if slot is not None:
+                chosen = node
+                break
+            # Another replica took the node's last slot since we looked
+            self.stats["conflicts"] += 1
+
+        self.decisions.append({
+            "at": now,
+            "lease": lease_id,
+            "app_id": app_id,
+            "nodes": [{**node.to_dict(), "state": self.policy.state(node, now)} for node in nodes],
+            "chosen": slot.container if slot else None,
+        })
+        if slot is None:
+            self.stats["refused"] += 1
+            return None
+        self.stats["placements"] += 1
+        if app_id is not None:
+            if app_id in chosen.warm_apps:
+                self.stats["affinity_hits"] += 1
+            self._placed.setdefault(chosen.name, set()).add(app_id)
+        return slot
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"backend": self.backend, "policy": self.policy.policy, **self.stats}
+
+
+node_scheduler = NodeScheduler()
@@ -0,0 +1,189 @@
+"""
+Offline replay of session placement.
+
+Feeds a trace of session arrivals and node events through the same
+``PlacementPolicy`` the scheduler uses, against simulated nodes, and reports
+how the placements turned out: refusals, warm-prefix hits, sessions lost to
+failed nodes, peak load per node, load imbalance and decision latency. Use
+it to compare policies and settings before changing them in a cluster::
+
+    python -m services.scheduler_sim nodes.json trace.jsonl --policy pack
+
+``nodes.json`` is a list of ``{"name", "slots", "cpu_per_session",
+"memory_per_session", "warm_apps"}`` objects. The trace holds one JSON
+object per line, ordered by ``t`` (seconds)::
+
+    {"t": 0, "app_id": 7, "duration": 600}           a session arrives
+    {"t": 30, "node": "wine-b", "event": "drain"}     or undrain, fail, recover
+
+A failed node stops heartbeating, so it keeps receiving sessions (counted as
+lost) until ``NODE_HEARTBEAT_TIMEOUT`` passes, as it would for real.
+
+The scheduler's decision log (``GET /api/nodes/decisions``) is accepted as a
+trace too: each recorded placement becomes an arrival lasting ``--duration``
+seconds.
+"""
+import argparse
+import heapq
+import json
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from services.scheduler import POLICIES, NodeStatus, PlacementPolicy
+from services.warm_pool import LatencyStats
+
+NODE_EVENTS = ("drain", "undrain", "fail", "recover")
+
+
+@dataclass
+class SimNode:
+    name: str
+    slots: int
+    cpu_per_session: float = 0.0
+    memory_per_session: float = 0.0
+    warm_apps: Set[int] = field(default_factory=set)
+    sessions: int = 0
+    draining: bool = False
+    failed: bool = False
+    heartbeat_at: float = 0.0
+    # Bumped on failure so departures of lost sessions are ignored
+    epoch: int = 0
+    placed: int = 0
+    peak_load: float = 0.0
+
+    def status(self) -> NodeStatus:
+        return NodeStatus(
+            name=self.name,
+            slots=self.slots,
+            free_slots=self.slots - self.sessions,
+            cpu=min(1.0, self.sessions * self.cpu_per_session),
+            memory=min(1.0, self.sessions * self.memory_per_session),
+            warm_apps=frozenset(self.warm_apps),
+            heartbeat_at=self.heartbeat_at,
+            draining=self.draining,
+        )
+
+
+def trace_from_decisions(decisions: Iterable[Dict[str, Any]], duration: float) -> List[Dict[str, Any]]:
+    """Arrivals from the scheduler's decision log, timed relative to the first one"""
+    decisions = sorted(decisions, key=lambda decision: decision["at"])
+    start = decisions[0]["at"] if decisions else 0.0
+    return [
+        {"t": decision["at"] - start, "app_id": decision.get("app_id"), "duration": duration}
+        for decision in decisions
+    ]
+
+
+def simulate(
+    nodes: List[SimNode],
+    trace: Iterable[Dict[str, Any]],
+    policy: PlacementPolicy | None = None,
+    default_duration: float = 600.0
+) -> Dict[str, Any]:
+    """Replay a trace against the nodes (which are updated in place)"""
+    policy = policy or PlacementPolicy()
+    by_name = {node.name: node for node in nodes}
+    # (end time, sequence, node name, node epoch)
+    departures: List[Tuple[float, int, str, int]] = []
+    latency = LatencyStats(max_samples=100_000)
+    imbalance: List[float] = []
+    totals = {"arrivals": 0, "placed": 0, "refused": 0, "warm_hits": 0, "lost": 0}
+
+    for sequence, event in enumerate(trace):
+        now = float(event.get("t", 0))
+        while departures and departures[0][0] <= now:
+            _, _, name, epoch = heapq.heappop(departures)
+            if by_name[name].epoch == epoch:
+                by_name[name].sessions -= 1
+        for node in nodes:
+            if not node.failed:
+                node.heartbeat_at = now
+
+        if "node" in event:
+            node = by_name[event["node"]]
+            kind = event.get("event")
+            if kind not in NODE_EVENTS:
+                raise ValueError(f"Unknown node event {kind!r} (expected one of {', '.join(NODE_EVENTS)})")
+            if kind in ("drain", "undrain"):
+                node.draining = kind == "drain"
+            elif kind == "fail":
+                totals["lost"] += node.sessions
+                node.failed, node.sessions, node.warm_apps = True, 0, set()
+                node.epoch += 1
+            else:
+                node.failed = False
+                node.heartbeat_at = now
+            continue
+
+        totals["arrivals"] += 1
+        app_id = event.get("app_id")
+        started = time.perf_counter()
+        ranked = policy.rank([node.status() for node in nodes], app_id, now)
+        latency.observe(time.perf_counter() - started)
+        if not ranked:
+            totals["refused"] += 1
+            continue
+        node = by_name[ranked[0].name]
+        totals["placed"] += 1
+        node.placed += 1
+        if node.failed:
+            # Not detected yet: the session never comes up
+            totals["lost"] += 1
+            continue
+        if app_id in node.warm_apps:
+            totals["warm_hits"] += 1
+        if app_id is not None:
+            node.warm_apps.add(app_id)
+        node.sessions += 1
+        duration = float(event.get("duration", default_duration))
+        heapq.heappush(departures, (now + duration, sequence, node.name, node.epoch))
+        node.peak_load = max(node.peak_load, node.status().load)
+        loads = [candidate.status().load for candidate in nodes if not candidate.failed]
+        imbalance.append(max(loads) - min(loads))
+
+    return {
+        "policy": policy.policy,
+        **totals,
+        "warm_hit_rate": round(totals["warm_hits"] / totals["placed"], 3) if totals["placed"] else None,
+        "mean_imbalance": round(sum(imbalance) / len(imbalance), 3) if imbalance else None,
+        "nodes": {node.name: {"placed": node.placed, "peak_load": round(node.peak_load, 3)} for node in nodes},
+        "decision_latency": latency.summary(),
+    }
+
+
+def load_trace(path: str, duration: float) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        text = f.read()
+    try:
+        records = json.loads(text)
+    except ValueError:
+        records = [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(records, dict):
+        records = [records]
+    if records and "chosen" in records[0]:
+        return trace_from_decisions(records, duration)
+    return sorted(records, key=lambda event: event.get("t", 0))
+
+
+def main(argv: List[str] | None = None):
+    parser = argparse.ArgumentParser(description="Replay session placements against simulated Wine nodes")
+    parser.add_argument("nodes", help="JSON list of nodes")
+    parser.add_argument("trace", help="JSONL trace, or a decision log from GET /api/nodes/decisions")
+    parser.add_argument("--policy", choices=POLICIES)
+    parser.add_argument("--affinity-bonus", type=float)
+    parser.add_argument("--duration", type=float, default=600.0, help="session length when the trace has none")
+    args = parser.parse_args(argv)
+
+    with open(args.nodes) as f:
+        nodes = [SimNode(**{**node, "warm_apps": set(node.get("warm_apps", ()))}) for node in json.load(f)]
+    overrides = {"policy": args.policy, "affinity_bonus": args.affinity_bonus}
+    policy = PlacementPolicy(**{key: value for key, value in overrides.items() if value is not None})
+    report = simulate(nodes, load_trace(args.trace, args.duration), policy, args.duration)
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
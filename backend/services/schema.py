@@ -0,0 +1,84 @@
+"""
+Schema setup at API startup.
+
+``DB_SCHEMA_MODE`` picks what the lifespan does before serving:
+
+- ``migrate``: ``alembic upgrade head``, serialized across pods with a
+  Postgres advisory lock so only one replica runs the migrations.
+- ``skip``: nothing; migrations run as a separate step (an init container
+  or ``cd backend && alembic upgrade head``), so pods start immediately.
+- ``create_all``: the old ``Base.metadata.create_all`` behaviour.
+
+Migrations run on a dedicated, unpooled engine without the app engine's
+``DB_COMMAND_TIMEOUT``: building an index concurrently on a large table, or
+waiting for another replica to finish migrating, can take far longer.
+"""
+import logging
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from config import settings
+from database import Base, engine
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_INI = Path(__file__).resolve().parent.parent / "alembic.ini"
+# Arbitrary key shared by every replica for pg_advisory_lock
+SCHEMA_LOCK_ID = 0x57494E45
+SCHEMA_MODES = ("migrate", "skip", "create_all")
+
+
+def alembic_config(connection=None) -> Config:
+    config = Config(str(ALEMBIC_INI))
+    config.set_main_option("script_location", str(ALEMBIC_INI.parent / "migrations"))
+    if connection is not None:
+        config.attributes["connection"] = connection
+    return config
+
+
+def migration_engine() -> AsyncEngine:
+    """Engine for migrations: no client command timeout and no server statement timeout"""
+    return create_async_engine(
+        settings.DATABASE_URL,
+        poolclass=NullPool,
+        connect_args={
+            "server_settings": {
+                "application_name": "wine-emulator-api:migrate",
+                "statement_timeout": "0",
+            },
+        },
+    )
+
+
+async def migrate():
+    """Upgrade to head while holding the schema advisory lock"""
+    migrations = migration_engine()
+    try:
+        async with migrations.connect() as conn:
+            await conn.execute(select(func.pg_advisory_lock(SCHEMA_LOCK_ID)))
+            # Session-level lock; end the implicit transaction so alembic manages its own
+            await conn.commit()
+            try:
+                await conn.run_sync(lambda sync_conn: command.upgrade(alembic_config(sync_conn), "head"))
+            finally:
+                await conn.execute(select(func.pg_advisory_unlock(SCHEMA_LOCK_ID)))
+                await conn.commit()
+    finally:
+        await migrations.dispose()
+
+
+async def prepare_schema(mode: str | None = None):
+    mode = mode or settings.DB_SCHEMA_MODE
+    if mode not in SCHEMA_MODES:
+        raise ValueError(f"DB_SCHEMA_MODE must be one of {', '.join(SCHEMA_MODES)}, got {mode!r}")
+    if mode == "migrate":
+        await migrate()
+    elif mode == "create_all":
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    logger.info(f"Database schema: {mode}")
@@ -0,0 +1,241 @@
+"""
+Screenshot capture and preview thumbnails.
+
+Frames are fetched from the Wine service's ``/api/screenshot`` and kept as
+raw image bytes, one latest frame per session, identified by a content hash.
+Viewers polling the same session within ``SCREENSHOT_MIN_INTERVAL`` share
+one capture, and concurrent captures of a session are coalesced into a
+single upstream request.
+
+Thumbnails (WebP or JPEG) are rendered with Pillow off the event loop and
+kept in an LRU bounded by total bytes, keyed by session, frame hash, size
+and format. When a session's frame changes its old thumbnails are dropped.
+Since the hash doubles as the ETag, an unchanged frame costs a 304, and
+``changes()`` reports only the sessions whose frame moved on.
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Tuple
+
+import httpx
+from PIL import Image, UnidentifiedImageError
+
+from config import settings
+from services.cache import ByteLRUCache, LRUCache
+from services.wine_client import WineServiceClient, wine_client
+
+logger = logging.getLogger(__name__)
+
+# format name -> (Pillow format, content type)
+THUMBNAIL_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+    (b"BM", "image/bmp"),
+)
+
+
+class ScreenshotError(Exception):
+    """Raised when a frame cannot be captured or decoded"""
+
+
+@dataclass(frozen=True)
+class Frame:
+    data: bytes
+    content_type: str
+    hash: str
+    # Wall-clock time the content last changed; monotonic time it was fetched
+    changed_at: float
+    fetched_at: float
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.hash}"'
+
+
+def sniff_content_type(data: bytes) -> str:
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, content_type in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return content_type
+    return "application/octet-stream"
+
+
+def decode_screenshot(response: httpx.Response) -> Tuple[bytes, str]:
+    """Raw image bytes and content type from a Wine service screenshot response
+
+    Binary ``image/*`` bodies are used as-is; older Wine service builds answer
+    with base64 text, optionally as ``{"screenshot": ...}`` or a data URL.
+    """
+    content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type.startswith("image/"):
+        return response.content, content_type
+
+    payload: Any = response.content
+    if content_type == "application/json":
+        data = response.json()
+        payload = (data.get("screenshot") or data.get("image") or "") if isinstance(data, dict) else str(data)
+    if isinstance(payload, bytes):
+        payload = payload.decode("ascii", errors="ignore")
+    payload = payload.strip()
+    if payload.startswith("data:"):
+        payload = payload.partition(",")[2]
+    try:
+        raw = base64.b64decode(payload, validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise ScreenshotError(f"Unrecognised screenshot payload ({content_type or 'no content type'})") from e
+    if not raw:
+        raise ScreenshotError("Empty screenshot")
+    return raw, sniff_content_type(raw)
+
+
+def frame_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def make_thumbnail(data: bytes, width: int, height: int, fmt: str, quality: int) -> bytes:
+    """Scale an image to fit within width x height, keeping its aspect ratio"""
+    pillow_format, _ = THUMBNAIL_FORMATS[fmt]
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # Lets the JPEG decoder downscale while decoding
+            image.draft("RGB", (width, height))
+            image.thumbnail((width, height))
+            if image.mode not in ("RGB", "RGBA") or (fmt == "jpeg" and image.mode != "RGB"):
+                image = image.convert("RGB")
+            out = io.BytesIO()
+            image.save(out, format=pillow_format, quality=quality)
+            return out.getvalue()
+    except (UnidentifiedImageError, OSError) as e:
+        raise ScreenshotError(f"Cannot render thumbnail: {e}") from e
+
+
+class ScreenshotService:
+    """Latest frame per session plus a byte-bounded thumbnail cache"""
+
+    def __init__(
+        self,
+        min_interval: float | None = None,
+        cache_bytes: int | None = None,
+        client: WineServiceClient | None = None
+    ):
+        self.client = client or wine_client
+        self.min_interval = settings.SCREENSHOT_MIN_INTERVAL if min_interval is None else min_interval
+        self.frames = LRUCache(settings.SCREENSHOT_MAX_SESSIONS)
+        self.thumbnails = ByteLRUCache(cache_bytes or settings.SCREENSHOT_THUMBNAIL_CACHE_BYTES)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.stats = {
+            "captures": 0,
+            "reused": 0,
+            "coalesced": 0,
+            "unchanged": 0,
+            "errors": 0,
+            "thumbnail_hits": 0,
+            "thumbnail_misses": 0,
+        }
+
+    async def capture(self, key: str, params: Dict[str, Any] | None = None) -> Frame:
+        """Latest frame for ``key``, fetching a new one if ours is older than min_interval"""
+        frame = self.frames.get(key)
+        if frame is not None and time.monotonic() - frame.fetched_at < self.min_interval:
+            self.stats["reused"] += 1
+            return frame
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(key, params or {}))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.stats["coalesced"] += 1
+        # A viewer going away must not cancel the capture other viewers wait on
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: str, params: Dict[str, Any]) -> Frame:
+        self.stats["captures"] += 1
+        try:
+            response = await self.client.get("/api/screenshot", params=params)
+            if response.status_code != 200:
+                raise ScreenshotError(f"Wine service answered {response.status_code}")
+            data, content_type = decode_screenshot(response)
+        except ScreenshotError:
+            self.stats["errors"] += 1
+            raise
+        except httpx.HTTPError as e:
+            self.stats["errors"] += 1
+            raise ScreenshotError(str(e)) from e
+
+        now = time.monotonic()
+        digest = frame_hash(data)
+        previous = self.frames.get(key)
+        if previous is not None and previous.hash == digest:
+            self.stats["unchanged"] += 1
+            frame = replace(previous, fetched_at=now)
+        else:
+            if previous is not None:
+                self.thumbnails.delete_prefix(f"{key}:{previous.hash}:")
+            frame = Frame(data, content_type, digest, time.time(), now)
+        self.frames.set(key, frame)
+        return frame
+
+    async def thumbnail(self, key: str, frame: Frame, width: int, height: int, fmt: str = "webp") -> bytes:
+        cache_key = f"{key}:{frame.hash}:{width}x{height}:{fmt}"
+        data = self.thumbnails.get(cache_key)
+        if data is not None:
+            self.stats["thumbnail_hits"] += 1
+            return data
+        self.stats["thumbnail_misses"] += 1
+        data = await asyncio.to_thread(
+            make_thumbnail, frame.data, width, height, fmt, settings.SCREENSHOT_THUMBNAIL_QUALITY
+        )
+        self.thumbnails.set(cache_key, data)
+        return data
+
+    async def changes(
+        self,
+        known: Dict[str, str | None],
+        params: Dict[str, Dict[str, Any]]
+    ) -> Tuple[Dict[str, Frame], Dict[str, str]]:
+        """Capture every session in ``known`` and return those whose hash differs
+
+        ``known`` maps a session key to the frame hash the client already has.
+        Returns (changed frames, errors) keyed by session.
+        """
+        keys = list(known)
+        results = await asyncio.gather(
+            *(self.capture(key, params.get(key)) for key in keys), return_exceptions=True
+        )
+        changed: Dict[str, Frame] = {}
+        errors: Dict[str, str] = {}
+        for key, result in zip(keys, results):
+            if isinstance(result, ScreenshotError):
+                errors[key] = str(result)
+            elif isinstance(result, BaseException):
+                raise result
+            elif result.hash != known[key]:
+                changed[key] = result
+        return changed, errors
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "sessions": len(self.frames),
+            "thumbnails": len(self.thumbnails),
+            "thumbnail_bytes": self.thumbnails.size_bytes,
+            "thumbnail_max_bytes": self.thumbnails.max_bytes,
+        }
+
+
+screenshot_service = ScreenshotService()
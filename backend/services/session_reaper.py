@@ -0,0 +1,173 @@
+"""
+Background expiry of sessions.
+
+Every ``SESSION_REAPER_INTERVAL`` seconds the reaper flips active sessions
+whose ``expires_at`` has passed to ``expired`` using set-based
+``UPDATE ... WHERE id IN (SELECT ... LIMIT n FOR UPDATE SKIP LOCKED)``
+statements, one bounded batch per transaction. ``SKIP LOCKED`` lets several
+replicas run the reaper at once without blocking each other. Expired rows are
+handed to registered hooks so Wine processes and other resources can be torn
+down.
+
+Each cycle also recounts active sessions for the ``sessions_active`` gauge,
+which the session routes adjust in between, so a Prometheus scrape never
+queries the database.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, List, Sequence
+
+from sqlalchemy import Row, func, select, update
+
+from config import settings
+from database import async_session, Session
+from services.events import event_bus
+from services.metrics import ACTIVE_SESSIONS
+from services.slots import slot_allocator
+from services.wine_processes import teardown_session
+
+logger = logging.getLogger(__name__)
+
+ExpiryHook = Callable[[Sequence[Row]], Awaitable[None]]
+
+
+class SessionReaper:
+    """Periodically expires sessions in bounded batches"""
+
+    def __init__(
+        self,
+        interval: float | None = None,
+        batch_size: int | None = None,
+        max_batches: int | None = None,
+    ):
+        self.interval = interval or settings.SESSION_REAPER_INTERVAL
+        self.batch_size = batch_size or settings.SESSION_REAPER_BATCH_SIZE
+        self.max_batches = max_batches or settings.SESSION_REAPER_MAX_BATCHES
+        self.hooks: List[ExpiryHook] = []
+        self._task: asyncio.Task | None = None
+        # monotonic time of the last active session count
+        self.counted_at: float | None = None
+        self.stats = {
+            "cycles": 0,
+            "last_reaped": 0,
+            "total_reaped": 0,
+            "last_duration_ms": 0.0,
+            "last_run_at": None,
+            "errors": 0,
+        }
+
+    def add_hook(self, hook: ExpiryHook):
+        """Register a coroutine called with each batch of expired rows"""
+        self.hooks.append(hook)
+
+    def expire_statement(self, now: datetime):
+        # expires_at is written as naive UTC, so compare against utcnow()
+        # rather than the database's timezone-aware now()
+        expired_ids = (
+            select(Session.id)
+            .where(Session.status == "active", Session.expires_at < now)
+            .order_by(Session.expires_at)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        return (
+            update(Session)
+            .where(Session.id.in_(expired_ids))
+            .values(status="expired")
+            .returning(Session.id, Session.session_id, Session.vnc_port, Session.session_metadata)
+            .execution_options(synchronize_session=False)
+        )
+
+    async def reap_once(self) -> int:
+        """Run one expiry cycle and return the number of sessions expired"""
+        started = time.perf_counter()
+        reaped = 0
+        for _ in range(self.max_batches):
+            async with async_session() as db:
+                result = await db.execute(self.expire_statement(datetime.utcnow()))
+                rows = result.all()
+                await db.commit()
+            reaped += len(rows)
+            if rows:
+                await self._run_hooks(rows)
+            if len(rows) < self.batch_size:
+                break
+
+        await self.count_active()
+
+        self.stats["cycles"] += 1
+        self.stats["last_reaped"] = reaped
+        self.stats["total_reaped"] += reaped
+        self.stats["last_duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        self.stats["last_run_at"] = datetime.utcnow().isoformat()
+        if reaped:
+            logger.info(f"Expired {reaped} sessions")
+        return reaped
+
+    async def count_active(self) -> int:
+        """Count active sessions and publish the number on the sessions_active gauge"""
+        async with async_session() as db:
+            active = await db.scalar(select(func.count()).select_from(Session).where(Session.status == "active"))
+        ACTIVE_SESSIONS.set(active or 0)
+        self.counted_at = time.monotonic()
+        return active or 0
+
+    async def _run_hooks(self, rows: Sequence[Row]):
+        for hook in self.hooks:
+            try:
+                await hook(rows)
+            except Exception as e:
+                logger.error(f"Session expiry hook {hook.__name__} failed: {e}")
+
+    async def _run(self):
+        while True:
+            try:
+                await self.reap_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Session reaper cycle failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+async def teardown_expired_sessions(rows: Sequence[Row]):
+    """Expiry hook: stop the Wine processes of expired sessions"""
+    await asyncio.gather(
+        *(teardown_session(row.session_id, row.session_metadata) for row in rows),
+        return_exceptions=True,
+    )
+
+
+async def release_expired_slots(rows: Sequence[Row]):
+    """Expiry hook: return the display/VNC slots of expired sessions"""
+    for row in rows:
+        await slot_allocator.release_for(row.session_id, row.session_metadata)
+
+
+async def publish_expired_sessions(rows: Sequence[Row]):
+    """Expiry hook: announce expired sessions on the event bus"""
+    for row in rows:
+        event_bus.publish(f"session.{row.session_id}", "expired", {"session_id": row.session_id})
+
+
+session_reaper = SessionReaper()
+session_reaper.add_hook(teardown_expired_sessions)
+session_reaper.add_hook(release_expired_slots)
+session_reaper.add_hook(publish_expired_sessions)
@@ -0,0 +1,119 @@
+"""
+Reclaims display/VNC slot leases whose holder is gone.
+
+A lease can outlive its holder: the backend can crash between leasing a
+slot and inserting the session, a release can fail while Redis is down, or
+a replica holding warm environments can die. Every ``SLOT_SWEEP_INTERVAL``
+seconds the sweeper checks each lease:
+
+- a session holder is live while the session is ``active`` in the database;
+- a warm holder (``warm:{app_id}@{owner}``) of this instance is live while
+  the warm pool still holds or is preparing that slot;
+- a warm holder of another instance is live while that instance keeps
+  refreshing its owner key (every sweep, for three intervals).
+
+A lease is only released once it was found orphaned by two consecutive
+sweeps with the same holder, so a session still being inserted is never
+touched, and the release names the holder so a slot handed out in between
+stays leased.
+"""
+import asyncio
+import logging
+from typing import Any, Collection, Dict, Set
+
+from sqlalchemy import select
+
+from config import settings
+from database import Session, read_session
+from services.slots import SlotAllocator, slot_allocator
+from services.warm_pool import warm_pool
+
+logger = logging.getLogger(__name__)
+
+
+class SlotSweeper:
+    """Periodically releases slot leases held by dead sessions or warm environments"""
+
+    def __init__(self, interval: float | None = None, allocator: SlotAllocator | None = None):
+        self.interval = interval or settings.SLOT_SWEEP_INTERVAL
+        self.allocator = allocator or slot_allocator
+        # slot index -> holder found orphaned by the previous sweep
+        self._suspects: Dict[int, str] = {}
+        self._task: asyncio.Task | None = None
+        self.stats = {"sweeps": 0, "released": 0, "suspects": 0, "errors": 0}
+
+    async def _active_sessions(self, session_ids: Collection[str]) -> Set[str]:
+        if not session_ids:
+            return set()
+        async with read_session() as db:
+            result = await db.execute(
+                select(Session.session_id)
+                .where(Session.session_id.in_(list(session_ids)), Session.status == "active")
+            )
+            return set(result.scalars())
+
+    async def _orphans(self, holders: Dict[int, str]) -> Dict[int, str]:
+        owner = settings.SLOT_OWNER_ID
+        warm = {index: holder for index, holder in holders.items() if holder.startswith("warm:")}
+        owners = {holder.rpartition("@")[2] for holder in warm.values() if "@" in holder} - {owner}
+        live_owners = await self.allocator.live_owners(owners)
+        local_warm = warm_pool.leased_slots()
+        active = await self._active_sessions([holder for index, holder in holders.items() if index not in warm])
+
+        orphans = {}
+        for index, holder in holders.items():
+            if index not in warm:
+                live = holder in active
+            elif "@" not in holder:
+                # Warm lease without an owner, from before owners were recorded
+                live = False
+            elif holder.rpartition("@")[2] == owner:
+                live = index in local_warm
+            else:
+                live = holder.rpartition("@")[2] in live_owners
+            if not live:
+                orphans[index] = holder
+        return orphans
+
+    async def sweep_once(self) -> int:
+        """Run one sweep and return the number of leases released"""
+        await self.allocator.touch_owner(settings.SLOT_OWNER_ID, self.interval * 3)
+        orphans = await self._orphans(await self.allocator.holders())
+        confirmed = {index: holder for index, holder in orphans.items() if self._suspects.get(index) == holder}
+        self._suspects = {index: holder for index, holder in orphans.items() if index not in confirmed}
+        released = 0
+        for index, holder in confirmed.items():
+            if await self.allocator.release(index, holder):
+                released += 1
+                logger.warning(f"Released slot {index} still leased to {holder}")
+        self.stats["sweeps"] += 1
+        self.stats["released"] += released
+        self.stats["suspects"] = len(self._suspects)
+        return released
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sweep_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Slot sweep failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(self.stats)
+
+
+slot_sweeper = SlotSweeper()
@@ -0,0 +1,284 @@
+"""
+Display/VNC slot allocation for concurrent sessions.
+
+Each Wine container offers ``SLOTS_PER_CONTAINER`` slots. A slot is a unique
+(container, X display, VNC port) triple, identified by a global index:
+
+    index    = container_position * SLOTS_PER_CONTAINER + local
+    display  = ":{SLOT_DISPLAY_BASE + local}"   (inside the container)
+    vnc_port = SLOT_VNC_PORT_BASE + index       (unique across containers)
+
+Free slots live in one free list per container, so allocation and release
+are O(1) pops/pushes. With the ``redis`` backend the free lists and the
+lease table are shared by every backend replica and updated by Lua scripts,
+so a slot is never handed out twice. The ``memory`` backend is for a single
+replica (local development and tests).
+
+Each lease records its holder (a session id, or ``warm:{app_id}@{owner}`` for
+a warm-pool environment of backend instance ``owner``). Releases and
+hand-overs name the holder they expect, so a late or repeated release can
+never free a slot that has since gone to someone else. Leases whose holder
+is gone are reclaimed by ``services.slot_sweeper``.
+"""
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Collection, Deque, Dict, List, Set
+
+from redis.exceptions import RedisError
+
+from config import settings
+from services.redis_pool import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class SlotUnavailableError(Exception):
+    """Raised when the slot store cannot be reached"""
+
+
+@dataclass(frozen=True)
+class Slot:
+    index: int
+    container: str
+    display: str
+    vnc_port: int
+
+    def to_metadata(self) -> Dict[str, Any]:
+        return {
+            "slot_index": self.index,
+            "container": self.container,
+            "display": self.display,
+            "vnc_port": self.vnc_port,
+        }
+
+
+# KEYS: free list, leases hash, seeded marker; ARGV: session id, first index, count
+ALLOCATE_SCRIPT = """
+if redis.call('SETNX', KEYS[3], 1) == 1 then
+    for i = 0, tonumber(ARGV[3]) - 1 do
+        redis.call('RPUSH', KEYS[1], tonumber(ARGV[2]) + i)
+    end
+end
+local index = redis.call('LPOP', KEYS[1])
+if index then
+    redis.call('HSET', KEYS[2], index, ARGV[1])
+end
+return index
+"""
+
+# KEYS: free list, leases hash; ARGV: slot index, expected holder
+RELEASE_SCRIPT = """
+if redis.call('HGET', KEYS[2], ARGV[1]) == ARGV[2] then
+    redis.call('HDEL', KEYS[2], ARGV[1])
+    redis.call('RPUSH', KEYS[1], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+# KEYS: leases hash; ARGV: slot index, expected holder, new holder
+REASSIGN_SCRIPT = """
+if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+    return 1
+end
+return 0
+"""
+
+
+class SlotAllocator:
+    """Hands out unique display/VNC slots from per-container free lists"""
+
+    def __init__(self, backend: str | None = None, containers: List[str] | None = None, per_container: int | None = None):
+        self.backend = backend or settings.SLOT_BACKEND
+        self.containers = containers or settings.get_slot_containers()
+        self.per_container = per_container or settings.SLOTS_PER_CONTAINER
+        self.leases_key = "slots:leases"
+        self._next = 0
+        self._scripts: Dict[str, Any] = {}
+        # memory backend state
+        self._free: Dict[str, Deque[int]] = {
+            container: deque(self._indices(container)) for container in self.containers
+        }
+        self._leases: Dict[int, str] = {}
+
+    @property
+    def capacity(self) -> int:
+        return len(self.containers) * self.per_container
+
+    def _indices(self, container: str) -> range:
+        first = self.containers.index(container) * self.per_container
+        return range(first, first + self.per_container)
+
+    def slot(self, index: int) -> Slot:
+        """Describe the slot with the given global index"""
+        container = self.containers[index // self.per_container]
+        local = index % self.per_container
+        return Slot(
+            index=index,
+            container=container,
+            display=f":{settings.SLOT_DISPLAY_BASE + local}",
+            vnc_port=settings.SLOT_VNC_PORT_BASE + index,
+        )
+
+    def _script(self, name: str, source: str):
+        if name not in self._scripts:
+            self._scripts[name] = get_redis().register_script(source)
+        return self._scripts[name]
+
+    def _candidates(self, container: str | None) -> List[str]:
+        if container is not None:
+            if container not in self.containers:
+                raise ValueError(f"Unknown slot container: {container}")
+            return [container]
+        # Rotate the starting container so load spreads across containers
+        start = self._next % len(self.containers)
+        self._next += 1
+        return self.containers[start:] + self.containers[:start]
+
+    async def allocate(self, session_id: str, container: str | None = None) -> Slot | None:
+        """Lease a free slot to a session, or return None when all are taken"""
+        for candidate in self._candidates(container):
+            if self.backend == "memory":
+                free = self._free[candidate]
+                if not free:
+                    continue
+                index = free.popleft()
+                self._leases[index] = session_id
+                return self.slot(index)
+
+            indices = self._indices(candidate)
+            try:
+                index = await self._script("allocate", ALLOCATE_SCRIPT)(
+                    keys=[f"slots:free:{candidate}", self.leases_key, f"slots:seeded:{candidate}"],
+                    args=[session_id, indices.start, len(indices)],
+                )
+            except RedisError as e:
+                raise SlotUnavailableError(str(e)) from e
+            if index is not None:
+                return self.slot(int(index))
+        return None
+
+    async def release(self, index: int, holder: str) -> bool:
+        """Return a slot to its free list if ``holder`` still holds it
+
+        Releasing twice, or after the slot went to another holder, is a no-op.
+        """
+        container = self.slot(index).container
+        if self.backend == "memory":
+            if self._leases.get(index) != holder:
+                return False
+            del self._leases[index]
+            self._free[container].append(index)
+            return True
+
+        try:
+            released = await self._script("release", RELEASE_SCRIPT)(
+                keys=[f"slots:free:{container}", self.leases_key],
+                args=[index, holder],
+            )
+        except RedisError as e:
+            raise SlotUnavailableError(str(e)) from e
+        return bool(released)
+
+    async def reassign(self, index: int, holder: str, new_holder: str) -> bool:
+        """Hand a leased slot over (a warm environment to the session claiming it)"""
+        if self.backend == "memory":
+            if self._leases.get(index) != holder:
+                return False
+            self._leases[index] = new_holder
+            return True
+
+        try:
+            reassigned = await self._script("reassign", REASSIGN_SCRIPT)(
+                keys=[self.leases_key],
+                args=[index, holder, new_holder],
+            )
+        except RedisError as e:
+            raise SlotUnavailableError(str(e)) from e
+        return bool(reassigned)
+
+    async def release_for(self, session_id: str, metadata: Dict[str, Any] | None):
+        """Release the slot recorded in a session's metadata, if any"""
+        index = (metadata or {}).get("slot_index")
+        if index is None:
+            return
+        try:
+            await self.release(int(index), session_id)
+        except SlotUnavailableError as e:
+            logger.error(f"Failed to release slot {index} of session {session_id}: {e}")
+
+    async def holders(self) -> Dict[int, str]:
+        """Holder of every leased slot, by slot index"""
+        if self.backend == "memory":
+            return dict(self._leases)
+        try:
+            leases = await get_redis().hgetall(self.leases_key)
+        except RedisError as e:
+            raise SlotUnavailableError(str(e)) from e
+        return {int(index): holder.decode() if isinstance(holder, bytes) else holder for index, holder in leases.items()}
+
+    async def touch_owner(self, owner: str, ttl: float):
+        """Mark a backend instance alive for ``ttl`` seconds (its warm leases are kept)"""
+        if self.backend == "memory":
+            return
+        try:
+            await get_redis().set(f"slots:owner:{owner}", 1, ex=max(1, int(ttl)))
+        except RedisError as e:
+            raise SlotUnavailableError(str(e)) from e
+
+    async def live_owners(self, owners: Collection[str]) -> Set[str]:
+        """The backend instances among ``owners`` that are still alive"""
+        owners = list(owners)
+        if self.backend == "memory" or not owners:
+            return set()
+        try:
+            async with get_redis().pipeline(transaction=False) as pipe:
+                for owner in owners:
+                    pipe.exists(f"slots:owner:{owner}")
+                results = await pipe.execute()
+        except RedisError as e:
+            raise SlotUnavailableError(str(e)) from e
+        return {owner for owner, alive in zip(owners, results) if alive}
+
+    async def leased(self) -> List[Slot]:
+        """Slots currently leased to sessions or warm environments"""
+        if self.backend == "memory":
+            indices = list(self._leases)
+        else:
+            try:
+                indices = await get_redis().hkeys(self.leases_key)
+            except RedisError as e:
+                raise SlotUnavailableError(str(e)) from e
+        return [self.slot(int(index)) for index in sorted(int(i) for i in indices)]
+
+    async def stats(self) -> Dict[str, Any]:
+        """Free and leased slot counts per container"""
+        if self.backend == "memory":
+            free = {container: len(self._free[container]) for container in self.containers}
+            leased = len(self._leases)
+        else:
+            try:
+                async with get_redis().pipeline(transaction=False) as pipe:
+                    for container in self.containers:
+                        pipe.llen(f"slots:free:{container}")
+                        pipe.exists(f"slots:seeded:{container}")
+                    pipe.hlen(self.leases_key)
+                    results = await pipe.execute()
+            except RedisError as e:
+                raise SlotUnavailableError(str(e)) from e
+            free = {}
+            for position, container in enumerate(self.containers):
+                length, seeded = results[2 * position:2 * position + 2]
+                free[container] = length if seeded else self.per_container
+            leased = results[-1]
+        return {
+            "backend": self.backend,
+            "capacity": self.capacity,
+            "leased": leased,
+            "free": free,
+        }
+
+
+slot_allocator = SlotAllocator()
@@ -0,0 +1,284 @@
+"""
+Warm pool of pre-initialized Wine environments.
+
+For each active ``Application`` (up to ``WARM_POOL_MAX_APPS``) the pool keeps
+``WARM_POOL_SIZE`` environments ready: a leased display/VNC slot with Xvfb,
+fluxbox and x11vnc running, an initialized Wine prefix built from the
+application's ``wine_config`` and a persistent wineserver. Sessions created
+for the application claim one, and a background task refills the pool.
+
+When the application list is refreshed, idle environments of applications
+that left it, or whose ``wine_config`` changed, are torn down and their slots
+released; the refill builds new ones from the current configuration.
+
+Draining a node goes through ``node_drained``, which evicts the idle
+environments on it here and broadcasts a ``node`` event so every other
+replica evicts its own.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Collection, Deque, Dict, Set
+
+from sqlalchemy import select
+
+from config import settings
+from database import async_session, Application
+from services.events import event_bus
+from services.scheduler import node_scheduler
+from services.slots import Slot, slot_allocator
+from services.wine_processes import (
+    prepare_environment,
+    session_prefix,
+    teardown_session,
+    wine_environment,
+)
+
+logger = logging.getLogger(__name__)
+
+NODE_TOPIC = "node"
+
+
+@dataclass
+class WineEnvironment:
+    app_id: int
+    slot: Slot
+    env: Dict[str, str]
+    ready_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def prefix(self) -> str:
+        return self.env["WINEPREFIX"]
+
+    @property
+    def holder(self) -> str:
+        return warm_holder(self.app_id)
+
+    def to_metadata(self) -> Dict[str, Any]:
+        return {**self.slot.to_metadata(), "wine_prefix": self.prefix}
+
+
+class LatencyStats:
+    """Rolling latency samples with summary percentiles"""
+
+    def __init__(self, max_samples: int = 1000):
+        self.count = 0
+        self.samples: Deque[float] = deque(maxlen=max_samples)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.samples.append(seconds)
+
+    def summary(self) -> Dict[str, Any]:
+        ordered = sorted(self.samples)
+
+        def percentile(p: float) -> float | None:
+            if not ordered:
+                return None
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 2)
+
+        return {
+            "count": self.count,
+            "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2) if ordered else None,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "max_ms": round(ordered[-1] * 1000, 2) if ordered else None,
+        }
+
+
+def warm_holder(app_id: int) -> str:
+    """Slot lease holder for this instance's warm environments of an application"""
+    return f"warm:{app_id}@{settings.SLOT_OWNER_ID}"
+
+
+def resolution_for(wine_config: Dict[str, Any] | None) -> str | None:
+    graphics = (wine_config or {}).get("graphics") or {}
+    resolution = graphics.get("resolution")
+    return f"{resolution}x24" if resolution else None
+
+
+class WarmPool:
+    """Keeps pre-started Wine environments per application"""
+
+    def __init__(self, size: int | None = None, max_apps: int | None = None):
+        self.size = settings.WARM_POOL_SIZE if size is None else size
+        self.max_apps = max_apps or settings.WARM_POOL_MAX_APPS
+        self._ready: Dict[int, Deque[WineEnvironment]] = {}
+        self._configs: Dict[int, Dict[str, Any]] = {}
+        # Slots leased for environments still being prepared
+        self._preparing: Set[int] = set()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._listener: asyncio.Task | None = None
+        self.latency = {"warm": LatencyStats(), "cold": LatencyStats()}
+        self.stats = {"claims": 0, "misses": 0, "prepared": 0, "prepare_failures": 0, "retired": 0}
+
+    async def load_applications(self):
+        """Refresh the set of applications kept warm"""
+        async with async_session() as db:
+            result = await db.execute(
+                select(Application.id, Application.wine_config)
+                .where(Application.is_active == True)
+                .order_by(Application.id)
+                .limit(self.max_apps)
+            )
+            configs = {row.id: row.wine_config or {} for row in result}
+        previous, self._configs = self._configs, configs
+        stale = []
+        for app_id in list(self._ready):
+            if app_id not in configs:
+                stale += self._ready.pop(app_id)
+            elif app_id in previous and previous[app_id] != configs[app_id]:
+                stale += self._ready[app_id]
+                self._ready[app_id].clear()
+        for app_id in configs:
+            self._ready.setdefault(app_id, deque())
+        await self._retire(stale)
+
+    def claim(self, app_id: int, nodes: Collection[str] | None = None) -> WineEnvironment | None:
+        """Take a ready environment for an application, if one is available
+
+        With ``nodes``, only environments on those nodes are handed out.
+        """
+        self._wakeup.set()
+        ready = self._ready.get(app_id) or ()
+        for environment in ready:
+            if nodes is None or environment.slot.container in nodes:
+                ready.remove(environment)
+                self.stats["claims"] += 1
+                return environment
+        self.stats["misses"] += 1
+        return None
+
+    async def prepare(self, app_id: int, wine_config: Dict[str, Any], slot: Slot) -> WineEnvironment:
+        """Initialize a Wine environment for an application on a leased slot"""
+        env = wine_environment(wine_config, session_prefix(app_id, slot.index), slot.display)
+        await prepare_environment(slot.container, slot.vnc_port, env, resolution_for(wine_config))
+        return WineEnvironment(app_id=app_id, slot=slot, env=env)
+
+    async def _has_spare_slots(self) -> bool:
+        stats = await slot_allocator.stats()
+        return stats["capacity"] - stats["leased"] > settings.WARM_POOL_MIN_FREE_SLOTS
+
+    async def refill(self):
+        """Top every application's pool back up to the configured size"""
+        for app_id, wine_config in list(self._configs.items()):
+            ready = self._ready.setdefault(app_id, deque())
+            while len(ready) < self.size:
+                if not await self._has_spare_slots():
+                    return
+                slot = await node_scheduler.allocate(warm_holder(app_id), app_id)
+                if slot is None:
+                    return
+                self._preparing.add(slot.index)
+                try:
+                    ready.append(await self.prepare(app_id, wine_config, slot))
+                    self.stats["prepared"] += 1
+                except Exception as e:
+                    self.stats["prepare_failures"] += 1
+                    await slot_allocator.release(slot.index, warm_holder(app_id))
+                    logger.error(f"Failed to warm an environment for application {app_id}: {e}")
+                    break
+                finally:
+                    self._preparing.discard(slot.index)
+
+    async def _run(self):
+        last_load = 0.0
+        while True:
+            try:
+                if time.monotonic() - last_load >= settings.WARM_POOL_REFRESH_INTERVAL:
+                    await self.load_applications()
+                    last_load = time.monotonic()
+                await self.refill()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Warm pool refill failed: {e}")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.WARM_POOL_REFRESH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _listen(self):
+        while True:
+            subscription = event_bus.subscribe([NODE_TOPIC])
+            try:
+                while True:
+                    event = await subscription.queue.get()
+                    if event["type"] == "dropped":
+                        # Fell behind: resubscribe, the next refresh catches up on drained nodes
+                        break
+                    node = event["data"].get("node")
+                    if event["type"] == "drained" and node:
+                        try:
+                            await self.evict(node)
+                        except Exception as e:
+                            logger.error(f"Failed to evict warm environments on drained node {node}: {e}")
+            finally:
+                event_bus.unsubscribe(subscription)
+
+    def start(self):
+        if self.size > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        """Stop refilling and hand idle environments' slots back"""
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for ready in self._ready.values():
+            environments = list(ready)
+            ready.clear()
+            await self._retire(environments)
+
+    async def evict(self, container: str) -> int:
+        """Tear down the idle environments on a node (which is being drained)"""
+        evicted = []
+        for ready in self._ready.values():
+            for environment in [environment for environment in ready if environment.slot.container == container]:
+                ready.remove(environment)
+                evicted.append(environment)
+        await self._retire(evicted)
+        return len(evicted)
+
+    async def _retire(self, environments: Collection[WineEnvironment]):
+        """Tear down idle environments (already removed from the pool) and release their slots"""
+        for environment in environments:
+            try:
+                await teardown_session(f"warm:{environment.app_id}", environment.to_metadata())
+            finally:
+                await slot_allocator.release_for(environment.holder, environment.to_metadata())
+        self.stats["retired"] += len(environments)
+
+    async def node_drained(self, name: str) -> int:
+        """Evict the idle environments on a drained node here and on every other replica"""
+        evicted = await self.evict(name)
+        event_bus.publish(NODE_TOPIC, "drained", {"node": name})
+        return evicted
+
+    def leased_slots(self) -> Set[int]:
+        """Slots this instance holds for ready or in-progress environments"""
+        return self._preparing | {environment.slot.index for ready in self._ready.values() for environment in ready}
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "ready": {app_id: len(ready) for app_id, ready in self._ready.items()},
+            "latency": {kind: stats.summary() for kind, stats in self.latency.items()},
+            **self.stats,
+        }
+
+
+warm_pool = WarmPool()
@@ -0,0 +1,192 @@
+"""
+Shared HTTP client for the Wine service.
+
+A single pooled ``httpx.AsyncClient`` is opened in the application lifespan and
+reused by every route that proxies to ``settings.WINE_SERVICE_URL``, so requests
+reuse keep-alive (and, when available, HTTP/2) connections instead of paying
+for a new TCP handshake each time.
+"""
+import asyncio
+import importlib.util
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+
+import httpx
+
+from config import settings
+from services.metrics import WINE_SERVICE_LATENCY
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRYABLE_STATUS_CODES = {502, 503, 504}
+
+# Per-route read timeouts (seconds); anything else uses the default
+ROUTE_TIMEOUTS = {
+    "/api/execute": settings.WINE_EXECUTE_TIMEOUT,
+    "/api/screenshot": settings.WINE_SCREENSHOT_TIMEOUT,
+    "/api/execute/stream": settings.WINE_EXECUTE_STREAM_IDLE_TIMEOUT,
+}
+DEFAULT_TIMEOUT = 10.0
+
+
+class WineServiceClient:
+    """Lifespan-managed, pooled client for the Wine service"""
+
+    def __init__(self, base_url: str | None = None, transport: httpx.AsyncBaseTransport | None = None):
+        self.base_url = base_url or settings.WINE_SERVICE_URL
+        self._transport = transport
+        self._client: httpx.AsyncClient | None = None
+        self.stats = {
+            "requests": 0,
+            "retries": 0,
+            "failures": 0,
+            "in_flight": 0,
+        }
+
+    async def start(self):
+        """Open the underlying connection pool"""
+        if self._client is not None:
+            return
+        http2 = settings.WINE_SERVICE_HTTP2 and importlib.util.find_spec("h2") is not None
+        if settings.WINE_SERVICE_HTTP2 and not http2:
+            logger.warning("WINE_SERVICE_HTTP2 enabled but 'h2' is not installed, using HTTP/1.1")
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            http2=http2,
+            transport=self._transport,
+            limits=httpx.Limits(
+                max_connections=settings.WINE_SERVICE_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.WINE_SERVICE_MAX_KEEPALIVE,
+                keepalive_expiry=settings.WINE_SERVICE_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(DEFAULT_TIMEOUT, connect=settings.WINE_SERVICE_CONNECT_TIMEOUT),
+        )
+        logger.info(f"Wine service client started (base_url={self.base_url}, http2={http2})")
+
+    async def close(self):
+        """Close the connection pool"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            raise RuntimeError("Wine service client is not started")
+        return self._client
+
+    def timeout_for(self, path: str) -> httpx.Timeout:
+        return httpx.Timeout(
+            ROUTE_TIMEOUTS.get(path, DEFAULT_TIMEOUT),
+            connect=settings.WINE_SERVICE_CONNECT_TIMEOUT,
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter"""
+        ceiling = min(settings.WINE_SERVICE_BACKOFF_MAX, settings.WINE_SERVICE_BACKOFF_BASE * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    async def request(
+        self, method: str, path: str, retry: bool | None = None, route: str | None = None, **kwargs
+    ) -> httpx.Response:
+        """Send a request to the Wine service, retrying idempotent calls on transient failures
+
+        ``route`` is the path template recorded in metrics, e.g.
+        ``/api/execute/{id}``; pass it whenever ``path`` embeds an id.
+        """
+        if self._client is None:
+            await self.start()
+        method = method.upper()
+        if retry is None:
+            retry = method in IDEMPOTENT_METHODS
+        attempts = settings.WINE_SERVICE_RETRIES + 1 if retry else 1
+        kwargs.setdefault("timeout", self.timeout_for(path))
+
+        self.stats["requests"] += 1
+        self.stats["in_flight"] += 1
+        started = time.perf_counter()
+        status = "error"
+        try:
+            for attempt in range(attempts):
+                last_attempt = attempt == attempts - 1
+                try:
+                    response = await self.client.request(method, path, **kwargs)
+                except (httpx.TransportError, httpx.TimeoutException):
+                    if last_attempt:
+                        self.stats["failures"] += 1
+                        raise
+                else:
+                    if response.status_code not in RETRYABLE_STATUS_CODES or last_attempt:
+                        status = str(response.status_code)
+                        return response
+                    await response.aclose()
+                self.stats["retries"] += 1
+                await asyncio.sleep(self.backoff(attempt))
+        finally:
+            self.stats["in_flight"] -= 1
+            WINE_SERVICE_LATENCY.labels(method, route or path, status).observe(time.perf_counter() - started)
+
+    @asynccontextmanager
+    async def stream(self, method: str, path: str, route: str | None = None, **kwargs) -> AsyncIterator[httpx.Response]:
+        """Send a request and yield the response with its body still unread
+
+        Streams are never retried. The read timeout applies to each chunk, and
+        leaving the block early closes the connection.
+        """
+        if self._client is None:
+            await self.start()
+        method = method.upper()
+        kwargs.setdefault("timeout", self.timeout_for(path))
+
+        self.stats["requests"] += 1
+        self.stats["in_flight"] += 1
+        started = time.perf_counter()
+        status = "error"
+        try:
+            async with self.client.stream(method, path, **kwargs) as response:
+                status = str(response.status_code)
+                yield response
+        except (httpx.TransportError, httpx.TimeoutException):
+            self.stats["failures"] += 1
+            raise
+        finally:
+            self.stats["in_flight"] -= 1
+            WINE_SERVICE_LATENCY.labels(method, route or path, status).observe(time.perf_counter() - started)
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", path, **kwargs)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Request counters plus a snapshot of the connection pool"""
+        pool = {"connections": 0, "idle": 0, "active": 0, "http2": 0}
+        transport = getattr(self._client, "_transport", None)
+        connections = getattr(getattr(transport, "_pool", None), "connections", [])
+        for connection in connections:
+            pool["connections"] += 1
+            if connection.is_idle():
+                pool["idle"] += 1
+            else:
+                pool["active"] += 1
+            if getattr(connection, "_connection", None).__class__.__name__ == "AsyncHTTP2Connection":
+                pool["http2"] += 1
+        return {
+            "started": self._client is not None,
+            "base_url": self.base_url,
+            "limits": {
+                "max_connections": settings.WINE_SERVICE_MAX_CONNECTIONS,
+                "max_keepalive_connections": settings.WINE_SERVICE_MAX_KEEPALIVE,
+                "keepalive_expiry": settings.WINE_SERVICE_KEEPALIVE_EXPIRY,
+            },
+            "pool": pool,
+            **self.stats,
+        }
+
+
+wine_client = WineServiceClient()
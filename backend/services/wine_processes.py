@@ -0,0 +1,141 @@
+"""
+Helpers for managing Wine processes that belong to a session.
+
+Commands run inside the Wine containers through the configured executor
+(see services/executors.py) as argv lists, so nothing is interpolated into a
+shell.
+"""
+import logging
+from typing import Any, Dict, List
+
+from config import settings
+from services.executors import get_executor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESOLUTION = "1280x960x24"
+# Record the daemon's pid before exec-ing it, so the pid stays the daemon's own
+DAEMON_WRAPPER = 'echo $$ > "$0"; exec "$@"'
+STOP_DAEMONS_SCRIPT = 'for f in "$@"; do [ -f "$f" ] && kill -TERM "$(cat "$f")" 2>/dev/null; rm -f "$f"; done; true'
+# Print the launched games whose recorded pid is alive and forget the others
+RUNNING_GAMES_SCRIPT = (
+    'for f in /tmp/game-*.pid; do [ -f "$f" ] || continue; '
+    'if kill -0 "$(cat "$f")" 2>/dev/null; then echo "$f"; else rm -f "$f"; fi; done'
+)
+
+
+async def container_exec(
+    container: str,
+    argv: List[str],
+    env: Dict[str, str] | None = None,
+    workdir: str | None = None,
+    detach: bool = False,
+) -> int:
+    """Run a command in a Wine container as the Wine user and return its exit code"""
+    return await get_executor().run(container, argv, env=env, workdir=workdir, detach=detach)
+
+
+def wine_environment(wine_config: Dict[str, Any] | None, prefix: str, display: str) -> Dict[str, str]:
+    """Environment for Wine processes of one application on one display"""
+    wine_config = wine_config or {}
+    env = {
+        "WINEPREFIX": prefix,
+        "WINEARCH": wine_config.get("WINEARCH", "win64"),
+        "WINEDEBUG": wine_config.get("WINEDEBUG", "-all"),
+    }
+    env.update({str(k): str(v) for k, v in (wine_config.get("environment") or {}).items()})
+    env["DISPLAY"] = display
+    return env
+
+
+def session_prefix(app_id: int | None, slot_index: int) -> str:
+    """Per-slot Wine prefix, reused by later sessions on the same slot"""
+    return f"{settings.WINE_PREFIX_ROOT}/app{app_id or 0}-slot{slot_index}"
+
+
+def daemon_pid_file(display: str, name: str) -> str:
+    """Where a display's X/VNC daemon records its pid, e.g. /tmp/Xvfb-101.pid"""
+    return f"/tmp/{name}-{display.lstrip(':')}.pid"
+
+
+def game_pid_file(display: str, label: str, launch_id: str) -> str:
+    """Where a launched game records its pid, e.g. /tmp/game-101-cs16-<launch id>.pid"""
+    return f"/tmp/game-{display.lstrip(':')}-{label}-{launch_id}.pid"
+
+
+async def launch_detached(
+    container: str,
+    argv: List[str],
+    pid_file: str,
+    env: Dict[str, str] | None = None,
+    workdir: str | None = None,
+) -> int:
+    """Start a long-running program without waiting for it, recording its pid in ``pid_file``"""
+    return await container_exec(
+        container, ["sh", "-c", DAEMON_WRAPPER, pid_file, *argv], env=env, workdir=workdir, detach=True
+    )
+
+
+async def running_games(container: str) -> List[Dict[str, str]]:
+    """Games started by ``launch_detached`` that are still running in a container"""
+    output: List[bytes] = []
+
+    def on_output(name: str, chunk: bytes):
+        if name == "stdout":
+            output.append(chunk)
+
+    await get_executor().run(container, ["sh", "-c", RUNNING_GAMES_SCRIPT], on_output=on_output)
+    games = []
+    for line in b"".join(output).decode(errors="replace").split():
+        # /tmp/game-{display}-{label}-{launch id}.pid
+        display, _, rest = line.removeprefix("/tmp/game-").removesuffix(".pid").partition("-")
+        label, _, launch_id = rest.rpartition("-")
+        games.append({"game": label, "display": f":{display}", "container": container, "launch_id": launch_id})
+    return games
+
+
+async def prepare_environment(container: str, vnc_port: int, env: Dict[str, str], resolution: str | None = None):
+    """Bring up X, the window manager, VNC, the Wine prefix and a persistent wineserver
+
+    This is the cold-start work a launch otherwise waits for; the warm pool
+    runs it ahead of time.
+    """
+    display = env["DISPLAY"]
+    daemons = [
+        ["Xvfb", display, "-screen", "0", resolution or DEFAULT_RESOLUTION],
+        ["fluxbox", "-display", display],
+        ["x11vnc", "-display", display, "-forever", "-shared", "-rfbport", str(vnc_port),
+         "-passwd", settings.VNC_PASSWORD],
+    ]
+    for argv in daemons:
+        pid_file = daemon_pid_file(display, argv[0])
+        await container_exec(container, ["sh", "-c", DAEMON_WRAPPER, pid_file, *argv], env=env, detach=True)
+    returncode = await container_exec(container, ["wineboot", "--init"], env=env)
+    if returncode != 0:
+        raise RuntimeError(f"wineboot --init failed with exit code {returncode}")
+    await container_exec(container, ["wineserver", "-p"], env=env, detach=True)
+
+
+async def teardown_session(session_id: str, metadata: Dict[str, Any] | None):
+    """Stop the session's Wine processes and the X, window manager and VNC daemons of its display
+
+    ``wineserver -k`` kills all processes attached to one WINEPREFIX, so this
+    is only done for sessions that recorded their own prefix. The daemons are
+    stopped by the pids ``prepare_environment`` recorded for the display,
+    newest first.
+    """
+    metadata = metadata or {}
+    prefix = metadata.get("wine_prefix")
+    display = metadata.get("display")
+    if not prefix:
+        return
+    container = metadata.get("container", settings.WINE_CONTAINER)
+    try:
+        returncode = await container_exec(container, ["wineserver", "-k"], env={"WINEPREFIX": prefix})
+        if returncode != 0:
+            logger.warning(f"wineserver -k for session {session_id} exited with {returncode}")
+        if display:
+            pid_files = [daemon_pid_file(display, name) for name in ("x11vnc", "fluxbox", "Xvfb")]
+            await container_exec(container, ["sh", "-c", STOP_DAEMONS_SCRIPT, "stop-daemons", *pid_files])
+    except OSError as e:
+        logger.error(f"Failed to tear down session {session_id}: {e}")
@@ -0,0 +1,682 @@
+"""
+Low-code workflow engine.
+
+A workflow is the builder's ``components`` (nodes) plus ``connections``
+(edges). ``build_graph`` turns them into a validated DAG, rejecting unknown
+node types, dangling edges and cycles, and ``WorkflowRun`` executes it: a node
+starts as soon as all of its upstream nodes have finished, so independent
+branches run concurrently, bounded by ``WORKFLOW_MAX_CONCURRENCY``. Each node
+runs under its own timeout and the whole run can be cancelled.
+
+Connections leaving a ``conditional`` node may carry ``"branch": "true"`` or
+``"false"``; nodes reachable only through the branch not taken are skipped.
+String values in a node's config may reference workflow inputs and upstream
+outputs as ``{{inputs.name}}`` or ``{{<node id>.field}}``.
+
+Validation is done once: ``compile_plan`` flattens the graph into an
+immutable ``WorkflowPlan`` (nodes pre-sorted, dependency counters and
+timeouts precomputed, static configs marked so they skip placeholder
+resolution), and ``workflow_plans`` caches plans in an LRU keyed by a hash
+of the workflow's content, so re-running a saved workflow goes straight to
+scheduling.
+
+``api_call`` nodes fetch URLs from the server, so their targets are checked
+first: the host must be in ``WORKFLOW_API_ALLOWED_HOSTS`` when that is set,
+and must not resolve to a loopback, link-local, private or otherwise
+non-public address (cloud metadata endpoints, cluster services) unless
+``WORKFLOW_API_ALLOW_PRIVATE_NETWORKS`` is set. Redirects are not followed.
+"""
+import asyncio
+import copy
+import hashlib
+import ipaddress
+import json
+import logging
+import operator
+import re
+import socket
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Tuple
+
+import httpcore
+import httpx
+
+from config import settings
+from services.cache import LRUCache
+from services.events import event_bus
+from services.wine_client import wine_client
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_NODE_STATUSES = {"succeeded", "failed", "timed_out", "skipped", "cancelled"}
+# Builder widgets that carry no behaviour of their own; they pass their config through
+PASSTHROUGH_TYPES = {"button", "input", "dropdown", "file_upload"}
+
+PLACEHOLDER = re.compile(r"\{\{\s*([\w.-]+)\s*\}\}")
+OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "gt": operator.gt,
+    "ge": operator.ge,
+    "lt": operator.lt,
+    "le": operator.le,
+    "contains": lambda left, right: right in left,
+    "truthy": lambda left, _: bool(left),
+    "falsy": lambda left, _: not left,
+}
+
+
+class WorkflowValidationError(ValueError):
+    """Raised when a workflow is not a valid DAG of known components"""
+
+
+@dataclass
+class WorkflowNode:
+    id: str
+    type: str
+    name: str
+    config: Dict[str, Any]
+
+
+@dataclass
+class WorkflowEdge:
+    source: str
+    target: str
+    branch: str | None = None
+
+
+@dataclass
+class WorkflowGraph:
+    nodes: Dict[str, WorkflowNode]
+    order: List[str]
+    parents: Dict[str, List[WorkflowEdge]]
+    children: Dict[str, List[str]]
+
+
+def _node_id(value: Any) -> str:
+    return str(value) if value is not None else ""
+
+
+def build_graph(components: List[Dict[str, Any]], connections: List[Dict[str, Any]]) -> WorkflowGraph:
+    """Parse and validate a workflow, returning its nodes in topological order"""
+    if len(components) > settings.WORKFLOW_MAX_NODES:
+        raise WorkflowValidationError(f"Workflow has more than {settings.WORKFLOW_MAX_NODES} components")
+
+    nodes: Dict[str, WorkflowNode] = {}
+    for position, component in enumerate(components):
+        node_id = _node_id(component.get("id"))
+        if not node_id:
+            raise WorkflowValidationError(f"Component at position {position} has no id")
+        if node_id in nodes:
+            raise WorkflowValidationError(f"Duplicate component id {node_id}")
+        node_type = component.get("type") or component.get("component_type")
+        if node_type not in NODE_HANDLERS and node_type not in PASSTHROUGH_TYPES:
+            raise WorkflowValidationError(f"Component {node_id} has unsupported type {node_type!r}")
+        nodes[node_id] = WorkflowNode(
+            id=node_id,
+            type=node_type,
+            name=component.get("name") or node_type,
+            config=component.get("config") or {},
+        )
+
+    parents: Dict[str, List[WorkflowEdge]] = {node_id: [] for node_id in nodes}
+    children: Dict[str, List[str]] = {node_id: [] for node_id in nodes}
+    for connection in connections:
+        source = _node_id(connection.get("source", connection.get("from")))
+        target = _node_id(connection.get("target", connection.get("to")))
+        for end in (source, target):
+            if end not in nodes:
+                raise WorkflowValidationError(f"Connection references unknown component {end or '(none)'}")
+        if source == target:
+            raise WorkflowValidationError(f"Component {source} is connected to itself")
+        branch = connection.get("branch")
+        if branch is not None:
+            branch = str(branch).lower()
+            if nodes[source].type != "conditional" or branch not in ("true", "false"):
+                raise WorkflowValidationError(
+                    f"Connection {source} -> {target}: branch must be 'true' or 'false' on a conditional"
+                )
+        parents[target].append(WorkflowEdge(source, target, branch))
+        children[source].append(target)
+
+    # Kahn's algorithm; anything left unsorted sits on a cycle
+    in_degree = {node_id: len(edges) for node_id, edges in parents.items()}
+    ready = deque(node_id for node_id in nodes if in_degree[node_id] == 0)
+    order: List[str] = []
+    while ready:
+        node_id = ready.popleft()
+        order.append(node_id)
+        for child in children[node_id]:
+            in_degree[child] -= 1
+            if in_degree[child] == 0:
+                ready.append(child)
+    if len(order) != len(nodes):
+        cyclic = sorted(node_id for node_id, degree in in_degree.items() if degree > 0)
+        raise WorkflowValidationError(f"Workflow contains a cycle through components {', '.join(cyclic)}")
+
+    return WorkflowGraph(nodes=nodes, order=order, parents=parents, children=children)
+
+
+def _lookup(context: Dict[str, Any], path: str) -> Any:
+    value: Any = context
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            raise KeyError(f"Cannot resolve {{{{{path}}}}}")
+    return value
+
+
+def resolve(value: Any, context: Dict[str, Any]) -> Any:
+    """Substitute ``{{path}}`` placeholders; a lone placeholder keeps the referenced value's type"""
+    if isinstance(value, str):
+        match = PLACEHOLDER.fullmatch(value.strip())
+        if match:
+            return _lookup(context, match.group(1))
+        return PLACEHOLDER.sub(lambda m: str(_lookup(context, m.group(1))), value)
+    if isinstance(value, dict):
+        return {key: resolve(item, context) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve(item, context) for item in value]
+    return value
+
+
+# Node handlers: (config with placeholders resolved, run) -> output
+
+async def _wine_command(command: str, args: List[str], wine_prefix: str | None) -> Dict[str, Any]:
+    response = await wine_client.post(
+        "/api/execute",
+        json={"command": command, "args": args, "wine_prefix": wine_prefix},
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f"Wine service returned HTTP {response.status_code}")
+    data = response.json()
+    if data.get("error"):
+        raise RuntimeError(data["error"])
+    return {"output": data.get("output", "")}
+
+
+async def run_wine_execute(config: Dict[str, Any], run: "WorkflowRun") -> Dict[str, Any]:
+    if not config.get("command"):
+        raise ValueError("wine_execute requires 'command'")
+    return await _wine_command(config["command"], list(config.get("args") or []), config.get("wine_prefix"))
+
+
+async def run_wine_install(config: Dict[str, Any], run: "WorkflowRun") -> Dict[str, Any]:
+    installer = config.get("installer")
+    if not installer:
+        raise ValueError("wine_install requires 'installer'")
+    silent = config.get("silent", True)
+    extra = list(config.get("args") or [])
+    if installer.lower().endswith(".msi"):
+        command, args = "msiexec", ["/i", installer, *(["/qn"] if silent else []), *extra]
+    else:
+        command, args = "wine", [installer, *(["/S"] if silent else []), *extra]
+    return await _wine_command(command, args, config.get("wine_prefix"))
+
+
+async def run_wine_config(config: Dict[str, Any], run: "WorkflowRun") -> Dict[str, Any]:
+    version = config.get("windows_version")
+    if not version:
+        raise ValueError("wine_config requires 'windows_version'")
+    return await _wine_command("winecfg", ["-v", version], config.get("wine_prefix"))
+
+
+class BlockedURLError(ValueError):
+    """Raised when an api_call URL targets a host workflows may not reach"""
+
+
+async def resolve_public_address(host: str, port: int) -> str:
+    """Resolve a host and return an address to connect to, if every address it has is public"""
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise BlockedURLError(f"Cannot resolve api_call host {host}: {e}") from e
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global:
+            raise BlockedURLError(f"api_call host {host} resolves to non-public address {address}")
+    return addresses[0][4][0]
+
+
+class PublicAddressBackend(httpcore.AsyncNetworkBackend):
+    """Network backend that only opens connections to public addresses
+
+    The check runs on the same lookup the connection uses, so a host that
+    resolves to a public address for ``check_api_url`` and to an internal one
+    a moment later (DNS rebinding) is still refused. TLS keeps the original
+    host name for SNI and certificate checks.
+    """
+
+    def __init__(self, backend: httpcore.AsyncNetworkBackend | None = None):
+        self.backend = backend or httpcore.AnyIOBackend()
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        address = await resolve_public_address(host, port)
+        return await self.backend.connect_tcp(
+            address, port, timeout=timeout, local_address=local_address, socket_options=socket_options
+        )
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        raise BlockedURLError("api_call cannot connect to unix sockets")
+
+    async def sleep(self, seconds: float):
+        await self.backend.sleep(seconds)
+
+
+def api_call_transport(network_backend: httpcore.AsyncNetworkBackend | None = None) -> httpx.AsyncHTTPTransport:
+    """Transport for api_call requests, refusing internal addresses at connect time"""
+    transport = httpx.AsyncHTTPTransport()
+    if not settings.WORKFLOW_API_ALLOW_PRIVATE_NETWORKS:
+        # httpx has no public hook for the network backend, so give the transport a pool that uses ours
+        transport._pool = httpcore.AsyncConnectionPool(
+            ssl_context=httpx.create_ssl_context(),
+            network_backend=PublicAddressBackend(network_backend),
+        )
+    return transport
+
+
+async def check_api_url(url: str):
+    """Reject URLs outside the allowlist or resolving to non-public addresses
+
+    The address check is repeated when the request connects (see
+    ``PublicAddressBackend``); this one fails the node early with a clear error.
+    """
+    try:
+        parsed = httpx.URL(url)
+    except httpx.InvalidURL as e:
+        raise ValueError(f"Invalid api_call url: {e}") from e
+    if parsed.scheme not in ("http", "https") or not parsed.host:
+        raise ValueError("api_call requires an http(s) 'url'")
+    host = parsed.host.lower()
+    allowed = settings.get_workflow_api_allowed_hosts()
+    if allowed and not any(host == entry or (entry.startswith("*.") and host.endswith(entry[1:])) for entry in allowed):
+        raise BlockedURLError(f"api_call host {host} is not in WORKFLOW_API_ALLOWED_HOSTS")
+    if settings.WORKFLOW_API_ALLOW_PRIVATE_NETWORKS:
+        return
+    await resolve_public_address(host, parsed.port or (443 if parsed.scheme == "https" else 80))
+
+
+async def run_api_call(config: Dict[str, Any], run: "WorkflowRun") -> Dict[str, Any]:
+    url = config.get("url", "")
+    await check_api_url(url)
+    response = await run.http.request(
+        config.get("method", "GET").upper(),
+        url,
+        headers=config.get("headers"),
+        params=config.get("params"),
+        json=config.get("json", config.get("body")),
+    )
+    if response.status_code >= 400 and not config.get("allow_errors"):
+        raise RuntimeError(f"{url} returned HTTP {response.status_code}")
+    try:
+        body = response.json()
+    except ValueError:
+        body = response.text
+    return {"status_code": response.status_code, "body": body}
+
+
+async def run_conditional(config: Dict[str, Any], run: "WorkflowRun") -> Dict[str, Any]:
+    name = config.get("operator", "truthy")
+    if name not in OPERATORS:
+        raise ValueError(f"Unknown operator {name!r}")
+    result = bool(OPERATORS[name](config.get("left"), config.get("right")))
+    return {"result": result, "branch": "true" if result else "false"}
+
+
+async def run_loop(config: Dict[str, Any], run: "WorkflowRun") -> Dict[str, Any]:
+    """Run the ``body`` component once per item (or ``count`` times), in order"""
+    body = config.get("body") or {}
+    handler = NODE_HANDLERS.get(body.get("type"))
+    if handler is None or body.get("type") == "loop":
+        raise ValueError("loop requires a 'body' component of a supported, non-loop type")
+    items = config.get("items")
+    if items is None:
+        items = list(range(int(config.get("count", 0))))
+    if not isinstance(items, list):
+        raise ValueError("loop 'items' must resolve to a list")
+    if len(items) > settings.WORKFLOW_MAX_LOOP_ITERATIONS:
+        raise ValueError(f"loop exceeds {settings.WORKFLOW_MAX_LOOP_ITERATIONS} iterations")
+    results = []
+    for index, item in enumerate(items):
+        # The body's placeholders are resolved per iteration, with the item in scope
+        context = {**run.context, "item": item, "index": index}
+        results.append(await handler(resolve(body.get("config") or {}, context), run))
+    return {"iterations": len(results), "results": results}
+
+
+NodeHandler = Callable[[Dict[str, Any], "WorkflowRun"], Awaitable[Dict[str, Any]]]
+NODE_HANDLERS: Dict[str, NodeHandler] = {
+    "wine_execute": run_wine_execute,
+    "wine_install": run_wine_install,
+    "wine_config": run_wine_config,
+    "api_call": run_api_call,
+    "conditional": run_conditional,
+    "loop": run_loop,
+}
+
+
+@dataclass(frozen=True)
+class PlanNode:
+    index: int
+    id: str
+    type: str
+    name: str
+    config: Dict[str, Any]
+    templated: bool
+    timeout: float
+    parents: Tuple[Tuple[int, str | None], ...]
+    children: Tuple[int, ...]
+
+
+@dataclass(frozen=True)
+class WorkflowPlan:
+    """Immutable, pre-validated execution plan shared by every run of a workflow"""
+
+    key: str
+    nodes: Tuple[PlanNode, ...]
+    waiting: Tuple[int, ...]
+
+    @property
+    def order(self) -> List[str]:
+        return [node.id for node in self.nodes]
+
+
+def _has_placeholders(value: Any) -> bool:
+    if isinstance(value, str):
+        return PLACEHOLDER.search(value) is not None
+    if isinstance(value, dict):
+        return any(_has_placeholders(item) for item in value.values())
+    if isinstance(value, list):
+        return any(_has_placeholders(item) for item in value)
+    return False
+
+
+def workflow_key(components: List[Dict[str, Any]], connections: List[Dict[str, Any]]) -> str:
+    """Content hash of the parts of a workflow that affect execution (not canvas layout)"""
+    content = {
+        "components": [
+            [c.get("id"), c.get("type") or c.get("component_type"), c.get("name"), c.get("config")]
+            for c in components
+        ],
+        "connections": [
+            [c.get("source", c.get("from")), c.get("target", c.get("to")), c.get("branch")]
+            for c in connections
+        ],
+    }
+    encoded = json.dumps(content, sort_keys=True, separators=(",", ":"), default=str).encode()
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+def compile_plan(components: List[Dict[str, Any]], connections: List[Dict[str, Any]], key: str | None = None) -> WorkflowPlan:
+    """Validate a workflow and flatten it into topologically sorted plan nodes"""
+    graph = build_graph(components, connections)
+    index = {node_id: position for position, node_id in enumerate(graph.order)}
+    nodes = []
+    for position, node_id in enumerate(graph.order):
+        node = graph.nodes[node_id]
+        # Copied so later edits to the caller's dicts cannot leak into a cached plan
+        config = copy.deepcopy(node.config)
+        try:
+            timeout = float(config.get("timeout") or settings.WORKFLOW_NODE_TIMEOUT)
+        except (TypeError, ValueError):
+            raise WorkflowValidationError(f"Component {node_id} has a non-numeric timeout")
+        # A loop's body is resolved per iteration, so it doesn't make the node itself templated
+        templated = _has_placeholders({k: v for k, v in config.items() if k != "body"})
+        nodes.append(PlanNode(
+            index=position,
+            id=node_id,
+            type=node.type,
+            name=node.name,
+            config=config,
+            templated=templated,
+            timeout=timeout,
+            parents=tuple((index[edge.source], edge.branch) for edge in graph.parents[node_id]),
+            children=tuple(index[child] for child in graph.children[node_id]),
+        ))
+    return WorkflowPlan(
+        key=key or workflow_key(components, connections),
+        nodes=tuple(nodes),
+        waiting=tuple(len(node.parents) for node in nodes),
+    )
+
+
+class WorkflowPlanCache:
+    """LRU of compiled plans keyed by workflow content hash"""
+
+    def __init__(self, max_size: int | None = None):
+        self.plans = LRUCache(max_size or settings.WORKFLOW_PLAN_CACHE_SIZE)
+        self.stats = {"hits": 0, "misses": 0, "compile_ms": 0.0}
+
+    def get_or_compile(self, components: List[Dict[str, Any]], connections: List[Dict[str, Any]]) -> WorkflowPlan:
+        key = workflow_key(components, connections)
+        plan = self.plans.get(key)
+        if plan is not None:
+            self.stats["hits"] += 1
+            return plan
+        self.stats["misses"] += 1
+        started = time.perf_counter()
+        plan = compile_plan(components, connections, key)
+        self.stats["compile_ms"] += (time.perf_counter() - started) * 1000
+        self.plans.set(key, plan)
+        return plan
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "compile_ms": round(self.stats["compile_ms"], 2),
+            "hit_ratio": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            "size": len(self.plans),
+            "max_size": self.plans.max_size,
+        }
+
+
+workflow_plans = WorkflowPlanCache()
+
+
+@dataclass
+class NodeResult:
+    status: str = "pending"
+    output: Dict[str, Any] | None = None
+    error: str | None = None
+    duration_ms: float | None = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"status": self.status, "output": self.output, "error": self.error, "duration_ms": self.duration_ms}
+
+
+@dataclass
+class WorkflowRun:
+    """A single execution of a compiled workflow plan"""
+
+    plan: WorkflowPlan
+    inputs: Dict[str, Any] = field(default_factory=dict)
+    max_concurrency: int | None = None
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    status: str = "pending"
+    results: List[NodeResult] = field(default_factory=list)
+    started_at: float | None = None
+    finished_at: float | None = None
+
+    def __post_init__(self):
+        limit = min(self.max_concurrency or settings.WORKFLOW_MAX_CONCURRENCY, settings.WORKFLOW_MAX_CONCURRENCY)
+        self._limit = asyncio.Semaphore(max(1, limit))
+        self._events: asyncio.Queue = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+        self.results = [NodeResult() for _ in self.plan.nodes]
+        self.context: Dict[str, Any] = {"inputs": self.inputs}
+        self.http: httpx.AsyncClient | None = None
+
+    def _emit(self, event_type: str, **data):
+        event = {"type": event_type, "run_id": self.id, **data}
+        self._events.put_nowait(event)
+        event_bus.publish(f"workflow.{self.id}", event_type, data)
+
+    def _finish_node(self, node: PlanNode, status: str, started: float, output=None, error=None):
+        result = self.results[node.index]
+        result.status, result.output, result.error = status, output, error
+        result.duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        if output is not None:
+            self.context[node.id] = output
+        self._emit("node_finished", node_id=node.id, node_type=node.type, name=node.name, **result.to_dict())
+
+    def _skip_reason(self, node: PlanNode) -> str | None:
+        if not node.parents:
+            return None
+        if any(self.results[parent].status in ("failed", "timed_out", "cancelled") for parent, _ in node.parents):
+            return "upstream component failed"
+        for parent, branch in node.parents:
+            result = self.results[parent]
+            if result.status == "succeeded" and (branch is None or branch == (result.output or {}).get("branch")):
+                return None
+        return "branch not taken"
+
+    async def _execute(self, node: PlanNode):
+        started = time.perf_counter()
+        async with self._limit:
+            self.results[node.index].status = "running"
+            self._emit("node_started", node_id=node.id, node_type=node.type, name=node.name)
+            try:
+                config = node.config
+                if node.templated:
+                    config = resolve({key: value for key, value in config.items() if key != "body"}, self.context)
+                    if "body" in node.config:
+                        config["body"] = node.config["body"]
+                if node.type in PASSTHROUGH_TYPES:
+                    output = config
+                else:
+                    output = await asyncio.wait_for(NODE_HANDLERS[node.type](config, self), timeout=node.timeout)
+            except asyncio.TimeoutError:
+                self._finish_node(node, "timed_out", started, error=f"timed out after {node.timeout}s")
+            except asyncio.CancelledError:
+                self._finish_node(node, "cancelled", started)
+                raise
+            except Exception as e:
+                logger.info(f"Workflow {self.id} component {node.id} failed: {e}")
+                self._finish_node(node, "failed", started, error=str(e) or e.__class__.__name__)
+            else:
+                self._finish_node(node, "succeeded", started, output=output)
+
+    async def _schedule(self):
+        nodes = self.plan.nodes
+        waiting = list(self.plan.waiting)
+        ready: Deque[PlanNode] = deque(node for node in nodes if not waiting[node.index])
+        running: Dict[asyncio.Task, PlanNode] = {}
+
+        def completed(node: PlanNode):
+            for child in node.children:
+                waiting[child] -= 1
+                if waiting[child] == 0:
+                    ready.append(nodes[child])
+
+        try:
+            while ready or running:
+                while ready:
+                    node = ready.popleft()
+                    reason = self._skip_reason(node)
+                    if reason:
+                        self._finish_node(node, "skipped", time.perf_counter(), error=reason)
+                        completed(node)
+                    else:
+                        running[asyncio.create_task(self._execute(node))] = node
+                if running:
+                    done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        completed(running.pop(task))
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+
+    async def execute(self) -> Dict[str, Any]:
+        """Run the workflow to completion and return its summary"""
+        self.status, self.started_at = "running", time.time()
+        self._emit("workflow_started", nodes=len(self.plan.nodes))
+        try:
+            # No proxies from the environment: they would connect on our behalf, past the address check
+            async with httpx.AsyncClient(
+                timeout=settings.WORKFLOW_NODE_TIMEOUT, transport=api_call_transport(), trust_env=False
+            ) as self.http:
+                await self._schedule()
+            failed = any(result.status in ("failed", "timed_out") for result in self.results)
+            self.status = "failed" if failed else "succeeded"
+        except asyncio.CancelledError:
+            self.status = "cancelled"
+        finally:
+            for result in self.results:
+                if result.status not in TERMINAL_NODE_STATUSES:
+                    result.status = "cancelled"
+            self.finished_at = time.time()
+            self._emit("workflow_finished", status=self.status, duration_ms=self.duration_ms)
+        return self.to_dict()
+
+    def start(self) -> asyncio.Task:
+        if self._task is None:
+            self._task = asyncio.create_task(self.execute())
+        return self._task
+
+    def cancel(self) -> bool:
+        if self._task is None or self._task.done():
+            return False
+        self._task.cancel()
+        return True
+
+    async def stream(self) -> AsyncIterator[Dict[str, Any]]:
+        """Start the run and yield its events; closing the stream cancels the run"""
+        task = self.start()
+        try:
+            while True:
+                event = await self._events.get()
+                yield event
+                if event["type"] == "workflow_finished":
+                    return
+        finally:
+            if not task.done():
+                task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    @property
+    def duration_ms(self) -> float | None:
+        if self.started_at is None:
+            return None
+        return round(((self.finished_at or time.time()) - self.started_at) * 1000, 2)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "run_id": self.id,
+            "plan": self.plan.key,
+            "status": self.status,
+            "duration_ms": self.duration_ms,
+            "order": self.plan.order,
+            "nodes": {node.id: result.to_dict() for node, result in zip(self.plan.nodes, self.results)},
+        }
+
+
+class WorkflowRunRegistry:
+    """Tracks in-flight runs so they can be inspected and cancelled"""
+
+    def __init__(self):
+        self.runs: Dict[str, WorkflowRun] = {}
+
+    def track(self, run: WorkflowRun) -> WorkflowRun:
+        self.runs[run.id] = run
+        run.start().add_done_callback(lambda _: self.runs.pop(run.id, None))
+        return run
+
+    def get(self, run_id: str) -> WorkflowRun | None:
+        return self.runs.get(run_id)
+
+    def cancel(self, run_id: str) -> bool:
+        run = self.runs.get(run_id)
+        return run.cancel() if run else False
+
+
+workflow_runs = WorkflowRunRegistry()
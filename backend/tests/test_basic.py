@@ -26,6 +26,19 @@ def test_ready_endpoint():
     assert response.status_code in [200, 503]
     assert "status" in response.json()
 
+def test_metrics_endpoint():
+    """Test Prometheus metrics are labelled by route template"""
+    from main import app
+    from fastapi.testclient import TestClient
+    
+    client = TestClient(app)
+    client.get("/health")
+    response = client.get("/metrics")
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_request_duration_seconds_count{method="GET",route="/health"}' in response.text
+
 def test_emulator_info_endpoint():
     """Test wine emulator info endpoint"""
     from main import app
@@ -0,0 +1,61 @@
+"""
+Tests for the applications catalog cache
+"""
+import asyncio
+
+from starlette.requests import Request
+
+from services import redis_pool
+from services.cache import CatalogCache, LRUCache, etag_response
+
+
+def make_request(headers=None):
+    raw = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
+
+
+def test_lru_fallback_and_invalidation(monkeypatch):
+    """Entries survive in the in-process LRU when Redis is down"""
+    monkeypatch.setattr(redis_pool, "_down_until", float("inf"))
+    cache = CatalogCache(namespace="test", ttl=60, lru_size=2)
+
+    async def go():
+        etag = await cache.set(cache.list_key(0, 100), b"[]")
+        cached = await cache.get(cache.list_key(0, 100))
+        await cache.invalidate(1)
+        return etag, cached, await cache.get(cache.list_key(0, 100))
+
+    etag, cached, after = asyncio.run(go())
+
+    assert cached == (etag, b"[]", {})
+    assert after is None
+    assert cache.stats["hits"] == 1
+    assert cache.stats["misses"] == 1
+
+
+def test_lru_entries_expire(monkeypatch):
+    """Fallback entries are misses once their TTL has passed"""
+    now = [1000.0]
+    monkeypatch.setattr("services.cache.time.monotonic", lambda: now[0])
+    cache = LRUCache(max_size=4, ttl=60)
+    cache.set("a", b"x")
+
+    fresh = cache.get("a")
+    now[0] += 61
+
+    assert fresh == b"x"
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_etag_response_not_modified():
+    """A matching If-None-Match yields an empty 304"""
+    etag = CatalogCache.make_etag(b"[]")
+
+    fresh = etag_response(make_request(), etag, b"[]")
+    cached = etag_response(make_request({"If-None-Match": etag}), etag, b"[]")
+
+    assert fresh.status_code == 200
+    assert fresh.headers["etag"] == etag
+    assert cached.status_code == 304
+    assert cached.body == b""
@@ -0,0 +1,51 @@
+"""
+Tests for the bulk catalog loader
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from routes.applications import build_tsquery, facet_filter
+from services.catalog import CatalogError, parse_manifest, upsert_statement
+
+
+def test_parse_manifest_accepts_json_and_yaml():
+    """Both a bare list and an ``applications`` key are accepted"""
+    yaml_manifest = """
+applications:
+  - name: Half-Life
+    executable_path: /app/games/hl/hl.exe
+    wine_config:
+      WINEARCH: win32
+"""
+    json_manifest = '[{"name": "Notepad", "executable_path": "notepad.exe"}]'
+
+    [half_life] = parse_manifest(yaml_manifest, "yaml")
+    [notepad] = parse_manifest(json_manifest)
+
+    assert half_life.wine_config == {"WINEARCH": "win32"}
+    assert notepad.is_active is True
+
+    with pytest.raises(CatalogError):
+        parse_manifest('[{"name": "no executable"}]')
+
+
+def test_upsert_only_rewrites_changed_rows():
+    """The conflict update is keyed on name and skipped for identical rows"""
+    row = {
+        "name": "Notepad", "executable_path": "notepad.exe", "description": None, "icon_url": None,
+        "wine_config": None, "is_active": True, "created_at": datetime(2024, 1, 1), "updated_at": datetime(2024, 1, 1),
+    }
+    sql = str(upsert_statement([row]).compile(dialect=postgresql.dialect()))
+
+    assert "ON CONFLICT (name) DO UPDATE" in sql
+    assert "IS DISTINCT FROM" in sql
+    assert sql.endswith("RETURNING applications.id, (xmax = 0) AS inserted")
+
+
+def test_search_query_helpers():
+    """Free text becomes a prefix tsquery and facets become containment documents"""
+    assert build_tsquery("Counter-Str") == "counter:* & str:*"
+    assert build_tsquery("  !! ") is None
+    assert facet_filter(("graphics", "renderer"), "opengl") == {"graphics": {"renderer": "opengl"}}
@@ -0,0 +1,59 @@
+"""
+Tests for the streaming command relay
+"""
+import asyncio
+import json
+
+import httpx
+
+from services.command_stream import CommandStream, OutputBuffer
+from services.wine_client import WineServiceClient
+
+
+def parse_events(chunks):
+    events = []
+    for chunk in chunks:
+        if chunk.startswith(":"):
+            continue
+        event, data = chunk.strip().split("\n")
+        events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+def test_output_buffer_drops_oldest_output():
+    buffer = OutputBuffer(max_bytes=8)
+    buffer.append("12345")
+    buffer.append("6789")
+
+    assert buffer.take() == ("6789", 5)
+    assert buffer.take() == ("", 0)
+    assert buffer.total_dropped == 5
+
+
+def test_stream_relays_output_and_exit_code():
+    """NDJSON from the Wine service becomes stdout/stderr events and a final exit"""
+    messages = [
+        {"type": "started", "id": "exec-1"},
+        {"stream": "stdout", "data": "Installing...\n"},
+        {"stream": "stderr", "data": "fixme: stub\n"},
+        {"type": "exit", "exit_code": 3},
+    ]
+
+    def handler(request):
+        assert request.url.path == "/api/execute/stream"
+        body = "".join(json.dumps(message) + "\n" for message in messages)
+        return httpx.Response(200, content=body, headers={"content-type": "application/x-ndjson"})
+
+    async def run():
+        client = WineServiceClient(base_url="http://wine.test", transport=httpx.MockTransport(handler))
+        try:
+            return [chunk async for chunk in CommandStream({"command": "msiexec"}, client=client).events()]
+        finally:
+            await client.close()
+
+    events = parse_events(asyncio.run(run()))
+    output = {name: "".join(data["data"] for event, data in events if event == name) for name in ("stdout", "stderr")}
+
+    assert output == {"stdout": "Installing...\n", "stderr": "fixme: stub\n"}
+    assert events[-1][0] == "exit"
+    assert events[-1][1]["exit_code"] == 3 and events[-1][1]["success"] is False
@@ -0,0 +1,91 @@
+"""
+Tests for read/write routing between the primary and replicas
+"""
+import asyncio
+from types import SimpleNamespace
+
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, select, text, update
+
+from database import Application, RoutingSession, commit, engine, make_engine, on_commit, rollback
+from services.metrics import instrument_engine
+
+
+def isolation_level(bind):
+    return bind.get_execution_options().get("isolation_level")
+
+
+def test_routing_session_sends_writes_to_primary():
+    """Selects use the session's replica in autocommit mode; DML always goes to the primary"""
+    replica = make_engine("postgresql+asyncpg://reader@replica:5432/wine_emulator", "replica-test")
+    session = RoutingSession()
+    session.replica = replica.sync_engine
+
+    read_bind = session.get_bind(clause=select(Application))
+    assert read_bind.url == replica.sync_engine.url
+    assert isolation_level(read_bind) == "AUTOCOMMIT"
+    assert session.get_bind(clause=update(Application).values(is_active=False)) is engine.sync_engine
+
+    session.replica = None
+    assert session.get_bind(clause=select(Application)).url == engine.sync_engine.url
+
+    streaming = RoutingSession(info={"autocommit": False})
+    streaming.replica = None
+    assert streaming.get_bind(clause=select(Application)) is engine.sync_engine
+
+
+class FakeSession:
+    def __init__(self):
+        self.info = {}
+        self.committed = False
+
+    async def commit(self):
+        self.committed = True
+
+    async def rollback(self):
+        pass
+
+
+def test_on_commit_callbacks_run_after_commit_only():
+    calls = []
+
+    async def invalidate():
+        calls.append("invalidate")
+
+    async def run():
+        session = FakeSession()
+        on_commit(session, invalidate)
+        on_commit(session, lambda: calls.append("publish"))
+        await commit(session)
+        assert session.committed
+
+        discarded = FakeSession()
+        on_commit(discarded, lambda: calls.append("discarded"))
+        await rollback(discarded)
+        await commit(discarded)
+
+    asyncio.run(run())
+    assert calls == ["invalidate", "publish"]
+
+
+def test_engine_instrumentation_survives_dispose():
+    """Pool metrics come from engine events, so a disposed and recreated pool is still measured"""
+    sync_engine = create_engine("sqlite://")
+    instrument_engine(SimpleNamespace(sync_engine=sync_engine), "dispose-test")
+
+    def samples():
+        labels = {"engine": "dispose-test"}
+        return (
+            REGISTRY.get_sample_value("db_pool_connect_seconds_count", labels),
+            REGISTRY.get_sample_value("db_pool_checkouts_total", labels),
+        )
+
+    with sync_engine.connect() as conn:
+        conn.execute(text("select 1"))
+    before = samples()
+    sync_engine.dispose()
+    with sync_engine.connect() as conn:
+        conn.execute(text("select 1"))
+
+    assert before == (1, 1)
+    assert samples() == (2, 2)
@@ -0,0 +1,112 @@
+"""
+Tests for the real-time event bus
+"""
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from services import events, redis_pool
+from services.events import EventBus, event_bus
+
+
+def test_topic_filtering_and_slow_consumer_drop():
+    """Subscribers get matching topics only and are dropped when they fall behind"""
+    bus = EventBus()
+    sessions = bus.subscribe(["session"])
+    health = bus.subscribe(["health"])
+    sessions.queue = type(sessions.queue)(maxsize=2)
+
+    for i in range(3):
+        bus.publish(f"session.s{i}", "created")
+
+    assert health.queue.empty()
+    assert sessions.dropped
+    assert sessions not in bus.subscriptions
+    assert sessions.queue.get_nowait()["type"] == "dropped"
+    assert bus.stats["dropped_subscribers"] == 1
+
+
+def test_websocket_receives_subscribed_events(client: TestClient):
+    """/ws streams events for the topics a client subscribes to"""
+    with client.websocket_connect("/ws") as websocket:
+        websocket.send_json({"action": "subscribe", "topics": ["session"]})
+        assert websocket.receive_json()["data"]["topics"] == ["session"]
+
+        event_bus.publish("health", "changed")
+        event_bus.publish("session.abc", "created", {"session_id": "abc"})
+
+        event = websocket.receive_json()
+        assert event["topic"] == "session.abc"
+        assert event["data"] == {"session_id": "abc"}
+
+
+async def fake_redis(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Answers every command with OK, and PSUBSCRIBE with its confirmation, then stays silent"""
+    while True:
+        try:
+            count = int((await reader.readline())[1:])
+            args = []
+            for _ in range(count):
+                size = int((await reader.readline())[1:])
+                args.append((await reader.readexactly(size + 2))[:-2])
+        except (ValueError, asyncio.IncompleteReadError):
+            break
+        if args[0].upper() == b"PSUBSCRIBE":
+            writer.write(b"*3\r\n$10\r\npsubscribe\r\n$%d\r\n%s\r\n:1\r\n" % (len(args[1]), args[1]))
+        else:
+            writer.write(b"+OK\r\n")
+        await writer.drain()
+    writer.close()
+
+
+def test_malformed_redis_events_are_skipped():
+    """A bad message from another publisher is counted and skipped; the next one still arrives"""
+    bus = EventBus()
+    subscription = bus.subscribe(["session"])
+
+    for data in (b"not json", b"[1]", b'"x"', b'{"type": "created"}', b'{"topic": 5}'):
+        bus._receive(data)
+    bus._receive(b'{"topic": "session.s1", "type": "created", "data": {}}')
+
+    assert bus.stats["malformed"] == 5
+    assert subscription.queue.get_nowait()["topic"] == "session.s1"
+    assert subscription.queue.empty()
+
+
+def test_websocket_rejects_malformed_subscriptions(client: TestClient):
+    """Non-object messages and non-list topics get an error event and keep the socket open"""
+    with client.websocket_connect("/ws") as websocket:
+        for message in ([1], "x", {"action": "subscribe", "topics": "session"}, {"action": "subscribe", "topics": [1]}):
+            websocket.send_json(message)
+            reply = websocket.receive_json()
+            assert reply["type"] == "error"
+
+        websocket.send_json({"action": "subscribe", "topics": ["session"]})
+        assert websocket.receive_json()["data"]["topics"] == ["session"]
+
+
+def test_idle_subscription_keeps_redis_available(monkeypatch):
+    """A channel with nothing published is not a Redis outage"""
+    monkeypatch.setattr(events, "LISTEN_POLL_INTERVAL", 0.1)
+    monkeypatch.setattr(redis_pool.settings, "REDIS_SOCKET_TIMEOUT", 0.1)
+    monkeypatch.setattr(redis_pool, "_down_until", 0.0)
+
+    async def go():
+        server = await asyncio.start_server(fake_redis, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        monkeypatch.setattr(redis_pool.settings, "REDIS_URL", f"redis://127.0.0.1:{port}")
+        await redis_pool.close_redis()
+        bus = EventBus()
+        bus.start()
+        try:
+            await asyncio.sleep(0.6)
+            return bus._listening, redis_pool.redis_available()
+        finally:
+            await bus.stop()
+            await redis_pool.close_redis()
+            server.close()
+
+    listening, available = asyncio.run(go())
+
+    assert listening
+    assert available
@@ -0,0 +1,98 @@
+"""
+Tests for the container command executors
+"""
+import asyncio
+import json
+import sys
+
+import httpx
+
+from services.executors import KILL_SCRIPT, PID_WRAPPER, DockerEngineExecutor, SubprocessExecutor
+
+
+def frame(stream: int, data: bytes) -> bytes:
+    return bytes([stream, 0, 0, 0]) + len(data).to_bytes(4, "big") + data
+
+
+def test_docker_engine_exec_demuxes_output_and_reads_exit_code():
+    """exec create + attached start + inspect, with no shell and no docker CLI"""
+    requests = []
+
+    def handler(request):
+        requests.append((request.method, request.url.path, json.loads(request.content or b"null")))
+        if request.url.path.endswith("/exec"):
+            return httpx.Response(201, json={"Id": "abc"})
+        if request.url.path.endswith("/start"):
+            body = frame(1, b"hello ") + frame(2, b"warn\n") + frame(1, b"world\n")
+            return httpx.Response(200, content=body, headers={"content-type": "application/vnd.docker.multiplexed-stream"})
+        return httpx.Response(200, json={"ExitCode": 7, "Running": False})
+
+    output = {"stdout": b"", "stderr": b""}
+
+    def on_output(name, chunk):
+        output[name] += chunk
+
+    async def run():
+        executor = DockerEngineExecutor(transport=httpx.MockTransport(handler))
+        try:
+            return await executor.run(
+                "wine-1", ["wine", "game's.exe"], env={"DISPLAY": ":100"}, workdir="/games", on_output=on_output
+            )
+        finally:
+            await executor.close()
+
+    assert asyncio.run(run()) == 7
+    assert output == {"stdout": b"hello world\n", "stderr": b"warn\n"}
+    method, path, body = requests[0]
+    assert path.endswith("/containers/wine-1/exec")
+    # argv rides along as positional arguments of the pid-recording wrapper
+    assert body["Cmd"][:3] == ["sh", "-c", PID_WRAPPER]
+    assert body["Cmd"][4:] == ["wine", "game's.exe"]
+    assert body["Env"] == ["DISPLAY=:100"] and body["WorkingDir"] == "/games"
+
+
+def test_docker_engine_cancel_signals_only_its_own_process():
+    """Cancelling signals the pid the command recorded, not every matching command line"""
+    requests = []
+
+    async def never_ends():
+        yield frame(1, b"running\n")
+        await asyncio.Event().wait()
+
+    def handler(request):
+        body = json.loads(request.content or b"null")
+        requests.append((request.method, request.url.path, body))
+        if request.url.path.endswith("/exec"):
+            return httpx.Response(201, json={"Id": f"exec{len(requests)}"})
+        if request.url.path.endswith("/start") and not body["Detach"]:
+            return httpx.Response(200, content=never_ends())
+        if request.url.path.endswith("/start"):
+            return httpx.Response(200)
+        return httpx.Response(200, json={"Running": True})
+
+    async def run():
+        executor = DockerEngineExecutor(transport=httpx.MockTransport(handler))
+        task = asyncio.create_task(executor.run("wine-1", ["wine", "game.exe"]))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await executor.close()
+
+    asyncio.run(run())
+
+    started = requests[0][2]["Cmd"]
+    kill = [body for method, path, body in requests if path.endswith("/exec") and body["Cmd"][2] == KILL_SCRIPT]
+    assert len(kill) == 1
+    assert kill[0]["Cmd"][3] == started[3]
+    assert kill[0]["User"] != "root"
+
+
+def test_local_subprocess_passes_argv_without_a_shell():
+    output = []
+    argv = [sys.executable, "-c", "import sys; print(sys.argv[1]); sys.exit(2)", "$HOME; echo hi"]
+
+    async def run():
+        return await SubprocessExecutor(local=True).run("ignored", argv, on_output=lambda name, chunk: output.append(chunk))
+
+    assert asyncio.run(run()) == 2
+    assert b"".join(output) == b"$HOME; echo hi\n"
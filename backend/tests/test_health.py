@@ -0,0 +1,83 @@
+"""
+Tests for the cached dependency health checks
+"""
+import asyncio
+
+from services import health
+from services.health import HealthChecker
+
+
+def fake_probes(monkeypatch, redis_delay=0.0):
+    """Replace every probe with a counting fake; returns the call counts"""
+    calls = {"postgres": 0, "redis": 0, "wine_service": 0}
+
+    def probe(name, delay=0.0):
+        async def run():
+            calls[name] += 1
+            await asyncio.sleep(delay)
+            return {}
+
+        return run
+
+    async def no_endpoints(self):
+        return []
+
+    monkeypatch.setattr(health, "probe_postgres", probe("postgres"))
+    monkeypatch.setattr(health, "probe_redis", probe("redis", redis_delay))
+    monkeypatch.setattr(health, "probe_wine_service", probe("wine_service"))
+    monkeypatch.setattr(health, "replica_engines", [])
+    monkeypatch.setattr(HealthChecker, "vnc_endpoints", no_endpoints)
+    monkeypatch.setattr(health.event_bus, "publish", lambda *args, **kwargs: None)
+    return calls
+
+
+def test_probe_timeout_degrades_status(monkeypatch):
+    """A non-critical probe that times out is down, which degrades but does not fail readiness"""
+    fake_probes(monkeypatch, redis_delay=1.0)
+    checker = HealthChecker(ttl=10, timeout=0.05)
+
+    report = asyncio.run(checker.check())
+
+    assert report["status"] == "degraded"
+    assert report["ready"] is True
+    assert report["checks"]["redis"]["status"] == "down"
+    assert "timed out" in report["checks"]["redis"]["error"]
+    assert report["checks"]["postgres"]["status"] == "up"
+
+
+def test_cached_report_is_reused_within_ttl(monkeypatch):
+    """Probes run again only once the TTL has passed, or when forced"""
+    calls = fake_probes(monkeypatch)
+    checker = HealthChecker(ttl=10, timeout=1)
+
+    async def go():
+        first = await checker.check()
+        checker._checked_at -= 5
+        cached = await checker.check()
+        after_cached = dict(calls)
+        checker._checked_at -= 6
+        await checker.check()
+        after_expiry = dict(calls)
+        await checker.check(force=True)
+        return first, cached, after_cached, after_expiry
+
+    first, cached, after_cached, after_expiry = asyncio.run(go())
+
+    assert cached is first
+    assert after_cached["postgres"] == 1
+    assert after_expiry["postgres"] == 2
+    assert calls["postgres"] == 3
+
+
+def test_concurrent_callers_share_one_probe_run(monkeypatch):
+    """Callers arriving while probes are in flight wait for that round instead of starting another"""
+    calls = fake_probes(monkeypatch, redis_delay=0.05)
+    checker = HealthChecker(ttl=10, timeout=1)
+
+    async def go():
+        return await asyncio.gather(*(checker.check() for _ in range(10)))
+
+    reports = asyncio.run(go())
+
+    assert calls == {"postgres": 1, "redis": 1, "wine_service": 1}
+    assert all(report is reports[0] for report in reports)
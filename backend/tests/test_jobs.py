@@ -0,0 +1,217 @@
+"""
+Tests for the background job subsystem
+"""
+import asyncio
+
+from services.executors import FakeExecutor, FakeResult, use_executor
+from services.jobs import JobManager, RingBuffer, exec_runner
+
+
+def test_ring_buffer_keeps_last_lines():
+    """Only the newest lines are kept and partial lines wait for their newline"""
+    buffer = RingBuffer(max_lines=2)
+
+    assert buffer.feed(b"one\ntw") == ["one"]
+    assert buffer.feed(b"o\nthree\nfour") == ["two", "three"]
+    assert buffer.flush() == ["four"]
+    assert buffer.tail() == ["three", "four"]
+    assert buffer.dropped == 2
+
+
+def test_ring_buffer_caps_lines_without_newline():
+    """Output that never ends a line is emitted in capped pieces instead of growing"""
+    buffer = RingBuffer(max_lines=3, max_line_bytes=4)
+
+    assert buffer.feed(b"x" * 10) == ["xxxx", "xxxx"]
+    assert buffer._partial == b"xx"
+    assert buffer.feed(b"yyyyyyyyy\nz") == ["xxyy", "yyyy", "yyy"]
+    assert buffer.flush() == ["z"]
+    assert all(len(line) <= 4 for line in buffer.tail())
+
+    big = RingBuffer(max_lines=5, max_line_bytes=1024)
+    big.feed(b"\r" * 10_000_000)
+    assert len(big._partial) <= 1024
+    assert len(big.tail()) == 5
+
+
+def test_jobs_drain_output_and_respect_host_limit():
+    """Jobs run concurrently up to the per-host limit and capture output"""
+    manager = JobManager(host_concurrency=1, max_pending=10, history_size=10)
+    peak = {"running": 0, "max": 0}
+
+    async def tracked(job):
+        peak["running"] += 1
+        peak["max"] = max(peak["max"], peak["running"])
+        await asyncio.sleep(0.01)
+        peak["running"] -= 1
+        return 0
+
+    fake = FakeExecutor(results={"echo": FakeResult(exit_code=3, stdout=b"hello\n", stderr=b"oops")})
+    previous = use_executor(fake)
+
+    async def go():
+        echo = manager.submit("test", "host-a", exec_runner("wine-1", ["echo", "hello"]))
+        slow = [manager.submit("test", "host-b", tracked) for _ in range(3)]
+        await asyncio.gather(echo.task, *(job.task for job in slow))
+        return echo, slow
+
+    try:
+        echo, slow = asyncio.run(go())
+    finally:
+        use_executor(previous)
+
+    assert echo.status == "failed"
+    assert echo.exit_code == 3
+    assert echo.stdout.tail() == ["hello"]
+    assert echo.stderr.tail() == ["oops"]
+    assert fake.calls[0]["container"] == "wine-1" and fake.calls[0]["argv"] == ["echo", "hello"]
+    assert all(job.status == "succeeded" for job in slow)
+    assert peak["max"] == 1
+
+
+def test_restart_only_stops_the_targets_prefix():
+    """A restart runs wineserver -k on one prefix as the Wine user, never a container-wide pkill"""
+    from routes.emulator import LaunchTarget, restart_runner
+
+    manager = JobManager(host_concurrency=1, max_pending=10, history_size=10)
+    fake = FakeExecutor(results={"wineserver": FakeResult(exit_code=1)})
+    previous = use_executor(fake)
+
+    async def go():
+        target = LaunchTarget("wine-1", ":101", 5902, prefix="/prefixes/app7-slot2")
+        job = manager.submit("restart", "wine-1", restart_runner(target))
+        await job.task
+        return job
+
+    try:
+        job = asyncio.run(go())
+    finally:
+        use_executor(previous)
+
+    assert job.status == "succeeded"
+    assert [call["argv"] for call in fake.calls] == [["wineserver", "-k"]]
+    assert fake.calls[0]["env"] == {"WINEPREFIX": "/prefixes/app7-slot2"}
+    assert fake.calls[0]["user"] != "root"
+
+
+def test_launch_starts_detached_and_frees_the_host_slot():
+    """A launch job ends once the game is started, so later launches on the host are not blocked"""
+    from routes.emulator import LaunchTarget, launch_runner
+
+    manager = JobManager(host_concurrency=1, max_pending=10, history_size=10)
+    fake = FakeExecutor()
+    previous = use_executor(fake)
+
+    async def go():
+        target = LaunchTarget("wine-1", ":101", 5902)
+        jobs = [
+            manager.submit("launch", "wine-1", launch_runner(target, "cs16", ["wine", "hl.exe"], {"DISPLAY": ":101"}))
+            for _ in range(3)
+        ]
+        await asyncio.gather(*(job.task for job in jobs))
+        return jobs
+
+    try:
+        jobs = asyncio.run(go())
+    finally:
+        use_executor(previous)
+
+    assert all(job.status == "succeeded" for job in jobs)
+    assert all(call["detach"] for call in fake.calls)
+    argv = fake.calls[0]["argv"]
+    assert argv[:2] == ["sh", "-c"] and argv[-2:] == ["wine", "hl.exe"]
+    assert argv[3].startswith("/tmp/game-101-cs16-")
+
+
+def test_shutdown_spares_jobs_kept_on_shutdown():
+    """Shutdown cancels ordinary jobs but lets kept ones finish"""
+    manager = JobManager(host_concurrency=2, max_pending=10, history_size=10)
+
+    async def slow(job):
+        await asyncio.sleep(0.05)
+        return 0
+
+    async def go():
+        kept = manager.submit("launch", "wine-1", slow, keep_on_shutdown=True)
+        other = manager.submit("restart", "wine-1", slow)
+        await asyncio.sleep(0)
+        await manager.shutdown()
+        return kept, other
+
+    kept, other = asyncio.run(go())
+
+    assert kept.status == "succeeded"
+    assert other.status == "cancelled"
+
+
+def test_running_games_parses_recorded_pid_files():
+    """Only games whose pid is alive are reported, with their display and label"""
+    from services.wine_processes import running_games
+
+    fake = FakeExecutor(results={"sh": FakeResult(stdout=b"/tmp/game-101-cs16-demo-abc123.pid\n/tmp/game-99-app7-def456.pid\n")})
+    previous = use_executor(fake)
+    try:
+        games = asyncio.run(running_games("wine-1"))
+    finally:
+        use_executor(previous)
+
+    assert games == [
+        {"game": "cs16-demo", "display": ":101", "container": "wine-1", "launch_id": "abc123"},
+        {"game": "app7", "display": ":99", "container": "wine-1", "launch_id": "def456"},
+    ]
+
+
+def test_session_launch_uses_the_sessions_prefix(monkeypatch):
+    """A game launched into a session runs under its WINEPREFIX, the one its restart stops"""
+    from routes import emulator
+    from routes.emulator import LaunchTarget
+
+    target = LaunchTarget("wine-1", ":101", 5902, prefix="/prefixes/app7-slot2")
+
+    async def launch_target(db, session_id):
+        return target
+
+    monkeypatch.setattr(emulator, "launch_target", launch_target)
+    monkeypatch.setattr(emulator, "job_manager", JobManager(host_concurrency=1, max_pending=10, history_size=10))
+    fake = FakeExecutor()
+    previous = use_executor(fake)
+
+    async def go():
+        await emulator.launch_game("cs16", session_id="s1", db=None)
+        await asyncio.gather(*(job.task for job in emulator.job_manager.jobs.values()))
+
+    try:
+        asyncio.run(go())
+    finally:
+        use_executor(previous)
+
+    assert fake.calls[0]["env"] == {"DISPLAY": ":101", "WINEPREFIX": "/prefixes/app7-slot2"}
+
+
+def test_emulator_info_reports_probed_status(monkeypatch):
+    """The info endpoints report the health checker's status and the probed VNC endpoint"""
+    from routes import emulator
+
+    report = {"status": "degraded", "ready": True, "checks": {
+        "postgres": {"status": "up"},
+        "vnc:wine-1:5901": {"status": "up", "host": "wine-1", "port": 5901},
+    }}
+
+    async def check():
+        return report
+
+    async def no_games(container):
+        return []
+
+    monkeypatch.setattr(emulator.health_checker, "check", check)
+    monkeypatch.setattr(emulator, "running_games", no_games)
+
+    async def go():
+        return await emulator.get_vnc_info(), await emulator.get_emulator_info()
+
+    vnc, info = asyncio.run(go())
+
+    assert vnc["status"] == info["status"] == "degraded"
+    assert vnc["vnc_url"] == "vnc://localhost:5901"
+    assert vnc["container_status"] == "running"
+    assert info["games"] == sorted(emulator.GAME_COMMANDS)
@@ -0,0 +1,100 @@
+"""
+Tests for compiled launch specs
+"""
+import asyncio
+
+import pytest
+
+from database import Application
+from services import events
+from services.launch_specs import (
+    APPLICATION_TOPIC,
+    LaunchSpecCache,
+    LaunchSpecError,
+    application_changed,
+    compile_launch_spec,
+    publish_application_changed,
+)
+
+
+def cs16(**wine_config):
+    return Application(
+        id=7,
+        name="Counter-Strike 1.6",
+        executable_path="/app/games/cs16/hl.exe",
+        wine_config={
+            "WINEPREFIX": "/root/.wine",
+            "WINEARCH": "win32",
+            "arguments": ["-game", "cstrike", "+maxplayers", 32],
+            "environment": {"MESA_GL_VERSION_OVERRIDE": "3.3"},
+            "graphics": {"resolution": "1280x960"},
+            **wine_config,
+        },
+    )
+
+
+def test_compile_builds_argv_env_and_cwd():
+    spec = compile_launch_spec(cs16())
+
+    assert spec.argv == ("wine", "/app/games/cs16/hl.exe", "-game", "cstrike", "+maxplayers", "32")
+    assert spec.cwd == "/app/games/cs16"
+    assert spec.resolution == "1280x960x24"
+    assert spec.env_for(":101", "/prefixes/app7-slot2") == {
+        "WINEPREFIX": "/prefixes/app7-slot2",
+        "WINEARCH": "win32",
+        "WINEDEBUG": "-all",
+        "MESA_GL_VERSION_OVERRIDE": "3.3",
+        "DISPLAY": ":101",
+    }
+    assert spec.env_for(":99")["WINEPREFIX"] == "/root/.wine"
+
+
+@pytest.mark.parametrize("wine_config", [
+    {"arguments": "-game cstrike"},
+    {"environment": {"BAD NAME": "1"}},
+    {"environment": {"NESTED": {"a": 1}}},
+    {"WINEARCH": "win16"},
+    {"working_directory": "relative/dir"},
+])
+def test_compile_rejects_invalid_configs(wine_config):
+    with pytest.raises(LaunchSpecError):
+        compile_launch_spec(cs16(**wine_config))
+
+
+def test_application_changed_invalidates_listening_caches():
+    """Invalidations broadcast on the event bus reach every replica's cache"""
+    async def run():
+        idle, remote = LaunchSpecCache(ttl=60), LaunchSpecCache(ttl=60)
+        spec = compile_launch_spec(cs16())
+        for cache in (idle, remote):
+            cache._specs.set("7", (spec, float("inf")))
+        remote.start()
+        await asyncio.sleep(0)
+        try:
+            application_changed(7)
+            await asyncio.sleep(0.01)
+        finally:
+            await remote.stop()
+        return len(idle._specs), len(remote._specs)
+
+    assert asyncio.run(run()) == (1, 0)
+
+
+def test_publish_application_changed_goes_straight_to_redis(monkeypatch):
+    """Without a running bus (CLI loads) the invalidation is published to Redis and reaches listeners"""
+    published = []
+
+    class FakeRedis:
+        async def publish(self, channel, payload):
+            published.append((channel, payload))
+
+    monkeypatch.setattr(events, "get_redis", lambda: FakeRedis())
+    replica = events.EventBus()
+    subscription = replica.subscribe([APPLICATION_TOPIC])
+
+    asyncio.run(publish_application_changed(7, 9))
+
+    [(channel, payload)] = published
+    assert channel == events.CHANNEL_PREFIX + APPLICATION_TOPIC
+    replica._receive(payload)
+    assert subscription.queue.get_nowait()["data"] == {"ids": [7, 9]}
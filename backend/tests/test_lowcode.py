@@ -0,0 +1,55 @@
+"""
+Tests for low-code component tree loading and batch saves
+"""
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.dialects import postgresql
+
+from database import LowCodeComponent
+from routes.lowcode import ComponentBatch, build_component_tree, component_tree_query, validate_component_batch
+
+
+def component(id, parent_id=None):
+    now = datetime(2024, 1, 1)
+    return LowCodeComponent(
+        id=id, name=f"c{id}", component_type="button", config={},
+        parent_id=parent_id, created_at=now, updated_at=now,
+    )
+
+
+def test_tree_query_is_a_single_recursive_cte():
+    """The whole subtree is loaded by one bounded recursive query"""
+    sql = str(component_tree_query(1, 3, datetime(2024, 1, 1)).compile(dialect=postgresql.dialect()))
+
+    assert sql.startswith("WITH RECURSIVE component_tree")
+    assert "component_tree.depth <" in sql
+    assert "lowcode_components.updated_at >" in sql
+
+
+def test_build_component_tree_nests_children():
+    """Rows are nested under their parents and orphans stay at the top level"""
+    rows = [(component(1), 0), (component(2, 1), 1), (component(3, 2), 2), (component(4, 9), 1)]
+
+    tree = build_component_tree(rows)
+
+    assert [node["id"] for node in tree] == [1, 4]
+    assert tree[0]["children"][0]["id"] == 2
+    assert tree[0]["children"][0]["children"][0]["depth"] == 2
+
+
+def test_batch_validation_rejects_ambiguous_items():
+    """A batch may not touch an id twice or reference unknown new parents"""
+    node = {"name": "n", "component_type": "button", "config": {}}
+    validate_component_batch(ComponentBatch(upserts=[
+        {**node, "client_id": "a"}, {**node, "client_id": "b", "parent_client_id": "a"}, {**node, "id": 7}
+    ]))
+
+    for batch in (
+        ComponentBatch(upserts=[{**node, "id": 1}], deletes=[{"id": 1}]),
+        ComponentBatch(upserts=[{**node, "parent_client_id": "missing"}]),
+    ):
+        with pytest.raises(HTTPException) as error:
+            validate_component_batch(batch)
+        assert error.value.status_code == 422
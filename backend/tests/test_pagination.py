@@ -0,0 +1,25 @@
+"""
+Tests for keyset pagination cursors
+"""
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from services.pagination import decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    """Cursors decode back to the sort key they were built from"""
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 123456)
+    token = encode_cursor(created_at, 42)
+
+    assert decode_cursor(token, datetime, int) == (created_at, 42)
+
+
+@pytest.mark.parametrize("token", ["not-a-cursor", encode_cursor(1), encode_cursor("x", 1)])
+def test_invalid_cursor_is_rejected(token):
+    """Malformed or mismatched cursors are a 400, not a 500"""
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor(token, datetime, int)
+    assert exc.value.status_code == 400
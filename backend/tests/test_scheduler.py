@@ -0,0 +1,91 @@
+"""
+Tests for session placement across Wine nodes
+"""
+import asyncio
+import time
+
+from services.scheduler import NodeScheduler, PlacementPolicy
+from services.scheduler_sim import SimNode, simulate, trace_from_decisions
+from services.slots import SlotAllocator
+
+
+def make_scheduler(containers, per_container=4):
+    allocator = SlotAllocator(backend="memory", containers=containers, per_container=per_container)
+    policy = PlacementPolicy(policy="spread", affinity_bonus=0.3, heartbeat_timeout=30, require_heartbeat=False)
+    return NodeScheduler(backend="memory", allocator=allocator, policy=policy)
+
+
+def test_places_on_least_loaded_node_with_prefix_affinity():
+    """Load decides, but a warm prefix wins unless its node is much busier"""
+    scheduler = make_scheduler(["wine-a", "wine-b"])
+
+    async def go():
+        await scheduler.heartbeat("wine-a", {"cpu": 0.5, "warm_apps": [7]})
+        await scheduler.heartbeat("wine-b", {"cpu": 0.1})
+        cold = await scheduler.allocate("s1", app_id=3)
+        warm = await scheduler.allocate("s2", app_id=7)
+        await scheduler.heartbeat("wine-a", {"cpu": 0.8, "warm_apps": [7]})
+        busy = await scheduler.allocate("s3", app_id=7)
+        return cold, warm, busy
+
+    cold, warm, busy = asyncio.run(go())
+
+    assert cold.container == "wine-b"
+    assert warm.container == "wine-a"
+    # wine-a is now busier than its warm prefix is worth
+    assert busy.container == "wine-b"
+    assert scheduler.stats["placements"] == 3
+    assert scheduler.stats["affinity_hits"] == 1
+    assert [decision["chosen"] for decision in scheduler.decisions] == ["wine-b", "wine-a", "wine-b"]
+
+
+def test_drained_and_silent_nodes_get_no_sessions():
+    """Draining or a timed-out heartbeat stops placement; undraining resumes it"""
+    scheduler = make_scheduler(["wine-a", "wine-b"], per_container=1)
+
+    async def go():
+        await scheduler.heartbeat("wine-a", {}, now=time.time() - 60)
+        await scheduler.heartbeat("wine-b", {})
+        await scheduler.drain("wine-b")
+        refused = await scheduler.allocate("s1")
+        schedulable = await scheduler.schedulable()
+        await scheduler.drain("wine-b", draining=False)
+        placed = await scheduler.allocate("s2")
+        full = await scheduler.allocate("s3")
+        return refused, schedulable, placed, full
+
+    refused, schedulable, placed, full = asyncio.run(go())
+
+    assert refused is None
+    assert schedulable == set()
+    assert placed.container == "wine-b"
+    assert full is None
+    assert scheduler.stats["refused"] == 2
+
+
+def test_simulator_replays_trace():
+    """The simulator reports refusals, warm hits and losses from a failed node"""
+    nodes = [SimNode("wine-a", slots=2), SimNode("wine-b", slots=2)]
+    policy = PlacementPolicy(policy="spread", affinity_bonus=0.6, heartbeat_timeout=5, require_heartbeat=False)
+    trace = [
+        {"t": 0, "app_id": 1, "duration": 100},
+        {"t": 1, "app_id": 1, "duration": 100},
+        {"t": 2, "node": "wine-b", "event": "drain"},
+        {"t": 3, "app_id": 2, "duration": 100},
+        {"t": 4, "app_id": 2, "duration": 100},
+        {"t": 5, "node": "wine-a", "event": "fail"},
+        {"t": 6, "app_id": 3, "duration": 100},
+    ]
+
+    report = simulate(nodes, trace, policy)
+
+    assert report["arrivals"] == 5
+    # app 1 twice on wine-a (the second by affinity), which is then full while wine-b drains
+    assert report["warm_hits"] == 1
+    assert report["refused"] == 2
+    # two sessions die with wine-a, and one more lands there before the failure is noticed
+    assert report["nodes"]["wine-a"]["placed"] == 3
+    assert report["lost"] == 3
+    assert trace_from_decisions([{"at": 10.0, "app_id": 1, "chosen": "wine-a"}], 60) == [
+        {"t": 0.0, "app_id": 1, "duration": 60}
+    ]
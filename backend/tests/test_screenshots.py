@@ -0,0 +1,80 @@
+"""
+Tests for screenshot capture, thumbnails and frame diffing
+"""
+import asyncio
+import base64
+import io
+
+import httpx
+from PIL import Image
+
+from services.cache import ByteLRUCache
+from services.screenshots import ScreenshotService, decode_screenshot, make_thumbnail
+from services.wine_client import WineServiceClient
+
+
+def png(color, size=(320, 240)) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", size, color).save(out, format="PNG")
+    return out.getvalue()
+
+
+def test_decode_screenshot_accepts_binary_and_base64():
+    """Raw image bodies pass through; legacy base64 JSON bodies are decoded"""
+    image = png("red")
+    raw = httpx.Response(200, content=image, headers={"content-type": "image/png"})
+    legacy = httpx.Response(200, json={"screenshot": base64.b64encode(image).decode()})
+
+    assert decode_screenshot(raw) == (image, "image/png")
+    assert decode_screenshot(legacy) == (image, "image/png")
+
+
+def test_thumbnail_fits_requested_box():
+    thumbnail = make_thumbnail(png("blue"), 160, 160, "webp", 75)
+
+    with Image.open(io.BytesIO(thumbnail)) as image:
+        assert image.format == "WEBP"
+        assert image.size == (160, 120)
+
+
+def test_byte_lru_evicts_by_total_size():
+    cache = ByteLRUCache(max_bytes=10)
+    cache.set("a", b"12345")
+    cache.set("b", b"12345")
+    cache.get("a")
+    cache.set("c", b"123")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"12345"
+    assert cache.size_bytes == 8
+
+
+def test_unchanged_frames_give_an_empty_delta():
+    """Concurrent viewers share one capture; a repeated frame is not reported again"""
+    calls = []
+    frames = {":100": png("red"), ":101": png("green")}
+
+    async def handler(request):
+        calls.append(request.url.params["display"])
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, content=frames[request.url.params["display"]], headers={"content-type": "image/png"})
+
+    async def run():
+        client = WineServiceClient(base_url="http://wine.test", transport=httpx.MockTransport(handler))
+        service = ScreenshotService(min_interval=0, client=client)
+        targets = {"s1": {"display": ":100"}, "s2": {"display": ":101"}}
+        try:
+            first, second = await asyncio.gather(service.capture("s1", targets["s1"]), service.capture("s1", targets["s1"]))
+            assert first is second
+            assert calls == [":100"]
+
+            changed, errors = await service.changes({"s1": first.hash, "s2": None}, targets)
+            assert list(changed) == ["s2"] and not errors
+
+            changed, _ = await service.changes({"s1": first.hash, "s2": changed["s2"].hash}, targets)
+            assert changed == {}
+            assert service.stats["unchanged"] == 3
+        finally:
+            await client.close()
+
+    asyncio.run(run())
@@ -0,0 +1,100 @@
+"""
+Tests for the background session reaper
+"""
+import asyncio
+from types import SimpleNamespace
+
+from services import session_reaper as session_reaper_module
+from services.session_reaper import SessionReaper
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class FakeDatabase:
+    """Hands out up to ``batch`` of the remaining expired rows per UPDATE"""
+
+    def __init__(self, expired, batch):
+        self.expired = list(expired)
+        self.batch = batch
+        self.statements = 0
+        self.commits = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement):
+        self.statements += 1
+        rows, self.expired = self.expired[:self.batch], self.expired[self.batch:]
+        return FakeResult(rows)
+
+    async def commit(self):
+        self.commits += 1
+
+
+def make_reaper(monkeypatch, expired, batch_size, max_batches):
+    db = FakeDatabase([SimpleNamespace(session_id=f"s{i}", session_metadata={}) for i in range(expired)], batch_size)
+    monkeypatch.setattr(session_reaper_module, "async_session", lambda: db)
+    reaper = SessionReaper(interval=1, batch_size=batch_size, max_batches=max_batches)
+
+    async def count_active():
+        return 0
+
+    monkeypatch.setattr(reaper, "count_active", count_active)
+    return reaper, db
+
+
+def test_reaps_in_batches_up_to_the_cycle_limit(monkeypatch):
+    """Full batches continue the cycle until max_batches; the rest wait for the next cycle"""
+    reaper, db = make_reaper(monkeypatch, expired=7, batch_size=2, max_batches=3)
+    batches = []
+
+    async def hook(rows):
+        batches.append([row.session_id for row in rows])
+
+    reaper.add_hook(hook)
+
+    first = asyncio.run(reaper.reap_once())
+
+    assert first == 6
+    assert batches == [["s0", "s1"], ["s2", "s3"], ["s4", "s5"]]
+    assert db.statements == db.commits == 3
+
+    second = asyncio.run(reaper.reap_once())
+
+    # A short batch ends the cycle without another query
+    assert second == 1
+    assert batches[-1] == ["s6"]
+    assert db.statements == 4
+    assert reaper.stats["cycles"] == 2
+    assert reaper.stats["total_reaped"] == 7
+    assert reaper.stats["last_reaped"] == 1
+
+
+def test_failing_hook_does_not_stop_the_others(monkeypatch):
+    """Each hook sees every batch even when an earlier hook raises"""
+    reaper, db = make_reaper(monkeypatch, expired=3, batch_size=2, max_batches=5)
+    seen = []
+
+    async def broken(rows):
+        raise RuntimeError("teardown failed")
+
+    async def release(rows):
+        seen.extend(row.session_id for row in rows)
+
+    reaper.add_hook(broken)
+    reaper.add_hook(release)
+
+    reaped = asyncio.run(reaper.reap_once())
+
+    assert reaped == 3
+    assert seen == ["s0", "s1", "s2"]
+    assert reaper.stats["errors"] == 0
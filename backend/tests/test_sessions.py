@@ -0,0 +1,71 @@
+"""
+Tests for the session history export
+"""
+import csv
+import io
+import json
+from contextlib import asynccontextmanager
+from datetime import datetime
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+from routes import sessions as sessions_routes
+
+METADATA = {"display": ":101", "note": 'says "hi", then\nleaves'}
+
+
+def fake_session(index, metadata):
+    return SimpleNamespace(
+        id=index, session_id=f"s{index}", application_id=7, user_id="alice", vnc_port=5900 + index,
+        status="expired", session_metadata=metadata, created_at=datetime(2024, 1, 1, 12, index), expires_at=None,
+    )
+
+
+def fake_export_rows(monkeypatch, batches):
+    class Result:
+        async def partitions(self):
+            for batch in batches:
+                yield batch
+
+    class Database:
+        async def stream_scalars(self, query):
+            return Result()
+
+    @asynccontextmanager
+    async def read_session(**kwargs):
+        yield Database()
+
+    monkeypatch.setattr(sessions_routes, "read_session", read_session)
+
+
+def test_csv_export_quotes_metadata(monkeypatch):
+    """Metadata is one JSON cell that survives commas, quotes and newlines"""
+    fake_export_rows(monkeypatch, [[fake_session(1, METADATA)], [fake_session(2, None)]])
+    from main import app
+
+    response = TestClient(app).get("/api/sessions/export", params={"format": "csv"})
+
+    assert response.status_code == 200
+    header, first, second = list(csv.reader(io.StringIO(response.text)))
+    assert header == list(sessions_routes.SessionResponse.model_fields)
+    row = dict(zip(header, first))
+    assert json.loads(row["metadata"]) == METADATA
+    assert row["session_id"] == "s1"
+    assert dict(zip(header, second))["metadata"] == ""
+
+
+def test_export_headers(monkeypatch):
+    """Each format has its media type and downloads as an attachment"""
+    fake_export_rows(monkeypatch, [[fake_session(1, METADATA)]])
+    from main import app
+
+    client = TestClient(app)
+    ndjson = client.get("/api/sessions/export")
+    csv_response = client.get("/api/sessions/export", params={"format": "csv"})
+
+    assert ndjson.headers["content-type"].startswith("application/x-ndjson")
+    assert ndjson.headers["content-disposition"] == 'attachment; filename="sessions.ndjson"'
+    assert json.loads(ndjson.text.splitlines()[0])["metadata"] == METADATA
+    assert csv_response.headers["content-type"].startswith("text/csv")
+    assert csv_response.headers["content-disposition"] == 'attachment; filename="sessions.csv"'
@@ -0,0 +1,76 @@
+"""
+Tests for the display/VNC slot allocator
+"""
+import asyncio
+
+from services import slot_sweeper as slot_sweeper_module
+from services.slot_sweeper import SlotSweeper
+from services.slots import SlotAllocator
+
+
+def test_slots_are_unique_until_released():
+    """Every session gets its own display/port until a slot is released"""
+    allocator = SlotAllocator(backend="memory", containers=["wine-a", "wine-b"], per_container=2)
+
+    async def go():
+        slots = [await allocator.allocate(f"session-{i}") for i in range(4)]
+        exhausted = await allocator.allocate("session-4")
+        released = await allocator.release(slots[0].index, "session-0")
+        released_twice = await allocator.release(slots[0].index, "session-0")
+        reused = await allocator.allocate("session-5")
+        return slots, exhausted, released, released_twice, reused
+
+    slots, exhausted, released, released_twice, reused = asyncio.run(go())
+
+    assert len({(s.container, s.display) for s in slots}) == 4
+    assert len({s.vnc_port for s in slots}) == 4
+    assert {s.container for s in slots} == {"wine-a", "wine-b"}
+    assert exhausted is None
+    assert released and not released_twice
+    assert reused == slots[0]
+
+
+def test_release_checks_the_holder():
+    """A stale release cannot free a slot that went to another holder"""
+    allocator = SlotAllocator(backend="memory", containers=["wine-a"], per_container=1)
+
+    async def go():
+        slot = await allocator.allocate("warm:7@api-1")
+        handed_over = await allocator.reassign(slot.index, "warm:7@api-1", "session-1")
+        stale = await allocator.release(slot.index, "warm:7@api-1")
+        holders = await allocator.holders()
+        released = await allocator.release(slot.index, "session-1")
+        return slot, handed_over, stale, holders, released
+
+    slot, handed_over, stale, holders, released = asyncio.run(go())
+
+    assert handed_over
+    assert not stale
+    assert holders == {slot.index: "session-1"}
+    assert released
+
+
+def test_sweeper_releases_orphaned_leases_after_two_sweeps(monkeypatch):
+    """Leases of missing sessions and dead warm environments are reclaimed; live ones stay"""
+    allocator = SlotAllocator(backend="memory", containers=["wine-a"], per_container=4)
+    sweeper = SlotSweeper(interval=60, allocator=allocator)
+    monkeypatch.setattr(slot_sweeper_module.settings, "SLOT_OWNER_ID", "api-1")
+    monkeypatch.setattr(slot_sweeper_module.warm_pool, "leased_slots", lambda: {1})
+
+    async def active_sessions(session_ids):
+        return {"live"} & set(session_ids)
+
+    monkeypatch.setattr(sweeper, "_active_sessions", active_sessions)
+
+    async def go():
+        for holder in ("live", "warm:7@api-1", "crashed", "warm:8@api-1"):
+            await allocator.allocate(holder)
+        first = await sweeper.sweep_once()
+        second = await sweeper.sweep_once()
+        return first, second, await allocator.holders()
+
+    first, second, holders = asyncio.run(go())
+
+    assert first == 0
+    assert second == 2
+    assert holders == {0: "live", 1: "warm:7@api-1"}
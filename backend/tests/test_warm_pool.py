@@ -0,0 +1,159 @@
+"""
+Tests for the warm pool of Wine environments
+"""
+import asyncio
+from types import SimpleNamespace
+
+from services import warm_pool as warm_pool_module
+from services import wine_processes
+from services.scheduler import NodeScheduler
+from services.slots import SlotAllocator
+from services.warm_pool import WarmPool
+
+
+def test_refill_and_claim(monkeypatch):
+    """Refill prepares environments on free slots and claims hand them out"""
+    prepared = []
+
+    async def fake_prepare(container, vnc_port, env, resolution=None):
+        prepared.append((container, env["DISPLAY"], env["WINEPREFIX"]))
+
+    monkeypatch.setattr(warm_pool_module, "prepare_environment", fake_prepare)
+    allocator = SlotAllocator(backend="memory", containers=["wine-a"], per_container=4)
+    monkeypatch.setattr(warm_pool_module, "slot_allocator", allocator)
+    monkeypatch.setattr(warm_pool_module, "node_scheduler", NodeScheduler(backend="memory", allocator=allocator))
+    monkeypatch.setattr(warm_pool_module.settings, "WARM_POOL_MIN_FREE_SLOTS", 1)
+    pool = WarmPool(size=2)
+    pool._configs = {7: {"WINEARCH": "win32"}}
+
+    async def go():
+        await pool.refill()
+        return pool.claim(7), pool.claim(7), pool.claim(7)
+
+    first, second, third = asyncio.run(go())
+
+    assert len(prepared) == 2
+    assert first.slot != second.slot
+    assert first.env["WINEARCH"] == "win32"
+    assert first.to_metadata()["wine_prefix"].endswith(f"app7-slot{first.slot.index}")
+    assert third is None
+    assert pool.stats == {"claims": 2, "misses": 1, "prepared": 2, "prepare_failures": 0, "retired": 0}
+
+
+def test_teardown_stops_the_daemons_prepare_started(monkeypatch):
+    """Teardown kills the prefix's wineserver and the display's daemons by their recorded pids"""
+    commands = []
+
+    async def fake_exec(container, argv, env=None, workdir=None, detach=False):
+        commands.append(argv)
+        return 0
+
+    monkeypatch.setattr(wine_processes, "container_exec", fake_exec)
+    env = {"DISPLAY": ":101", "WINEPREFIX": "/prefixes/app7-slot1"}
+    metadata = {"container": "wine-a", "display": ":101", "wine_prefix": "/prefixes/app7-slot1"}
+
+    async def go():
+        await wine_processes.prepare_environment("wine-a", 5901, env)
+        started = list(commands)
+        commands.clear()
+        await wine_processes.teardown_session("s1", metadata)
+        return started
+
+    started = asyncio.run(go())
+
+    daemons = [argv for argv in started if argv[:3] == ["sh", "-c", wine_processes.DAEMON_WRAPPER]]
+    pid_files = {argv[3] for argv in daemons}
+    assert [argv[4] for argv in daemons] == ["Xvfb", "fluxbox", "x11vnc"]
+    assert commands[0] == ["wineserver", "-k"]
+    assert commands[1][:3] == ["sh", "-c", wine_processes.STOP_DAEMONS_SCRIPT]
+    assert set(commands[1][4:]) == pid_files == {"/tmp/Xvfb-101.pid", "/tmp/fluxbox-101.pid", "/tmp/x11vnc-101.pid"}
+
+
+def test_refresh_retires_environments_of_removed_or_changed_apps(monkeypatch):
+    """Idle environments are torn down and released when their app leaves the list or its config changes"""
+    prepared, torn_down = [], []
+    rows = [SimpleNamespace(id=7, wine_config={"WINEARCH": "win32"}), SimpleNamespace(id=8, wine_config={})]
+
+    async def fake_prepare(container, vnc_port, env, resolution=None):
+        prepared.append(env["DISPLAY"])
+
+    async def fake_teardown(session_id, metadata):
+        torn_down.append(session_id)
+
+    class FakeDatabase:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def execute(self, query):
+            return list(rows)
+
+    monkeypatch.setattr(warm_pool_module, "prepare_environment", fake_prepare)
+    monkeypatch.setattr(warm_pool_module, "teardown_session", fake_teardown)
+    monkeypatch.setattr(warm_pool_module, "async_session", FakeDatabase)
+    allocator = SlotAllocator(backend="memory", containers=["wine-a"], per_container=8)
+    monkeypatch.setattr(warm_pool_module, "slot_allocator", allocator)
+    monkeypatch.setattr(warm_pool_module, "node_scheduler", NodeScheduler(backend="memory", allocator=allocator))
+    monkeypatch.setattr(warm_pool_module.settings, "WARM_POOL_MIN_FREE_SLOTS", 0)
+    pool = WarmPool(size=1)
+
+    async def go():
+        await pool.load_applications()
+        await pool.refill()
+        leased = (await allocator.stats())["leased"]
+        # App 8 is deactivated and app 7's config changes
+        rows[:] = [SimpleNamespace(id=7, wine_config={"WINEARCH": "win64"})]
+        await pool.load_applications()
+        after = (await allocator.stats())["leased"]
+        await pool.refill()
+        return leased, after
+
+    leased, after = asyncio.run(go())
+
+    assert leased == 2
+    assert sorted(torn_down) == ["warm:7", "warm:8"]
+    assert after == 0
+    assert 8 not in pool._ready
+    assert pool._ready[7][0].env["WINEARCH"] == "win64"
+    assert pool.stats["retired"] == 2
+    assert len(prepared) == 3
+
+
+def test_drain_broadcast_evicts_on_every_replica(monkeypatch):
+    """A drain on one replica reaches the warm environments another replica holds on the node"""
+    torn_down = []
+
+    async def fake_prepare(container, vnc_port, env, resolution=None):
+        pass
+
+    async def fake_teardown(session_id, metadata):
+        torn_down.append(metadata["container"])
+
+    monkeypatch.setattr(warm_pool_module, "prepare_environment", fake_prepare)
+    monkeypatch.setattr(warm_pool_module, "teardown_session", fake_teardown)
+    allocator = SlotAllocator(backend="memory", containers=["wine-a", "wine-b"], per_container=2)
+    monkeypatch.setattr(warm_pool_module, "slot_allocator", allocator)
+    monkeypatch.setattr(warm_pool_module, "node_scheduler", NodeScheduler(backend="memory", allocator=allocator))
+    monkeypatch.setattr(warm_pool_module.settings, "WARM_POOL_MIN_FREE_SLOTS", 0)
+    here, other = WarmPool(size=1), WarmPool(size=1)
+
+    async def go():
+        other._configs = {7: {}}
+        await other.refill()
+        node = other._ready[7][0].slot.container
+        other._listener = asyncio.create_task(other._listen())
+        await asyncio.sleep(0)
+        try:
+            evicted_here = await here.node_drained(node)
+            await asyncio.sleep(0.01)
+        finally:
+            await other.stop()
+        return node, evicted_here
+
+    node, evicted_here = asyncio.run(go())
+
+    assert evicted_here == 0
+    assert torn_down == [node]
+    assert not other._ready[7]
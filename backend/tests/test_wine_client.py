@@ -0,0 +1,76 @@
+"""
+Tests for the pooled Wine service client
+"""
+import asyncio
+
+import httpx
+from prometheus_client import REGISTRY
+
+from services.wine_client import WineServiceClient
+
+
+def run_client(handler, method, path):
+    client = WineServiceClient(base_url="http://wine.test", transport=httpx.MockTransport(handler))
+    client.backoff = lambda attempt: 0
+
+    async def go():
+        try:
+            response = await client.request(method, path)
+            return response, client.pool_stats()
+        finally:
+            await client.close()
+
+    return asyncio.run(go())
+
+
+def test_idempotent_request_is_retried():
+    """GET requests are retried on 503 until they succeed"""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503 if len(calls) < 2 else 200, json={"ok": True})
+
+    response, stats = run_client(handler, "GET", "/api/screenshot")
+
+    assert response.status_code == 200
+    assert len(calls) == 2
+    assert stats["retries"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_non_idempotent_request_is_not_retried():
+    """POST requests surface the first failure"""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503)
+
+    response, stats = run_client(handler, "POST", "/api/execute")
+
+    assert response.status_code == 503
+    assert len(calls) == 1
+    assert stats["retries"] == 0
+
+
+def test_latency_is_labelled_with_the_route_template():
+    """Per-execution paths are recorded under their template, so each id adds no new series"""
+    client = WineServiceClient(base_url="http://wine.test", transport=httpx.MockTransport(lambda request: httpx.Response(204)))
+
+    async def go():
+        try:
+            for execution_id in ("a1", "b2"):
+                await client.request("DELETE", f"/api/execute/{execution_id}", retry=False, route="/api/execute/{id}")
+        finally:
+            await client.close()
+
+    asyncio.run(go())
+
+    def count(path):
+        return REGISTRY.get_sample_value(
+            "wine_service_request_duration_seconds_count", {"method": "DELETE", "path": path, "status": "204"}
+        )
+
+    assert count("/api/execute/{id}") == 2
+    assert count("/api/execute/a1") is None
@@ -0,0 +1,164 @@
+"""
+Tests for the low-code workflow engine
+"""
+import asyncio
+import socket
+from types import SimpleNamespace
+
+import httpcore
+import httpx
+import pytest
+
+from services import workflows
+from services.workflows import (
+    BlockedURLError,
+    WorkflowPlanCache,
+    WorkflowRun,
+    WorkflowValidationError,
+    build_graph,
+    check_api_url,
+    compile_plan,
+)
+
+
+def test_build_graph_orders_nodes_and_rejects_cycles():
+    """Nodes come out in dependency order and cycles are reported"""
+    components = [{"id": i, "type": "input"} for i in (1, 2, 3)]
+    graph = build_graph(components, [{"source": 3, "target": 1}, {"source": 1, "target": 2}])
+    assert graph.order == ["3", "1", "2"]
+
+    with pytest.raises(WorkflowValidationError, match="cycle"):
+        build_graph(components, [{"source": 1, "target": 2}, {"source": 2, "target": 1}])
+    with pytest.raises(WorkflowValidationError, match="unsupported type"):
+        build_graph([{"id": 1, "type": "teleport"}], [])
+
+
+def test_run_executes_branches_concurrently(monkeypatch):
+    """Independent branches overlap, the untaken branch is skipped and outputs flow downstream"""
+    peak = {"running": 0, "max": 0}
+
+    async def sleepy(config, run):
+        peak["running"] += 1
+        peak["max"] = max(peak["max"], peak["running"])
+        await asyncio.sleep(config.get("seconds", 0.01))
+        peak["running"] -= 1
+        return {"value": config.get("value")}
+
+    monkeypatch.setitem(workflows.NODE_HANDLERS, "sleep", sleepy)
+    components = [
+        {"id": "a", "type": "sleep", "config": {"value": 1}},
+        {"id": "b", "type": "sleep", "config": {"value": 2}},
+        {"id": "check", "type": "conditional", "config": {"left": "{{a.value}}", "operator": "eq", "right": 1}},
+        {"id": "yes", "type": "sleep", "config": {"value": "b was {{b.value}}"}},
+        {"id": "no", "type": "sleep"},
+        {"id": "slow", "type": "sleep", "config": {"seconds": 1, "timeout": 0.05}},
+    ]
+    connections = [
+        {"source": "a", "target": "check"},
+        {"source": "b", "target": "yes"},
+        {"source": "check", "target": "yes", "branch": "true"},
+        {"source": "check", "target": "no", "branch": "false"},
+    ]
+
+    result = asyncio.run(WorkflowRun(compile_plan(components, connections)).execute())
+    nodes = result["nodes"]
+
+    assert peak["max"] >= 2
+    assert nodes["yes"]["output"] == {"value": "b was 2"}
+    assert nodes["no"]["status"] == "skipped"
+    assert nodes["slow"]["status"] == "timed_out"
+    assert result["status"] == "failed"
+
+
+def test_cancel_stops_running_nodes(monkeypatch):
+    """Cancelling a run cancels its in-flight nodes"""
+
+    async def forever(config, run):
+        await asyncio.sleep(60)
+
+    monkeypatch.setitem(workflows.NODE_HANDLERS, "forever", forever)
+
+    async def go():
+        run = WorkflowRun(compile_plan([{"id": 1, "type": "forever"}], []))
+        task = run.start()
+        await asyncio.sleep(0.01)
+        assert run.cancel()
+        return await task
+
+    result = asyncio.run(go())
+    assert result["status"] == "cancelled"
+    assert result["nodes"]["1"]["status"] == "cancelled"
+
+
+def test_plan_cache_ignores_layout_and_shares_plans():
+    """Moving a node on the canvas reuses the compiled plan; editing its config does not"""
+    cache = WorkflowPlanCache(max_size=1)
+    components = [{"id": 1, "type": "input", "config": {"x": 1}, "position": {"x": 0, "y": 0}}]
+
+    plan = cache.get_or_compile(components, [])
+    moved = [{**components[0], "position": {"x": 50, "y": 10}}]
+    assert cache.get_or_compile(moved, []) is plan
+    assert not plan.nodes[0].templated
+
+    edited = [{**components[0], "config": {"x": "{{inputs.x}}"}}]
+    assert cache.get_or_compile(edited, []).nodes[0].templated
+    assert cache.snapshot() == {
+        "hits": 1, "misses": 2, "compile_ms": cache.snapshot()["compile_ms"],
+        "hit_ratio": round(1 / 3, 4), "size": 1, "max_size": 1,
+    }
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1:8000/health",
+    "http://169.254.169.254/metadata/instance",
+    "http://10.0.0.5/",
+    "http://[::ffff:127.0.0.1]/",
+    "http://localhost/",
+])
+def test_api_call_rejects_internal_addresses(url):
+    """api_call nodes cannot reach loopback, metadata or private addresses"""
+    with pytest.raises(BlockedURLError):
+        asyncio.run(check_api_url(url))
+
+
+def test_api_call_host_allowlist(monkeypatch):
+    """With an allowlist only listed hosts (and *.domain matches) are reachable"""
+    monkeypatch.setattr(workflows.settings, "WORKFLOW_API_ALLOWED_HOSTS", "8.8.8.8,*.example.com")
+    monkeypatch.setattr(workflows.settings, "WORKFLOW_API_ALLOW_PRIVATE_NETWORKS", True)
+
+    asyncio.run(check_api_url("https://8.8.8.8/dns"))
+    asyncio.run(check_api_url("https://api.example.com/v1"))
+    with pytest.raises(BlockedURLError, match="not in WORKFLOW_API_ALLOWED_HOSTS"):
+        asyncio.run(check_api_url("https://example.org/"))
+    with pytest.raises(ValueError, match="http"):
+        asyncio.run(check_api_url("file:///etc/passwd"))
+
+
+def test_api_call_connects_only_to_the_checked_address(monkeypatch):
+    """A host that rebinds to an internal address after the check is refused at connect time"""
+    answers = iter(["93.184.216.34", "169.254.169.254"])
+    connected = []
+
+    async def getaddrinfo(self, host, port, **kwargs):
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (next(answers), port))]
+
+    class RecordingBackend(httpcore.AsyncMockBackend):
+        async def connect_tcp(self, host, port, **kwargs):
+            connected.append(host)
+            return await super().connect_tcp(host, port, **kwargs)
+
+    monkeypatch.setattr(asyncio.BaseEventLoop, "getaddrinfo", getaddrinfo)
+    backend = RecordingBackend([b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"])
+
+    async def go():
+        async with httpx.AsyncClient(transport=workflows.api_call_transport(backend)) as http:
+            return await workflows.run_api_call({"url": "http://rebind.test/"}, SimpleNamespace(http=http))
+
+    with pytest.raises(BlockedURLError, match="169.254.169.254"):
+        asyncio.run(go())
+    assert connected == []
+
+    # A stable public answer connects to exactly that address
+    answers = iter(["93.184.216.34", "93.184.216.34"])
+    assert asyncio.run(go())["body"] == "ok"
+    assert connected == ["93.184.216.34"]
@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 """
 Register Counter-Strike 1.6 application in the Wine Emulator Platform database
+
+A single-entry use of the catalog loader; for many titles put them in a
+manifest and run ``python -m services.catalog manifest.yaml`` from backend/.
+The schema must already exist (``cd backend && alembic upgrade head``).
 """
 import asyncio
 import json
@@ -10,7 +14,8 @@ from pathlib import Path
 # Add backend to path
 sys.path.insert(0, str(Path(__file__).parent / "backend"))
 
-from database import async_session, Application, Base, engine
+from database import async_session, Application
+from services.catalog import CatalogEntry, load_catalog
 from sqlalchemy import select
 
 
@@ -19,10 +24,6 @@ async def register_cs16():
     
     print("🎮 Registering Counter-Strike 1.6...")
     
-    # Create tables if they don't exist
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    
     # Application configuration
     cs16_config = {
         "name": "Counter-Strike 1.6",
@@ -66,35 +67,19 @@ async def register_cs16():
         }
     }
     
+    report = await load_catalog([CatalogEntry(**cs16_config)])
     async with async_session() as session:
-        # Check if CS 1.6 already exists
-        result = await session.execute(
-            select(Application).where(Application.name == cs16_config["name"])
+        app_id = await session.scalar(
+            select(Application.id).where(Application.name == cs16_config["name"])
         )
-        existing = result.scalar_one_or_none()
-        
-        if existing:
-            print(f"⚠️  Application '{cs16_config['name']}' already exists (ID: {existing.id})")
-            print("🔄 Updating configuration...")
-            
-            existing.executable_path = cs16_config["executable_path"]
-            existing.description = cs16_config["description"]
-            existing.icon_url = cs16_config["icon_url"]
-            existing.wine_config = cs16_config["wine_config"]
-            existing.is_active = True
-            
-            await session.commit()
-            print(f"✅ Updated Counter-Strike 1.6 (ID: {existing.id})")
-            return existing.id
-        else:
-            # Create new application
-            app = Application(**cs16_config)
-            session.add(app)
-            await session.commit()
-            await session.refresh(app)
-            
-            print(f"✅ Registered Counter-Strike 1.6 (ID: {app.id})")
-            return app.id
+    
+    if report["inserted"]:
+        print(f"✅ Registered Counter-Strike 1.6 (ID: {app_id})")
+    elif report["updated"]:
+        print(f"🔄 Updated Counter-Strike 1.6 configuration (ID: {app_id})")
+    else:
+        print(f"⚠️  Counter-Strike 1.6 is already up to date (ID: {app_id})")
+    return app_id
 
 
 async def list_applications():